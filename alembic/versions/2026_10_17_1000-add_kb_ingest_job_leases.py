@@ -0,0 +1,40 @@
+"""add kb ingest job lease fields
+
+Revision ID: kb_ingest_leases_20261017
+Revises: identity_chat_20260614
+Create Date: 2026-10-17 10:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "kb_ingest_leases_20261017"
+down_revision: Union[str, None] = "identity_chat_20260614"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("kb_ingest_jobs", sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("kb_ingest_jobs", sa.Column("available_at", sa.DateTime(), nullable=True))
+    op.add_column("kb_ingest_jobs", sa.Column("lease_expires_at", sa.DateTime(), nullable=True))
+    op.add_column("kb_ingest_jobs", sa.Column("locked_by", sa.String(), nullable=True))
+    op.create_index("ix_kb_ingest_jobs_lease_expires_at", "kb_ingest_jobs", ["lease_expires_at"], unique=False)
+    op.create_index(
+        "ix_kb_ingest_jobs_state_available_at",
+        "kb_ingest_jobs",
+        ["state", "available_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_kb_ingest_jobs_state_available_at", table_name="kb_ingest_jobs")
+    op.drop_index("ix_kb_ingest_jobs_lease_expires_at", table_name="kb_ingest_jobs")
+    op.drop_column("kb_ingest_jobs", "locked_by")
+    op.drop_column("kb_ingest_jobs", "lease_expires_at")
+    op.drop_column("kb_ingest_jobs", "available_at")
+    op.drop_column("kb_ingest_jobs", "attempts")
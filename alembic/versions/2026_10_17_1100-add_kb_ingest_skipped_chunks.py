@@ -0,0 +1,25 @@
+"""add skipped chunk count to kb ingest jobs
+
+Revision ID: kb_ingest_skipped_20261017
+Revises: kb_ingest_leases_20261017
+Create Date: 2026-10-17 11:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "kb_ingest_skipped_20261017"
+down_revision: Union[str, None] = "kb_ingest_leases_20261017"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("kb_ingest_jobs", sa.Column("skipped_chunks", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("kb_ingest_jobs", "skipped_chunks")
@@ -0,0 +1,29 @@
+"""add answer cache flag to widget deployments
+
+Revision ID: widget_answer_cache_20261017
+Revises: kb_ingest_skipped_20261017
+Create Date: 2026-10-17 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "widget_answer_cache_20261017"
+down_revision: Union[str, None] = "kb_ingest_skipped_20261017"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "widget_deployments",
+        sa.Column("answer_cache_enabled", sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+    op.alter_column("widget_deployments", "answer_cache_enabled", server_default=None)
+
+
+def downgrade() -> None:
+    op.drop_column("widget_deployments", "answer_cache_enabled")
@@ -1,5 +1,6 @@
 from fastapi import UploadFile, File, Form, Query
 import logging
+import anyio
 from db import models
 from services.ai_prompt_builder import default_system_prompt
 from db import schemas
@@ -10,12 +11,15 @@ from typing import Optional
 from pydantic import BaseModel
 from utils.jwt import get_current_user
 from uuid import UUID
+from services.rag_service import validate_embedding_model
+from services.semantic_cache import abump_namespace_version
 from services.vector_store import delete_namespace
 from services.image_upload import ImageUploadError, upload_avatar_image
 from services.kb_source_storage import delete_kb_source
 from services.kb_limits import PayloadTooLargeError, read_upload_limited
 from services.redis_client import cache_key, redis_delete
-from services.chat_runtime import invalidate_agent_runtime
+from api.agents.knowledge_base import queue_agent_retrain
+from services.chat_runtime import invalidate_agent_deployment_runtime, invalidate_agent_runtime, invalidate_deployment_runtime
 import os
 
 router = APIRouter()
@@ -95,6 +99,7 @@ async def update_agent_avatar(
     if deployment:
         deployment.logo_url = result.url
         redis_delete(cache_key("widget", "config", deployment.deployment_id))
+        invalidate_deployment_runtime(deployment.deployment_id)
     db.commit()
     db.refresh(agent)
     invalidate_agent_runtime(str(agent.id), agent.user_id)
@@ -129,6 +134,7 @@ def update_agent(agent_id: UUID, update: schemas.AgentCreate, db: Session = Depe
     db.commit()
     db.refresh(agent)
     invalidate_agent_runtime(str(agent.id), agent.user_id)
+    invalidate_agent_deployment_runtime(db, agent.id)
     return agent
 
 @router.delete("/{agent_id}")
@@ -156,14 +162,24 @@ async def delete_agent(agent_id: UUID, db: Session = Depends(get_db), user = Dep
     if cfg and cfg.vector_store_namespace:
         try:
             delete_namespace(cfg.vector_store_namespace)
+            await abump_namespace_version(cfg.vector_store_namespace)
         except Exception:
             logger.exception("failed_to_delete_agent_vectors agent_id=%s", agent_id)
 
     for kb in kbs:
         await delete_kb_source(kb.source_storage_key)
     
+    deployment_id = (
+        db.query(models.WidgetDeployment.deployment_id).filter(models.WidgetDeployment.agent_id == agent.id).scalar()
+    )
+    agent_key, owner_id = str(agent.id), agent.user_id
     db.delete(agent)
     db.commit()
+    # After the commit, so a concurrent request cannot re-cache the deleted agent.
+    invalidate_agent_runtime(agent_key, owner_id)
+    if deployment_id:
+        redis_delete(cache_key("widget", "config", deployment_id))
+        invalidate_deployment_runtime(deployment_id)
     return {"message": "Agent and all associated data deleted successfully"}
 
 
@@ -201,10 +217,27 @@ def update_agent_config(agent_id: UUID, update: AgentConfigUpdate, db: Session =
         db.add(cfg)
         db.commit()
         db.refresh(cfg)
+    changes = update.model_dump(exclude_unset=True)
+    if "embedding_model" in changes:
+        try:
+            validate_embedding_model(changes["embedding_model"])
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+    model_changed = "embedding_model" in changes and changes["embedding_model"] != cfg.embedding_model
     # Apply partial updates
-    for field, value in update.model_dump(exclude_unset=True).items():
+    for field, value in changes.items():
         setattr(cfg, field, value)
     db.commit()
     db.refresh(cfg)
     invalidate_agent_runtime(str(agent.id), agent.user_id)
+    invalidate_agent_deployment_runtime(db, agent.id)
+    if model_changed and cfg.vector_store_namespace:
+        # Stored vectors belong to the old model until the KBs are retrained;
+        # cached contexts and query embeddings must not be reused across models.
+        anyio.from_thread.run(abump_namespace_version, cfg.vector_store_namespace)
+    if model_changed:
+        # Chunk ids include the model, so the re-ingest embeds every chunk again.
+        jobs = anyio.from_thread.run(queue_agent_retrain, db, agent, user.id)
+        db.refresh(cfg)
+        return schemas.AgentConfigOut.model_validate(cfg).model_copy(update={"retraining_kb_count": len(jobs)})
     return cfg
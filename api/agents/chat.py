@@ -1,4 +1,3 @@
-import json
 import logging
 import os
 import time
@@ -15,7 +14,8 @@ from api.auth.auth import get_db
 from db import models
 from db.database import BackgroundSession
 from services.chat_runtime import get_agent_runtime
-from services.rag_service import build_messages, aretrieve_context, astream_answer
+from services.rag_service import abuild_messages, aretrieve_context, astream_answer
+from services.sse import SSE_HEADERS, coalesce_tokens, sse_event, sse_token
 from utils.jwt import get_current_user
 from utils.rate_limit import create_limiter
 
@@ -30,10 +30,6 @@ class ChatRequest(BaseModel):
     unique_id: Optional[str] = None
 
 
-def _sse(event: str, data: dict) -> str:
-    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
-
-
 @router.post("/{agent_id}")
 @limiter.limit("30/minute")
 async def chat_with_agent(
@@ -63,6 +59,7 @@ async def chat_with_agent(
                 runtime.id,
                 chat.message,
                 top_k=min(runtime.retrieval_top_k, CHAT_RETRIEVAL_TOP_K_CAP),
+                embedding_model=runtime.embedding_model,
             )
         except Exception:
             logger.exception("chat_retrieval_failed agent_id=%s user_id=%s", runtime.id, user.id)
@@ -70,19 +67,19 @@ async def chat_with_agent(
             retrieval_ms = (time.perf_counter() - retrieval_started) * 1000
 
     unique_id = chat.unique_id or str(uuid.uuid4())
-    messages = build_messages(runtime.instructions, context, chat.message)
+    messages = await abuild_messages(runtime.instructions, context, chat.message, model=runtime.model)
 
     async def generate():
         answer_parts: list[str] = []
         stream_started = time.perf_counter()
         first_token_ms = None
-        yield _sse("meta", {"unique_id": unique_id})
+        yield sse_event("meta", {"unique_id": unique_id})
         try:
-            async for token in astream_answer(runtime.model, messages):
+            async for token in coalesce_tokens(astream_answer(runtime.model, messages)):
                 if first_token_ms is None:
                     first_token_ms = (time.perf_counter() - stream_started) * 1000
                 answer_parts.append(token)
-                yield _sse("token", {"content": token})
+                yield sse_token(token)
 
             answer = "".join(answer_parts)
             background_tasks.add_task(
@@ -100,15 +97,15 @@ async def chat_with_agent(
                 first_token_ms or 0.0,
                 (time.perf_counter() - started) * 1000,
             )
-            yield _sse("done", {"unique_id": unique_id})
+            yield sse_event("done", {"unique_id": unique_id})
         except Exception:
             logger.exception("chat_generation_failed agent_id=%s user_id=%s unique_id=%s", agent_id, user.id, unique_id)
-            yield _sse("error", {"detail": "Sorry, I could not answer that right now."})
+            yield sse_event("error", {"detail": "Sorry, I could not answer that right now."})
 
     return StreamingResponse(
         generate(),
         media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        headers=SSE_HEADERS,
         background=background_tasks,
     )
 
@@ -9,10 +9,12 @@ from utils.jwt import get_current_user
 import anyio
 import logging
 import uuid as uuid_lib
-from services.ingest_queue import enqueue_kb_ingest
+from services.ingest_queue import enqueue_kb_ingest, ingest_queue_stats
+from services.ingest_scheduler import BULK_LANE
 from services.kb_limits import PayloadTooLargeError, enforce_text_limit, read_upload_limited
 from services.kb_source_storage import delete_kb_source, store_kb_source
 from services.image_upload import ImageUploadError
+from services.semantic_cache import abump_namespace_version
 from services.vector_store import delete_for_kb
 from services.file_parser import extract_text_from_file
 
@@ -150,36 +152,31 @@ async def add_knowledge_base(
     db.commit()
 
     queue_text = extracted_text if source_type != schemas.KBSourceType.url else None
-    if not enqueue_kb_ingest(str(job.id), queue_text):
+    if not enqueue_kb_ingest(str(job.id), queue_text, user_id=user.id):
         raise HTTPException(status_code=503, detail="Knowledge ingestion queue is full. Please try again shortly.")
 
     return kb
 
 
-@router.post("/agent/{agent_id}/retrain", response_model=List[schemas.KBIngestJobOut])
-async def retrain_agent_knowledge(agent_id: str, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    if not validate_uuid(agent_id):
-        raise HTTPException(status_code=400, detail="Invalid agent ID format")
-    agent = db.query(models.Agent).filter(models.Agent.id == agent_id, models.Agent.user_id == user.id).first()
-    if not agent:
-        raise HTTPException(status_code=404, detail="Agent not found")
-
+async def queue_agent_retrain(db: Session, agent: models.Agent, user_id: int) -> list[models.KBIngestJob]:
+    """Queue a bulk-lane re-ingest of every KB of the agent and return the jobs."""
     kbs = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.agent_id == agent.id).all()
     if not kbs:
         return []
 
+    # Retrainable KBs keep their vectors until the worker swaps them in; only
+    # sources that can no longer be re-read are cleared here.
     cfg = db.query(models.AgentConfig).filter(models.AgentConfig.agent_id == agent.id).first()
-    if cfg and cfg.vector_store_namespace:
-        for kb in kbs:
-            try:
-                await anyio.to_thread.run_sync(delete_for_kb, cfg.vector_store_namespace, str(kb.id))
-            except Exception:
-                logger.exception("failed_to_delete_kb_vectors_before_retrain kb_id=%s", kb.id)
-
     jobs: list[models.KBIngestJob] = []
     for kb in kbs:
         if kb.source_type != models.KBSourceType.url and not kb.source_storage_url:
             kb.status = models.KBStatus.failed
+            if cfg and cfg.vector_store_namespace:
+                try:
+                    await anyio.to_thread.run_sync(delete_for_kb, cfg.vector_store_namespace, str(kb.id))
+                    await abump_namespace_version(cfg.vector_store_namespace)
+                except Exception:
+                    logger.exception("failed_to_delete_kb_vectors_before_retrain kb_id=%s", kb.id)
             continue
         kb.status = models.KBStatus.pending
         kb.updated_at = datetime.now(timezone.utc)
@@ -189,11 +186,30 @@ async def retrain_agent_knowledge(agent_id: str, db: Session = Depends(get_db),
     db.commit()
     for job in jobs:
         db.refresh(job)
-        if not enqueue_kb_ingest(str(job.id), None):
+        if not enqueue_kb_ingest(str(job.id), None, user_id=user_id, lane=BULK_LANE):
             raise HTTPException(status_code=503, detail="Knowledge ingestion queue is full. Please try again shortly.")
     return jobs
 
 
+@router.post("/agent/{agent_id}/retrain", response_model=List[schemas.KBIngestJobOut])
+async def retrain_agent_knowledge(agent_id: str, db: Session = Depends(get_db), user = Depends(get_current_user)):
+    if not validate_uuid(agent_id):
+        raise HTTPException(status_code=400, detail="Invalid agent ID format")
+    agent = db.query(models.Agent).filter(models.Agent.id == agent_id, models.Agent.user_id == user.id).first()
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    return await queue_agent_retrain(db, agent, user.id)
+
+
+@router.get("/queue/stats")
+def get_ingest_queue_stats(user = Depends(get_current_user)):
+    """Queue depth and wait times per ingest priority lane, across all tenants."""
+    if getattr(user, "user_type", "") != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+    return ingest_queue_stats()
+
+
 @router.get("/{agent_id}", response_model=List[schemas.KnowledgeBaseOut])
 def list_kbs(
     agent_id: str,
@@ -232,6 +248,7 @@ async def delete_kb(kb_id: str, db: Session = Depends(get_db), user = Depends(ge
     if cfg and cfg.vector_store_namespace:
         try:
             delete_for_kb(cfg.vector_store_namespace, str(kb.id))
+            await abump_namespace_version(cfg.vector_store_namespace)
         except Exception:
             logger.exception("failed_to_delete_kb_vectors kb_id=%s", kb_id)
 
@@ -263,13 +280,7 @@ async def reindex_kb(kb_id: str, db: Session = Depends(get_db), user = Depends(g
     db.add(job)
     db.commit()
     db.refresh(job)
-    cfg = db.query(models.AgentConfig).filter(models.AgentConfig.agent_id == agent.id).first()
-    if cfg and cfg.vector_store_namespace:
-        try:
-            await anyio.to_thread.run_sync(delete_for_kb, cfg.vector_store_namespace, str(kb.id))
-        except Exception:
-            logger.exception("failed_to_delete_kb_vectors_before_reindex kb_id=%s", kb_id)
-    if not enqueue_kb_ingest(str(job.id), None):
+    if not enqueue_kb_ingest(str(job.id), None, user_id=user.id):
         raise HTTPException(status_code=503, detail="Knowledge ingestion queue is full. Please try again shortly.")
     return job
 
@@ -411,6 +422,7 @@ def get_kb_ingestion_status(kb_id: str, db: Session = Depends(get_db), user = De
             "error_message": latest_job.error,
             "total_chunks": latest_job.total_chunks,
             "processed_chunks": latest_job.processed_chunks,
+            "skipped_chunks": latest_job.skipped_chunks,
             "created_at": latest_job.created_at.isoformat() if latest_job.created_at else None
         }
     else:
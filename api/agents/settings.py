@@ -8,7 +8,7 @@ from typing import Optional
 from uuid import UUID
 from datetime import datetime, timezone
 from models.widget_deployment import new_deployment_id
-from services.chat_runtime import invalidate_agent_runtime
+from services.chat_runtime import invalidate_agent_runtime, invalidate_deployment_runtime
 from services.redis_client import cache_key, redis_delete
 
 router = APIRouter()
@@ -186,6 +186,7 @@ def update_agent_settings(
         deployment = db.query(models.WidgetDeployment).filter(models.WidgetDeployment.agent_id == agent.id).first()
         if deployment:
             redis_delete(cache_key("widget", "config", deployment.deployment_id))
+            invalidate_deployment_runtime(deployment.deployment_id)
         
         return {
             "success": True,
@@ -244,6 +245,7 @@ def reset_widget_settings(
         deployment = db.query(models.WidgetDeployment).filter(models.WidgetDeployment.agent_id == agent.id).first()
         if deployment:
             redis_delete(cache_key("widget", "config", deployment.deployment_id))
+            invalidate_deployment_runtime(deployment.deployment_id)
         
         return {
             "success": True,
@@ -1,5 +1,5 @@
+import asyncio
 import hashlib
-import json
 import logging
 import os
 import threading
@@ -9,10 +9,11 @@ from datetime import datetime, timezone
 from typing import Optional
 from urllib.parse import urlparse
 
+import anyio
 from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks, Response
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 
 from api.auth.auth import get_db
 from db import models
@@ -22,10 +23,13 @@ from services.redis_client import (
     cache_key,
     get_async_redis,
     redis_delete,
-    redis_get_json,
-    redis_set_json,
 )
-from services.rag_service import build_messages, aretrieve_context, astream_answer
+from services.answer_cache import aget_cached_answer, aset_cached_answer, answer_cache_id, iter_replay_tokens
+from services.rag_service import abuild_messages, aretrieve_context, astream_answer
+from services.chat_runtime import get_deployment_runtime, invalidate_deployment_runtime
+from services.semantic_cache import aget_namespace_version
+from services.singleflight import cached
+from services.sse import SSE_HEADERS, coalesce_tokens, sse_event, sse_token
 from utils.jwt import get_current_user
 from utils.widget_security import (
     generate_widget_token,
@@ -42,6 +46,7 @@ DEFAULT_ALLOWED_DOMAINS = ["localhost", "127.0.0.1"]
 RATE_LIMIT_WINDOW_SECONDS = 60
 RATE_LIMIT_MAX_REQUESTS = 30
 WIDGET_CONFIG_CACHE_TTL_SECONDS = 300
+WIDGET_CONFIG_STALE_SECONDS = 600
 FALLBACK_RATE_LIMIT_MAX_KEYS = 1000
 CHAT_RETRIEVAL_TOP_K_CAP = int(os.getenv("CHAT_RETRIEVAL_TOP_K_CAP", "3"))
 
@@ -53,6 +58,7 @@ class WidgetDeploymentUpdate(BaseModel):
     primary_color: Optional[str] = Field(None, pattern="^#[0-9A-Fa-f]{6}$")
     allowed_domains: Optional[list[str]] = None
     is_enabled: Optional[bool] = None
+    answer_cache_enabled: Optional[bool] = None
 
 
 class PublicChatRequest(BaseModel):
@@ -69,10 +75,6 @@ class TelemetryEvent(BaseModel):
     timestamp: Optional[int] = None
 
 
-def _sse(event: str, data: dict) -> str:
-    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
-
-
 def _clean_messages(messages: Optional[list[str]]) -> list[str]:
     cleaned = [(message or "").strip() for message in messages or []]
     cleaned = [message for message in cleaned if message]
@@ -226,6 +228,7 @@ def _deployment_out(deployment: models.WidgetDeployment, request: Request) -> di
         "primary_color": deployment.primary_color,
         "allowed_domains": deployment.allowed_domains or [],
         "is_enabled": deployment.is_enabled,
+        "answer_cache_enabled": deployment.answer_cache_enabled,
         "embed_script": embed_script,
     }
 
@@ -236,20 +239,16 @@ def _widget_config_cache_key(deployment_id: str) -> str:
 
 def invalidate_widget_config_cache(deployment_id: str) -> None:
     redis_delete(_widget_config_cache_key(deployment_id))
+    invalidate_deployment_runtime(deployment_id)
 
 
-def _public_widget_config_payload(db: Session, deployment_id: str) -> Optional[dict]:
-    cache_id = _widget_config_cache_key(deployment_id)
-    cached = redis_get_json(cache_id)
-    if isinstance(cached, dict):
-        return cached
-
+def _widget_config_from_db(db: Session, deployment_id: str) -> Optional[dict]:
     deployment = db.query(models.WidgetDeployment).filter(models.WidgetDeployment.deployment_id == deployment_id).first()
     if not deployment or not deployment.is_enabled:
         return None
 
     updated_at = deployment.updated_at or datetime.now(timezone.utc)
-    payload = {
+    return {
         "deployment_id": deployment.deployment_id,
         "display_name": deployment.display_name,
         "logo_url": deployment.logo_url or "",
@@ -259,8 +258,26 @@ def _public_widget_config_payload(db: Session, deployment_id: str) -> Optional[d
         "allowed_domains": deployment.allowed_domains or [],
         "etag": f'W/"{int(updated_at.timestamp())}"',
     }
-    redis_set_json(cache_id, payload, WIDGET_CONFIG_CACHE_TTL_SECONDS)
-    return payload
+
+
+def _widget_config_in_background(deployment_id: str) -> Optional[dict]:
+    db = BackgroundSession()
+    try:
+        return _widget_config_from_db(db, deployment_id)
+    finally:
+        db.close()
+
+
+def _public_widget_config_payload(db: Session, deployment_id: str) -> Optional[dict]:
+    # Concurrent misses share one query, and an expired entry keeps serving while it is refreshed.
+    payload = cached(
+        _widget_config_cache_key(deployment_id),
+        WIDGET_CONFIG_CACHE_TTL_SECONDS,
+        WIDGET_CONFIG_STALE_SECONDS,
+        lambda: _widget_config_from_db(db, deployment_id),
+        refresh=lambda: _widget_config_in_background(deployment_id),
+    )
+    return payload if isinstance(payload, dict) else None
 
 
 def _get_or_create_deployment(db: Session, agent: models.Agent) -> models.WidgetDeployment:
@@ -349,6 +366,8 @@ def update_widget_deployment(
         deployment.allowed_domains = _clean_domains(payload.allowed_domains)
     if payload.is_enabled is not None:
         deployment.is_enabled = payload.is_enabled
+    if payload.answer_cache_enabled is not None:
+        deployment.answer_cache_enabled = payload.answer_cache_enabled
     deployment.updated_at = datetime.now(timezone.utc)
     db.commit()
     db.refresh(deployment)
@@ -459,12 +478,8 @@ async def public_widget_chat(
     db: Session = Depends(get_db)
 ):
     started = time.perf_counter()
-    deployment = (
-        db.query(models.WidgetDeployment)
-        .options(joinedload(models.WidgetDeployment.agent))
-        .filter(models.WidgetDeployment.deployment_id == deployment_id)
-        .first()
-    )
+    # Hot widgets are served from the cached runtime without touching Postgres.
+    deployment = await get_deployment_runtime(db, deployment_id)
     if not deployment or not deployment.is_enabled:
         raise HTTPException(status_code=404, detail="Widget is not available")
     host = _origin_host(request)
@@ -488,100 +503,104 @@ async def public_widget_chat(
     
     await _check_rate_limit(deployment.deployment_id, visitor_id, request)
 
-    agent = deployment.agent
-    if not agent or not agent.instructions:
+    if not deployment.instructions:
         raise HTTPException(status_code=404, detail="Widget is not available")
 
-    session = None
-    if payload.session_id:
-        try:
-            session_uuid = uuid.UUID(payload.session_id)
-            session = (
-                db.query(models.ChatSession)
-                .filter(models.ChatSession.id == session_uuid, models.ChatSession.deployment_id == deployment.id)
-                .first()
-            )
-        except ValueError:
-            session = None
-    
-    # If identity provided, try to find or merge with existing session
-    if payload.identity and payload.identity.get("externalId"):
-        external_id = payload.identity.get("externalId")
-        existing_session = (
-            db.query(models.ChatSession)
-            .filter(
-                models.ChatSession.deployment_id == deployment.id,
-                models.ChatSession.external_id == external_id
+    use_retrieval = deployment.retrieval_enabled
+    top_k = min(deployment.retrieval_top_k, CHAT_RETRIEVAL_TOP_K_CAP)
+    namespace = deployment.vector_store_namespace
+    embedding_model = deployment.embedding_model
+    deployment_pk = deployment.id
+    answer_cache_enabled = deployment.answer_cache_enabled
+    agent_instructions = deployment.instructions
+    agent_id_value = uuid.UUID(deployment.agent_id)
+    user_id_value = deployment.user_id
+    agent_model = deployment.model
+    user_message = payload.message
+    visitor_hash = _visitor_hash(deployment_pk, visitor_id, request)
+    # Without a session id or external id the visitor always gets a new,
+    # empty session, so this is known to be a first turn before any DB work.
+    known_first_turn = not payload.session_id and not (payload.identity or {}).get("externalId")
+
+    async def retrieve() -> tuple[str, Optional[str], Optional[str], float]:
+        # Opt-in: first-turn questions with no history can be answered from a
+        # cache keyed by the agent setup, the KB version and the normalized text.
+        cache_id_value = None
+        hit = None
+        if answer_cache_enabled:
+            kb_version = await aget_namespace_version(namespace) if use_retrieval and namespace else 0
+            cache_id_value = answer_cache_id(
+                deployment_id,
+                agent_instructions,
+                agent_model or "",
+                f"{use_retrieval}:{namespace}:{top_k}",
+                kb_version,
+                user_message,
             )
-            .order_by(models.ChatSession.last_active_at.desc())
-            .first()
-        )
-        if existing_session:
-            session = existing_session
-    
-    if not session:
-        session = models.ChatSession(
-            deployment_id=deployment.id,
-            agent_id=agent.id,
-            visitor_hash=_visitor_hash(deployment.id, visitor_id, request),
-            created_at=datetime.now(timezone.utc),
-            last_active_at=datetime.now(timezone.utc),
-        )
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-    
-    # Update identity if provided
-    if payload.identity:
-        if payload.identity.get("externalId"):
-            session.external_id = payload.identity.get("externalId")
-        if payload.identity.get("email"):
-            session.email = payload.identity.get("email")
-        if payload.identity.get("name"):
-            session.name = payload.identity.get("name")
-        if payload.identity.get("metadata"):
-            session.custom_metadata = {**(session.custom_metadata or {}), **payload.identity.get("metadata", {})}
-        db.commit()
+            if cache_id_value:
+                hit = await aget_cached_answer(cache_id_value)
+        context = ""
+        retrieval_ms = 0.0
+        if (hit is None or not known_first_turn) and use_retrieval and namespace:
+            retrieval_started = time.perf_counter()
+            try:
+                context = await aretrieve_context(
+                    None, namespace, str(agent_id_value), user_message, top_k=top_k, embedding_model=embedding_model
+                )
+            except Exception:
+                logger.exception("public_widget_retrieval_failed deployment_id=%s agent_id=%s", deployment_id, agent_id_value)
+                # An answer written without its KB context must not be served to later visitors.
+                cache_id_value = None
+                hit = None
+            finally:
+                retrieval_ms = (time.perf_counter() - retrieval_started) * 1000
+        return context, cache_id_value, hit, retrieval_ms
 
-    cfg = db.query(models.AgentConfig).filter(models.AgentConfig.agent_id == agent.id).first()
-    use_retrieval = bool(cfg.retrieval_enabled) if cfg else False
-    top_k = min(int(cfg.retrieval_top_k) if cfg else 4, CHAT_RETRIEVAL_TOP_K_CAP)
-    namespace = cfg.vector_store_namespace if cfg else None
-    context = ""
-    retrieval_ms = 0.0
-    if use_retrieval and namespace:
-        retrieval_started = time.perf_counter()
+    async def generate():
+        # Retrieval only needs the question, so it runs while the session and
+        # history are written and read in one transaction on a worker thread.
+        retrieval = asyncio.ensure_future(retrieve())
         try:
-            context = await aretrieve_context(db, namespace, str(agent.id), payload.message, top_k=top_k)
-        except Exception:
-            logger.exception("public_widget_retrieval_failed deployment_id=%s agent_id=%s", deployment_id, agent.id)
+            try:
+                session_id_value, history = await anyio.to_thread.run_sync(
+                    _prepare_public_session,
+                    deployment_pk,
+                    agent_id_value,
+                    visitor_hash,
+                    payload.session_id,
+                    payload.identity,
+                    user_message,
+                )
+            except Exception:
+                logger.exception("public_widget_session_failed deployment_id=%s", deployment_id)
+                yield sse_event("error", {"detail": "Sorry, I could not answer that right now."})
+                return
+            yield sse_event("meta", {"session_id": str(session_id_value)})
+            context, answer_cache_id_value, cached_answer, retrieval_ms = await retrieval
         finally:
-            retrieval_ms = (time.perf_counter() - retrieval_started) * 1000
-
-    history = _history_for_prompt(db, session.id)
-    messages = build_messages(agent.instructions or "", context, payload.message, history=history)
-    session_id_value = session.id
-    agent_id_value = agent.id
-    user_id_value = agent.user_id
-    agent_model = agent.model
-    user_message = payload.message
-
-    db.add(models.ChatMessage(session_id=session_id_value, role="user", content=user_message, created_at=datetime.now(timezone.utc)))
-    session.last_active_at = datetime.now(timezone.utc)
-    db.commit()
+            if not retrieval.done():
+                retrieval.cancel()
+        if history:
+            answer_cache_id_value = None
+            cached_answer = None
 
-    async def generate():
         answer_parts: list[str] = []
         stream_started = time.perf_counter()
         first_token_ms = None
-        yield _sse("meta", {"session_id": str(session_id_value)})
+        if cached_answer is not None:
+            tokens = _areplay_answer(cached_answer)
+        else:
+            messages = await abuild_messages(agent_instructions, context, user_message, history=history, model=agent_model)
+            tokens = astream_answer(agent_model, messages)
         try:
-            async for token in astream_answer(agent_model, messages):
+            async for token in coalesce_tokens(tokens):
                 if first_token_ms is None:
                     first_token_ms = (time.perf_counter() - stream_started) * 1000
                 answer_parts.append(token)
-                yield _sse("token", {"content": token})
+                yield sse_token(token)
             answer = "".join(answer_parts).strip()
+            if answer_cache_id_value and cached_answer is None:
+                await aset_cached_answer(answer_cache_id_value, answer)
             
             background_tasks.add_task(
                 _log_public_chat,
@@ -593,24 +612,103 @@ async def public_widget_chat(
             )
             
             logger.info(
-                "widget_chat_latency deployment_id=%s agent_id=%s retrieval_ms=%.2f llm_ttft_ms=%.2f total_ms=%.2f",
+                "widget_chat_latency deployment_id=%s agent_id=%s answer_cache=%s retrieval_ms=%.2f llm_ttft_ms=%.2f total_ms=%.2f",
                 deployment_id,
                 agent_id_value,
+                "hit" if cached_answer is not None else ("miss" if answer_cache_id_value else "off"),
                 retrieval_ms,
                 first_token_ms or 0.0,
                 (time.perf_counter() - started) * 1000,
             )
-            yield _sse("done", {"session_id": str(session_id_value)})
+            yield sse_event("done", {"session_id": str(session_id_value)})
         except Exception:
             logger.exception("public_widget_generation_failed deployment_id=%s session_id=%s", deployment_id, session_id_value)
-            yield _sse("error", {"detail": "Sorry, I could not answer that right now."})
+            yield sse_event("error", {"detail": "Sorry, I could not answer that right now."})
 
-    headers = _origin_headers(request)
-    headers["Cache-Control"] = "no-cache"
-    headers["X-Accel-Buffering"] = "no"
+    headers = {**_origin_headers(request), **SSE_HEADERS}
     return StreamingResponse(generate(), media_type="text/event-stream", headers=headers, background=background_tasks)
 
 
+def _prepare_public_session(
+    deployment_pk: int,
+    agent_id: uuid.UUID,
+    visitor_hash: str,
+    session_id: Optional[str],
+    identity: Optional[dict],
+    user_message: str,
+) -> tuple[uuid.UUID, list[dict[str, str]]]:
+    """Resolve or create the visitor's session, load its history and store the new message in one commit."""
+    db = BackgroundSession()
+    try:
+        session = None
+        if session_id:
+            try:
+                session = (
+                    db.query(models.ChatSession)
+                    .filter(models.ChatSession.id == uuid.UUID(session_id), models.ChatSession.deployment_id == deployment_pk)
+                    .first()
+                )
+            except ValueError:
+                session = None
+
+        # If identity provided, try to find or merge with existing session
+        external_id = (identity or {}).get("externalId")
+        if external_id:
+            existing_session = (
+                db.query(models.ChatSession)
+                .filter(
+                    models.ChatSession.deployment_id == deployment_pk,
+                    models.ChatSession.external_id == external_id
+                )
+                .order_by(models.ChatSession.last_active_at.desc())
+                .first()
+            )
+            if existing_session:
+                session = existing_session
+
+        now = datetime.now(timezone.utc)
+        history: list[dict[str, str]] = []
+        if session:
+            history = _history_for_prompt(db, session.id)
+        else:
+            # The id is assigned here so the message row can reference it without a flush.
+            session = models.ChatSession(
+                id=uuid.uuid4(),
+                deployment_id=deployment_pk,
+                agent_id=agent_id,
+                visitor_hash=visitor_hash,
+                created_at=now,
+                last_active_at=now,
+            )
+            db.add(session)
+
+        # Update identity if provided
+        if identity:
+            if identity.get("externalId"):
+                session.external_id = identity.get("externalId")
+            if identity.get("email"):
+                session.email = identity.get("email")
+            if identity.get("name"):
+                session.name = identity.get("name")
+            if identity.get("metadata"):
+                session.custom_metadata = {**(session.custom_metadata or {}), **identity.get("metadata", {})}
+
+        db.add(models.ChatMessage(session_id=session.id, role="user", content=user_message, created_at=now))
+        session.last_active_at = now
+        db.commit()
+        return session.id, history
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def _areplay_answer(answer: str):
+    for token in iter_replay_tokens(answer):
+        yield token
+
+
 def _log_public_chat(session_id, user_id, agent_id, user_message, answer):
     db = BackgroundSession()
     try:
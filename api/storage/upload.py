@@ -93,7 +93,7 @@ async def upload_file(agent_id: str = Form(...), file: UploadFile = File(...), l
     db.add(job)
     db.commit()
 
-    if not enqueue_kb_ingest(str(job.id), extracted_text):
+    if not enqueue_kb_ingest(str(job.id), extracted_text, user_id=user.id):
         raise HTTPException(status_code=503, detail="Knowledge ingestion queue is full. Please try again shortly.")
 
     return {"message": "Knowledge base added and ingest queued", "kb_id": str(kb.id)}
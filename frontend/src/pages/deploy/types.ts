@@ -9,6 +9,7 @@ export type WidgetDeployment = {
   primary_color: string;
   allowed_domains: string[];
   is_enabled: boolean;
+  answer_cache_enabled: boolean;
   embed_script: string;
 };
 
@@ -23,6 +24,7 @@ export function defaultDeployment(agent?: Agent | null): WidgetDeployment {
     primary_color: '#ffffff',
     allowed_domains: ['localhost', '127.0.0.1'],
     is_enabled: true,
+    answer_cache_enabled: false,
     embed_script: `<script src="${API_BASE_URL}/static/widget.js" data-deployment-id="" defer></script>`,
   };
 }
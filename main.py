@@ -3,7 +3,7 @@ import os
 import time
 import uuid
 
-from fastapi import FastAPI, Request, status
+from fastapi import Depends, FastAPI, HTTPException, Request, status
 from starlette.responses import Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
@@ -22,7 +22,8 @@ from db.database import Base, engine
 from api.analytics import analytics
 from fastapi.staticfiles import StaticFiles
 from services.http_client import close_http_clients
-from services.redis_client import close_redis_clients
+from services.redis_client import close_redis_clients, local_cache_stats
+from utils.jwt import get_current_user
 from utils.rate_limit import create_limiter
 
 
@@ -67,6 +68,14 @@ def health_check():
     return {"status": "ok"}
 
 
+@app.get("/health/cache", include_in_schema=False)
+def cache_health(user = Depends(get_current_user)):
+    # Hit rates and sizes span every tenant's cache entries.
+    if getattr(user, "user_type", "") != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden: Admin access required")
+    return {"local_cache": local_cache_stats()}
+
+
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
     request_id = getattr(request.state, "request_id", uuid.uuid4().hex)
@@ -44,7 +44,12 @@ class KBIngestJob(Base):
     state = Column(SQLAlchemyEnum(JobState), default=JobState.queued, nullable=False, index=True)
     total_chunks = Column(Integer, nullable=True)
     processed_chunks = Column(Integer, nullable=True)
+    skipped_chunks = Column(Integer, nullable=True)
     error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    locked_by = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
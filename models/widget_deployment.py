@@ -26,6 +26,7 @@ class WidgetDeployment(Base):
     primary_color: Mapped[str] = mapped_column(String(7), default="#ffffff", nullable=False)
     allowed_domains: Mapped[list] = mapped_column(JSON, nullable=False, default=list)
     is_enabled: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
+    answer_cache_enabled: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
 
@@ -30,6 +30,9 @@ class AgentConfigOut(BaseModel):
     system_prompt_locked: bool
     created_at: datetime
     updated_at: datetime
+    # KBs queued for re-ingest because the embedding model changed; their
+    # vectors are stale until the jobs finish.
+    retraining_kb_count: int = 0
 
     model_config = ConfigDict(from_attributes=True)
 
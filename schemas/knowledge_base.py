@@ -37,6 +37,7 @@ class KBIngestJobOut(BaseModel):
     state: JobState
     total_chunks: Optional[int] = None
     processed_chunks: Optional[int] = None
+    skipped_chunks: Optional[int] = None
     error: Optional[str]
     created_at: datetime
     updated_at: datetime
@@ -0,0 +1,53 @@
+import hashlib
+import logging
+import os
+import re
+from typing import Iterator, Optional
+
+from services.redis_client import aredis_get_json, aredis_set_json, cache_key
+
+logger = logging.getLogger(__name__)
+
+WIDGET_ANSWER_CACHE_TTL_SECONDS = int(os.getenv("WIDGET_ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+WIDGET_ANSWER_CACHE_MAX_QUESTION_CHARS = int(os.getenv("WIDGET_ANSWER_CACHE_MAX_QUESTION_CHARS", "300"))
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_MULTI_WS = re.compile(r"\s+")
+_REPLAY_TOKEN = re.compile(r"\s*\S+")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants share an entry."""
+    return _MULTI_WS.sub(" ", _NON_WORD.sub(" ", question.lower())).strip()
+
+
+def answer_cache_id(
+    deployment_id: str,
+    instructions: str,
+    model: str,
+    retrieval: str,
+    kb_version: int,
+    question: str,
+) -> Optional[str]:
+    """Cache key for a first-turn answer, or None when the question should not be cached."""
+    normalized = normalize_question(question)
+    if not normalized or len(normalized) > WIDGET_ANSWER_CACHE_MAX_QUESTION_CHARS:
+        return None
+    agent_version = hashlib.sha256("\0".join((instructions, model, retrieval)).encode("utf-8")).hexdigest()[:16]
+    question_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    return cache_key("widget", "answer", deployment_id, agent_version, kb_version, question_hash)
+
+
+async def aget_cached_answer(cache_id: str) -> Optional[str]:
+    cached = await aredis_get_json(cache_id)
+    return cached if isinstance(cached, str) and cached else None
+
+
+async def aset_cached_answer(cache_id: str, answer: str) -> None:
+    if answer:
+        await aredis_set_json(cache_id, answer, WIDGET_ANSWER_CACHE_TTL_SECONDS)
+
+
+def iter_replay_tokens(answer: str) -> Iterator[str]:
+    """Split a cached answer into word-sized pieces that concatenate back to the original."""
+    yield from _REPLAY_TOKEN.findall(answer)
@@ -4,12 +4,17 @@ import os
 from dataclasses import asdict, dataclass
 from typing import Optional
 
-from sqlalchemy.orm import Session
+import anyio
+from sqlalchemy.orm import Session, joinedload
 
 from db import models
-from services.redis_client import aredis_get_json, aredis_set_json, cache_key, redis_delete
+from db.database import BackgroundSession
+from services.redis_client import cache_key, redis_delete
+from services.singleflight import acached
 
 CHAT_RUNTIME_CACHE_TTL_SECONDS = int(os.getenv("CHAT_RUNTIME_CACHE_TTL_SECONDS", "60"))
+# After the TTL an entry is still served for this long while one refresh runs.
+CHAT_RUNTIME_STALE_SECONDS = int(os.getenv("CHAT_RUNTIME_STALE_SECONDS", "300"))
 
 
 @dataclass(frozen=True)
@@ -22,21 +27,14 @@ class AgentRuntime:
     retrieval_enabled: bool
     retrieval_top_k: int
     vector_store_namespace: Optional[str]
+    embedding_model: Optional[str] = None
 
 
 def _runtime_cache_key(agent_id: str, user_id: int) -> str:
     return cache_key("chat", "runtime", user_id, agent_id)
 
 
-async def get_agent_runtime(db: Session, agent_id: str, user_id: int) -> Optional[AgentRuntime]:
-    key = _runtime_cache_key(agent_id, user_id)
-    cached = await aredis_get_json(key)
-    if isinstance(cached, dict):
-        try:
-            return AgentRuntime(**cached)
-        except TypeError:
-            pass
-
+def _load_agent_runtime(db: Session, agent_id: str, user_id: int) -> Optional[dict]:
     row = (
         db.query(models.Agent, models.AgentConfig)
         .outerjoin(models.AgentConfig, models.AgentConfig.agent_id == models.Agent.id)
@@ -47,20 +45,146 @@ async def get_agent_runtime(db: Session, agent_id: str, user_id: int) -> Optiona
         return None
 
     agent, cfg = row
-    runtime = AgentRuntime(
-        id=str(agent.id),
-        user_id=int(agent.user_id),
-        name=agent.name,
-        instructions=agent.instructions or "",
-        model=agent.model,
-        retrieval_enabled=bool(cfg.retrieval_enabled) if cfg else False,
-        retrieval_top_k=int(cfg.retrieval_top_k) if cfg and cfg.retrieval_top_k else 4,
-        vector_store_namespace=cfg.vector_store_namespace if cfg else None,
+    return asdict(
+        AgentRuntime(
+            id=str(agent.id),
+            user_id=int(agent.user_id),
+            name=agent.name,
+            instructions=agent.instructions or "",
+            model=agent.model,
+            retrieval_enabled=bool(cfg.retrieval_enabled) if cfg else False,
+            retrieval_top_k=int(cfg.retrieval_top_k) if cfg and cfg.retrieval_top_k else 4,
+            vector_store_namespace=cfg.vector_store_namespace if cfg else None,
+            embedding_model=cfg.embedding_model if cfg else None,
+        )
+    )
+
+
+async def _in_background_session(loader, *args) -> Optional[dict]:
+    # Background refreshes outlive the request, so they cannot use its session.
+    def load():
+        db = BackgroundSession()
+        try:
+            return loader(db, *args)
+        finally:
+            db.close()
+
+    return await anyio.to_thread.run_sync(load)
+
+
+async def get_agent_runtime(db: Session, agent_id: str, user_id: int) -> Optional[AgentRuntime]:
+    async def load():
+        return _load_agent_runtime(db, agent_id, user_id)
+
+    async def reload():
+        return await _in_background_session(_load_agent_runtime, agent_id, user_id)
+
+    cached = await acached(
+        _runtime_cache_key(agent_id, user_id),
+        CHAT_RUNTIME_CACHE_TTL_SECONDS,
+        CHAT_RUNTIME_STALE_SECONDS,
+        load,
+        refresh=reload,
     )
-    await aredis_set_json(key, asdict(runtime), CHAT_RUNTIME_CACHE_TTL_SECONDS)
-    return runtime
+    if not isinstance(cached, dict):
+        return None
+    try:
+        return AgentRuntime(**cached)
+    except TypeError:
+        fresh = await load()
+        return AgentRuntime(**fresh) if fresh else None
 
 
 def invalidate_agent_runtime(agent_id: str, user_id: Optional[int] = None) -> None:
     if user_id is not None:
         redis_delete(_runtime_cache_key(agent_id, user_id))
+
+
+@dataclass(frozen=True)
+class DeploymentRuntime:
+    """Everything the public widget chat needs from Postgres before retrieval."""
+
+    id: int
+    deployment_id: str
+    is_enabled: bool
+    allowed_domains: list[str]
+    answer_cache_enabled: bool
+    agent_id: str
+    user_id: int
+    instructions: str
+    model: str
+    retrieval_enabled: bool
+    retrieval_top_k: int
+    vector_store_namespace: Optional[str]
+    embedding_model: Optional[str] = None
+
+
+def _deployment_runtime_cache_key(deployment_id: str) -> str:
+    return cache_key("widget", "runtime", deployment_id)
+
+
+def _load_deployment_runtime(db: Session, deployment_id: str) -> Optional[dict]:
+    deployment = (
+        db.query(models.WidgetDeployment)
+        .options(joinedload(models.WidgetDeployment.agent).joinedload(models.Agent.config))
+        .filter(models.WidgetDeployment.deployment_id == deployment_id)
+        .first()
+    )
+    if not deployment or not deployment.agent:
+        return None
+
+    agent = deployment.agent
+    cfg = agent.config
+    return asdict(
+        DeploymentRuntime(
+            id=int(deployment.id),
+            deployment_id=deployment.deployment_id,
+            is_enabled=bool(deployment.is_enabled),
+            allowed_domains=list(deployment.allowed_domains or []),
+            answer_cache_enabled=bool(deployment.answer_cache_enabled),
+            agent_id=str(agent.id),
+            user_id=int(agent.user_id),
+            instructions=agent.instructions or "",
+            model=agent.model,
+            retrieval_enabled=bool(cfg.retrieval_enabled) if cfg else False,
+            retrieval_top_k=int(cfg.retrieval_top_k) if cfg and cfg.retrieval_top_k else 4,
+            vector_store_namespace=cfg.vector_store_namespace if cfg else None,
+            embedding_model=cfg.embedding_model if cfg else None,
+        )
+    )
+
+
+async def get_deployment_runtime(db: Session, deployment_id: str) -> Optional[DeploymentRuntime]:
+    # widget:runtime is a locally cached family, so hot widgets are served from process memory.
+    async def load():
+        return _load_deployment_runtime(db, deployment_id)
+
+    async def reload():
+        return await _in_background_session(_load_deployment_runtime, deployment_id)
+
+    cached = await acached(
+        _deployment_runtime_cache_key(deployment_id),
+        CHAT_RUNTIME_CACHE_TTL_SECONDS,
+        CHAT_RUNTIME_STALE_SECONDS,
+        load,
+        refresh=reload,
+    )
+    if not isinstance(cached, dict):
+        return None
+    try:
+        return DeploymentRuntime(**cached)
+    except TypeError:
+        fresh = await load()
+        return DeploymentRuntime(**fresh) if fresh else None
+
+
+def invalidate_deployment_runtime(deployment_id: str) -> None:
+    redis_delete(_deployment_runtime_cache_key(deployment_id))
+
+
+def invalidate_agent_deployment_runtime(db: Session, agent_id) -> None:
+    deployment_id = (
+        db.query(models.WidgetDeployment.deployment_id).filter(models.WidgetDeployment.agent_id == agent_id).scalar()
+    )
+    if deployment_id:
+        invalidate_deployment_runtime(deployment_id)
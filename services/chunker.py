@@ -0,0 +1,221 @@
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+KB_CHUNKING_STRATEGY = os.getenv("KB_CHUNKING_STRATEGY", "structured").strip().lower()
+KB_CHUNK_MAX_TOKENS = int(os.getenv("KB_CHUNK_MAX_TOKENS", "256"))
+KB_CHUNK_OVERLAP_TOKENS = int(os.getenv("KB_CHUNK_OVERLAP_TOKENS", "32"))
+# Optional tiktoken encoding (e.g. cl100k_base) used to approximate the embedding
+# model's tokenizer. It needs tiktoken installed and downloads its BPE file on
+# first use unless TIKTOKEN_CACHE_DIR is populated; empty uses ~4 chars/token.
+KB_CHUNK_TOKENIZER = os.getenv("KB_CHUNK_TOKENIZER", "").strip()
+# Text without newlines (PDF extraction joins pages with spaces) is cut into
+# pseudo-lines of at most this many characters, at a sentence end if possible.
+KB_CHUNK_MAX_LINE_CHARS = int(os.getenv("KB_CHUNK_MAX_LINE_CHARS", "4000"))
+
+_HEADING = re.compile(r"^(?:H([1-6]):|(#{1,6}))\s+(.+)$")
+_LIST_ITEM = re.compile(r"^(?:[-*•]|\d{1,3}[.)])\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_MULTI_WS = re.compile(r"\s+")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    text: str
+    heading_path: tuple[str, ...] = ()
+
+    @property
+    def body(self) -> str:
+        return self.text.split("\n", 1)[-1] if self.heading_path else self.text
+
+    @property
+    def metadata(self) -> dict[str, str]:
+        return {"heading_path": " > ".join(self.heading_path)} if self.heading_path else {}
+
+
+@lru_cache(maxsize=4)
+def _get_encoding(name: str):
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(name)
+    except Exception:
+        logger.warning("chunk_tokenizer_unavailable encoding=%s fallback=chars_per_token", name)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding(KB_CHUNK_TOKENIZER) if KB_CHUNK_TOKENIZER else None
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_chunk_count(text_len: int) -> int:
+    return math.ceil(text_len / (KB_CHUNK_MAX_TOKENS * 4)) if text_len else 0
+
+
+def _cut_long_line(line: str) -> tuple[list[str], str]:
+    """Cut a line into pieces of at most KB_CHUNK_MAX_LINE_CHARS; returns (pieces, remainder)."""
+    pieces: list[str] = []
+    start = 0
+    while len(line) - start > KB_CHUNK_MAX_LINE_CHARS:
+        window = line[start : start + KB_CHUNK_MAX_LINE_CHARS]
+        cut = 0
+        for match in _SENTENCE_END.finditer(window):
+            cut = match.end()
+        if not cut:
+            cut = window.rfind(" ") + 1 or len(window)
+        pieces.append(line[start : start + cut])
+        start += cut
+    return pieces, line[start:]
+
+
+def _iter_lines(segments: Iterable[str]) -> Iterator[str]:
+    # Only the incoming segment is split, and the carried-over tail stays
+    # bounded, so newline-free text is processed in linear time and memory.
+    pending = ""
+    for segment in segments:
+        lines = segment.split("\n")
+        lines[0] = pending + lines[0]
+        pending = lines.pop()
+        for line in lines:
+            pieces, rest = _cut_long_line(line)
+            yield from pieces
+            yield rest
+        pieces, pending = _cut_long_line(pending)
+        yield from pieces
+    if pending:
+        yield pending
+
+
+def _iter_blocks(segments: Iterable[str]) -> Iterator[tuple[str, Optional[int], str]]:
+    """Yield ("heading", level, text), ("item", None, text) or ("para", None, text) blocks."""
+    paragraph: list[str] = []
+
+    def flush() -> Iterator[tuple[str, Optional[int], str]]:
+        if paragraph:
+            yield "para", None, " ".join(paragraph)
+            paragraph.clear()
+
+    for raw_line in _iter_lines(segments):
+        line = _MULTI_WS.sub(" ", raw_line).strip()
+        if not line:
+            yield from flush()
+            continue
+        heading = _HEADING.match(line)
+        if heading:
+            yield from flush()
+            level = int(heading.group(1)) if heading.group(1) else len(heading.group(2))
+            yield "heading", level, heading.group(3).strip()
+        elif _LIST_ITEM.match(line):
+            yield from flush()
+            yield "item", None, line
+        else:
+            paragraph.append(line)
+            if sum(len(part) for part in paragraph) >= KB_CHUNK_MAX_LINE_CHARS:
+                yield from flush()
+    yield from flush()
+
+
+def _split_oversized(text: str, max_tokens: int) -> Iterator[str]:
+    """Split a block that exceeds max_tokens at sentence, then word, boundaries."""
+    piece = ""
+    for sentence in _SENTENCE_END.split(text):
+        if count_tokens(sentence) > max_tokens:
+            if piece:
+                yield piece
+                piece = ""
+            words: list[str] = []
+            for word in sentence.split(" "):
+                if words and count_tokens(" ".join(words + [word])) > max_tokens:
+                    yield " ".join(words)
+                    words = []
+                words.append(word)
+            if words:
+                yield " ".join(words)
+            continue
+        candidate = f"{piece} {sentence}" if piece else sentence
+        if piece and count_tokens(candidate) > max_tokens:
+            yield piece
+            piece = sentence
+        else:
+            piece = candidate
+    if piece:
+        yield piece
+
+
+def _overlap_tail(parts: list[str], overlap_tokens: int) -> list[str]:
+    if overlap_tokens <= 0 or not parts:
+        return []
+    sentences = _SENTENCE_END.split(parts[-1])
+    tail: list[str] = []
+    used = 0
+    for sentence in reversed(sentences):
+        used += count_tokens(sentence)
+        if used > overlap_tokens:
+            break
+        tail.insert(0, sentence)
+    return [" ".join(tail)] if tail else []
+
+
+def iter_structured_chunks(
+    segments: Iterable[str],
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+) -> Iterator[Chunk]:
+    """Pack paragraphs and list items into token-bounded chunks that never span a heading.
+
+    Each chunk's text starts with its heading path so the section title is
+    embedded and shown in the prompt context alongside the body.
+    """
+    max_tokens = max_tokens or KB_CHUNK_MAX_TOKENS
+    overlap_tokens = KB_CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    headings: list[tuple[int, str]] = []
+    parts: list[str] = []
+    used = 0
+    has_new_content = False
+
+    def heading_path() -> tuple[str, ...]:
+        return tuple(title for _, title in headings)
+
+    def render(body: list[str]) -> str:
+        path = heading_path()
+        prefix = f"{' > '.join(path)}\n" if path else ""
+        return prefix + "\n".join(body)
+
+    def budget() -> int:
+        path = heading_path()
+        return max(max_tokens - (count_tokens(" > ".join(path)) if path else 0), max_tokens // 2)
+
+    for kind, level, text in _iter_blocks(segments):
+        if kind == "heading":
+            if has_new_content:
+                yield Chunk(render(parts), heading_path())
+            parts, used, has_new_content = [], 0, False
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, text))
+            continue
+
+        limit = budget()
+        for piece in _split_oversized(text, limit) if count_tokens(text) > limit else [text]:
+            tokens = count_tokens(piece)
+            if parts and has_new_content and used + tokens > limit:
+                yield Chunk(render(parts), heading_path())
+                parts = _overlap_tail(parts, overlap_tokens)
+                used = sum(count_tokens(part) for part in parts)
+                if used + tokens > limit:
+                    parts, used = [], 0
+            parts.append(piece)
+            used += tokens
+            has_new_content = True
+
+    if has_new_content:
+        yield Chunk(render(parts), heading_path())
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import re
+from typing import Optional
+
+import numpy as np
+
+KB_DEDUP_NEAR_DISTANCE = int(os.getenv("KB_DEDUP_NEAR_DISTANCE", "3"))
+KB_DEDUP_MIN_TOKENS = int(os.getenv("KB_DEDUP_MIN_TOKENS", "8"))
+
+_TOKEN = re.compile(r"\w+")
+_SHINGLE_SIZE = 3
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+
+def normalized_text_hash(text: str) -> str:
+    normalized = " ".join(_TOKEN.findall(text.lower()))
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def simhash64(text: str) -> Optional[int]:
+    """64-bit SimHash over word 3-shingles; None for texts too short to compare reliably."""
+    tokens = _TOKEN.findall(text.lower())
+    if len(tokens) < KB_DEDUP_MIN_TOKENS:
+        return None
+    digests = b"".join(
+        hashlib.blake2b(" ".join(tokens[index : index + _SHINGLE_SIZE]).encode("utf-8"), digest_size=8).digest()
+        for index in range(len(tokens) - _SHINGLE_SIZE + 1)
+    )
+    # One row of 64 bits per shingle, least significant bit first; a bit is set
+    # in the fingerprint when more than half of the shingles have it.
+    values = np.frombuffer(digests, dtype=">u8").astype("<u8")
+    bits = np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(values)
+    return int.from_bytes(np.packbits(majority, bitorder="little").tobytes(), "little")
+
+
+class NearDuplicateIndex:
+    """Finds SimHash fingerprints within max_distance bits of one already added.
+
+    Fingerprints are bucketed by 16-bit bands; with max_distance < 4 any match
+    shares at least one band exactly, so only those buckets are compared.
+    """
+
+    def __init__(self, max_distance: int = KB_DEDUP_NEAR_DISTANCE):
+        self.max_distance = max_distance
+        self._exact: set[str] = set()
+        self._bands: list[dict[int, list[int]]] = [{} for _ in range(_BANDS)]
+
+    def _band_keys(self, fingerprint: int) -> list[int]:
+        return [fingerprint >> (band * _BAND_BITS) & _BAND_MASK for band in range(_BANDS)]
+
+    def is_duplicate(self, text: str) -> bool:
+        """Return True if text duplicates an earlier one; otherwise remember it."""
+        text_hash = normalized_text_hash(text)
+        if text_hash in self._exact:
+            return True
+        self._exact.add(text_hash)
+        if self.max_distance <= 0:
+            return False
+        fingerprint = simhash64(text)
+        if fingerprint is None:
+            return False
+        keys = self._band_keys(fingerprint)
+        for band, key in enumerate(keys):
+            for other in self._bands[band].get(key, ()):
+                if (fingerprint ^ other).bit_count() <= self.max_distance:
+                    return True
+        for band, key in enumerate(keys):
+            self._bands[band].setdefault(key, []).append(fingerprint)
+        return False
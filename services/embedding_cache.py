@@ -0,0 +1,181 @@
+import base64
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+import anyio
+import numpy as np
+
+from services.redis_client import cache_key, get_async_redis
+
+
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_TTL_SECONDS = int(os.getenv("EMBED_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "/tmp/helpdeskai-embeddings").strip()
+# The disk tier is pruned back below this size, least recently used files first;
+# files older than EMBED_CACHE_TTL_SECONDS are removed on every sweep.
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+_VECTOR_DTYPE = np.dtype("<f4")
+_SWEEP_TARGET_RATIO = 0.9
+
+_sweep_lock = threading.Lock()
+_written_since_sweep = 0
+
+
+def embedding_cache_id(model: str, task: str, text: str) -> str:
+    digest = hashlib.sha256()
+    for part in (model, task, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _redis_key(cache_id: str) -> str:
+    return cache_key("embed", cache_id)
+
+
+def _encode(vector: Sequence[float]) -> bytes:
+    return np.asarray(vector, dtype=_VECTOR_DTYPE).tobytes()
+
+
+def _decode(raw: bytes) -> np.ndarray:
+    return np.frombuffer(raw, dtype=_VECTOR_DTYPE)
+
+
+def _disk_path(cache_id: str) -> Optional[Path]:
+    if not EMBED_CACHE_DIR:
+        return None
+    return Path(EMBED_CACHE_DIR) / cache_id[:2] / f"{cache_id}.f32"
+
+
+def _read_disk(cache_ids: Iterable[str]) -> dict[str, np.ndarray]:
+    found: dict[str, np.ndarray] = {}
+    for cache_id in cache_ids:
+        path = _disk_path(cache_id)
+        if path is None:
+            break
+        try:
+            found[cache_id] = _decode(path.read_bytes())
+            # The mtime doubles as the last-use time for pruning.
+            os.utime(path)
+        except FileNotFoundError:
+            continue
+        except OSError:
+            logger.warning("embed_cache_disk_read_failed path=%s", path, exc_info=True)
+    return found
+
+
+def _write_disk(entries: dict[str, bytes]) -> None:
+    global _written_since_sweep
+    written = 0
+    for cache_id, raw in entries.items():
+        path = _disk_path(cache_id)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(raw)
+            os.replace(tmp_path, path)
+            written += len(raw)
+        except OSError:
+            logger.warning("embed_cache_disk_write_failed path=%s", path, exc_info=True)
+    _written_since_sweep += written
+    # Sweep whenever a tenth of the budget has been written since the last one.
+    if EMBED_CACHE_MAX_BYTES > 0 and _written_since_sweep >= EMBED_CACHE_MAX_BYTES // 10:
+        _prune_disk()
+
+
+def _prune_disk() -> None:
+    """Delete expired files, then the least recently used ones until the tier is under budget."""
+    global _written_since_sweep
+    if not EMBED_CACHE_DIR or not _sweep_lock.acquire(blocking=False):
+        return
+    try:
+        _written_since_sweep = 0
+        expires_before = time.time() - EMBED_CACHE_TTL_SECONDS
+        files: list[tuple[float, int, str]] = []
+        total = 0
+        removed = 0
+        for directory, _, names in os.walk(EMBED_CACHE_DIR):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime < expires_before:
+                        os.unlink(path)
+                        removed += 1
+                        continue
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total > EMBED_CACHE_MAX_BYTES:
+            target = EMBED_CACHE_MAX_BYTES * _SWEEP_TARGET_RATIO
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        logger.info("embed_cache_disk_pruned removed=%s bytes=%s", removed, total)
+    finally:
+        _sweep_lock.release()
+
+
+async def _read_redis(cache_ids: list[str]) -> dict[str, np.ndarray]:
+    client = get_async_redis()
+    if not client or not cache_ids:
+        return {}
+    try:
+        values = await client.mget([_redis_key(cache_id) for cache_id in cache_ids])
+    except Exception:
+        logger.warning("embed_cache_redis_get_failed count=%s", len(cache_ids), exc_info=True)
+        return {}
+    found: dict[str, np.ndarray] = {}
+    for cache_id, value in zip(cache_ids, values):
+        if value:
+            found[cache_id] = _decode(base64.b64decode(value))
+    return found
+
+
+async def _write_redis(entries: dict[str, bytes]) -> None:
+    client = get_async_redis()
+    if not client or not entries:
+        return
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for cache_id, raw in entries.items():
+                pipe.setex(_redis_key(cache_id), EMBED_CACHE_TTL_SECONDS, base64.b64encode(raw).decode("ascii"))
+            await pipe.execute()
+    except Exception:
+        logger.warning("embed_cache_redis_set_failed count=%s", len(entries), exc_info=True)
+
+
+async def aget_cached_embeddings(cache_ids: Sequence[str]) -> dict[str, np.ndarray]:
+    wanted = list(dict.fromkeys(cache_ids))
+    found = await anyio.to_thread.run_sync(_read_disk, wanted)
+    missing = [cache_id for cache_id in wanted if cache_id not in found]
+    if missing:
+        from_redis = await _read_redis(missing)
+        if from_redis:
+            found.update(from_redis)
+            raw = {cache_id: _encode(vector) for cache_id, vector in from_redis.items()}
+            await anyio.to_thread.run_sync(_write_disk, raw)
+    return found
+
+
+async def aset_cached_embeddings(entries: dict[str, Sequence[float]]) -> None:
+    if not entries:
+        return
+    raw = {cache_id: _encode(vector) for cache_id, vector in entries.items()}
+    await anyio.to_thread.run_sync(_write_disk, raw)
+    await _write_redis(raw)
@@ -1,23 +1,92 @@
-from typing import BinaryIO
+from typing import BinaryIO, Iterator, Optional
+import multiprocessing
+import os
 import re
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
 from io import BytesIO
 from zipfile import ZipFile
 
-def extract_text_from_pdf_file(file: BinaryIO) -> str:
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "48"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+
+_WS = re.compile(r"\s+")
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _clean_page(text: str) -> str:
+    return _WS.sub(" ", text).strip()
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        # spawn keeps workers independent of the API's threads and DB pools.
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_EXTRACT_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pdf_pool
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> list[str]:
+    import fitz
+
+    with fitz.open(path) as doc:
+        return [_clean_page(doc[index].get_text("text")) for index in range(start, stop)]
+
+
+def _iter_pdf_pages_pypdf2(file_bytes: bytes) -> Iterator[str]:
     from PyPDF2 import PdfReader
 
-    reader = PdfReader(file)
-    pages: list[str] = []
-    for page in reader.pages:
-        page_text = page.extract_text() or ""
-        pages.append(page_text)
-    text = " ".join(pages)
-    
-    text = re.sub(r'\n+', '\n', text)
-    text = re.sub(r'\s+', ' ', text)   
-    text = text.strip()                
-    
-    return text
+    for page in PdfReader(BytesIO(file_bytes)).pages:
+        text = _clean_page(page.extract_text() or "")
+        if text:
+            yield text
+
+
+def iter_pdf_pages(file_bytes: bytes) -> Iterator[str]:
+    """Yield cleaned page texts in order; large PDFs are split into page ranges across a process pool."""
+    try:
+        import fitz
+    except ImportError:
+        yield from _iter_pdf_pages_pypdf2(file_bytes)
+        return
+
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        page_count = doc.page_count
+        if page_count < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACT_PROCESSES <= 1:
+            for page in doc:
+                text = _clean_page(page.get_text("text"))
+                if text:
+                    yield text
+            return
+
+    # Workers open a shared temp copy rather than receiving the bytes per task.
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as handle:
+        handle.write(file_bytes)
+        handle.flush()
+        pool = _get_pdf_pool()
+        pending: deque[Future] = deque()
+        window = PDF_EXTRACT_PROCESSES * 2
+        try:
+            for start in range(0, page_count, PDF_PAGES_PER_TASK):
+                stop = min(start + PDF_PAGES_PER_TASK, page_count)
+                pending.append(pool.submit(_extract_page_range, handle.name, start, stop))
+                while len(pending) >= window:
+                    yield from (text for text in pending.popleft().result() if text)
+            while pending:
+                yield from (text for text in pending.popleft().result() if text)
+        finally:
+            # The consumer may stop early; queued ranges must not open the temp
+            # file after it is deleted, and running ones finish before it is.
+            wait([future for future in pending if not future.cancel()])
+
+
+def extract_text_from_pdf_file(file: BinaryIO) -> str:
+    return " ".join(iter_pdf_pages(file.read()))
 
 
 def extract_text_from_txt_file(file: BinaryIO) -> str:
@@ -26,7 +95,7 @@ def extract_text_from_txt_file(file: BinaryIO) -> str:
 
 def extract_text_from_pdf(file_bytes: bytes) -> str:
     # Extract text from PDF bytes
-    return extract_text_from_pdf_file(BytesIO(file_bytes))
+    return " ".join(iter_pdf_pages(file_bytes))
 
 
 def extract_text_from_txt(file_bytes: bytes) -> str:
@@ -45,6 +114,16 @@ def extract_text_from_docx(file_bytes: bytes) -> str:
     return re.sub(r"\s+", " ", " ".join(parts)).strip()
 
 
+def iter_text_from_file(file_bytes: bytes, filename: str) -> Iterator[str]:
+    lower = filename.lower()
+    if lower.endswith(".pdf"):
+        yield from iter_pdf_pages(file_bytes)
+    elif lower.endswith(".docx"):
+        yield extract_text_from_docx(file_bytes)
+    else:
+        yield extract_text_from_txt(file_bytes)
+
+
 def extract_text_from_file(file_bytes: bytes, filename: str) -> str:
     lower = filename.lower()
     if lower.endswith(".pdf"):
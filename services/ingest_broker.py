@@ -0,0 +1,339 @@
+import logging
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from db import models
+from db.database import BackgroundSession
+from services.redis_client import cache_key, get_redis
+
+
+logger = logging.getLogger(__name__)
+
+KB_INGEST_BACKEND = os.getenv("KB_INGEST_BACKEND", "local").strip().lower()
+KB_INGEST_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("KB_INGEST_VISIBILITY_TIMEOUT_SECONDS", "600"))
+KB_INGEST_MAX_ATTEMPTS = int(os.getenv("KB_INGEST_MAX_ATTEMPTS", "3"))
+KB_INGEST_RETRY_BASE_SECONDS = float(os.getenv("KB_INGEST_RETRY_BASE_SECONDS", "30"))
+KB_INGEST_RETRY_MAX_SECONDS = float(os.getenv("KB_INGEST_RETRY_MAX_SECONDS", "900"))
+KB_INGEST_STREAM_GROUP = os.getenv("KB_INGEST_STREAM_GROUP", "ingest-workers")
+
+
+@dataclass(frozen=True)
+class IngestLease:
+    job_id: str
+    attempt: int
+    token: str = ""
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def retry_delay_seconds(attempt: int) -> float:
+    delay = min(KB_INGEST_RETRY_BASE_SECONDS * (2 ** max(attempt - 1, 0)), KB_INGEST_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _lease_job(db: Session, job: models.KBIngestJob, consumer: str) -> IngestLease:
+    job.state = models.JobState.running
+    job.attempts = (job.attempts or 0) + 1
+    job.lease_expires_at = _utcnow() + timedelta(seconds=KB_INGEST_VISIBILITY_TIMEOUT_SECONDS)
+    job.locked_by = consumer
+    job.available_at = None
+    db.commit()
+    return IngestLease(job_id=str(job.id), attempt=job.attempts)
+
+
+def _extend_lease(db: Session, job_id: str, consumer: str) -> None:
+    job = db.query(models.KBIngestJob).filter(models.KBIngestJob.id == uuid.UUID(str(job_id))).first()
+    if job and job.locked_by == consumer:
+        job.lease_expires_at = _utcnow() + timedelta(seconds=KB_INGEST_VISIBILITY_TIMEOUT_SECONDS)
+        db.commit()
+
+
+def _release_job(db: Session, job_id: str, retry_at: Optional[datetime]) -> None:
+    job = db.query(models.KBIngestJob).filter(models.KBIngestJob.id == uuid.UUID(str(job_id))).first()
+    if not job:
+        return
+    job.lease_expires_at = None
+    job.locked_by = None
+    if retry_at is not None:
+        job.state = models.JobState.queued
+        job.available_at = retry_at
+        kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.id == job.kb_id).first()
+        if kb:
+            kb.status = models.KBStatus.pending
+    db.commit()
+
+
+def _expired_running_jobs(db: Session) -> list[models.KBIngestJob]:
+    return (
+        db.query(models.KBIngestJob)
+        .filter(
+            models.KBIngestJob.state == models.JobState.running,
+            or_(
+                models.KBIngestJob.lease_expires_at < _utcnow(),
+                (models.KBIngestJob.lease_expires_at.is_(None))
+                & (models.KBIngestJob.updated_at < _utcnow() - timedelta(seconds=KB_INGEST_VISIBILITY_TIMEOUT_SECONDS)),
+            ),
+        )
+        .all()
+    )
+
+
+def _fail_exhausted(db: Session, job: models.KBIngestJob) -> None:
+    job.state = models.JobState.failed
+    job.error = job.error or "Ingest job exceeded its maximum attempts"
+    job.lease_expires_at = None
+    job.locked_by = None
+    kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.id == job.kb_id).first()
+    if kb:
+        kb.status = models.KBStatus.failed
+
+
+class PostgresIngestBroker:
+    """Uses kb_ingest_jobs itself as the queue, claimed with FOR UPDATE SKIP LOCKED."""
+
+    def __init__(self, session_factory: Callable[[], Session] = BackgroundSession):
+        self._session_factory = session_factory
+
+    def enqueue(self, job_id: str, delay_seconds: float = 0) -> None:
+        db = self._session_factory()
+        try:
+            job = db.query(models.KBIngestJob).filter(models.KBIngestJob.id == uuid.UUID(str(job_id))).first()
+            if job:
+                job.state = models.JobState.queued
+                job.available_at = _utcnow() + timedelta(seconds=delay_seconds) if delay_seconds else None
+                db.commit()
+        finally:
+            db.close()
+
+    def claim(self, consumer: str, block_seconds: float = 5) -> Optional[IngestLease]:
+        deadline = time.monotonic() + block_seconds
+        while True:
+            db = self._session_factory()
+            try:
+                now = _utcnow()
+                job = (
+                    db.query(models.KBIngestJob)
+                    .filter(
+                        models.KBIngestJob.state == models.JobState.queued,
+                        or_(models.KBIngestJob.available_at.is_(None), models.KBIngestJob.available_at <= now),
+                    )
+                    .order_by(models.KBIngestJob.created_at)
+                    .with_for_update(skip_locked=True)
+                    .first()
+                )
+                if job:
+                    return _lease_job(db, job, consumer)
+                db.rollback()
+            finally:
+                db.close()
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(min(1.0, max(deadline - time.monotonic(), 0)))
+
+    def touch(self, lease: IngestLease, consumer: str) -> None:
+        db = self._session_factory()
+        try:
+            _extend_lease(db, lease.job_id, consumer)
+        finally:
+            db.close()
+
+    def ack(self, lease: IngestLease) -> None:
+        db = self._session_factory()
+        try:
+            _release_job(db, lease.job_id, None)
+        finally:
+            db.close()
+
+    def retry(self, lease: IngestLease, delay_seconds: float) -> None:
+        db = self._session_factory()
+        try:
+            _release_job(db, lease.job_id, _utcnow() + timedelta(seconds=delay_seconds))
+        finally:
+            db.close()
+
+    def recover_stale_jobs(self) -> int:
+        db = self._session_factory()
+        try:
+            jobs = _expired_running_jobs(db)
+            for job in jobs:
+                if (job.attempts or 0) >= KB_INGEST_MAX_ATTEMPTS:
+                    _fail_exhausted(db, job)
+                else:
+                    job.state = models.JobState.queued
+                    job.available_at = None
+                    job.lease_expires_at = None
+                    job.locked_by = None
+            db.commit()
+            if jobs:
+                logger.warning("ingest_jobs_recovered backend=postgres count=%s", len(jobs))
+            return len(jobs)
+        finally:
+            db.close()
+
+
+class RedisStreamIngestBroker:
+    """Redis Streams consumer group; pending entries idle past the visibility timeout are reclaimed."""
+
+    def __init__(self, session_factory: Callable[[], Session] = BackgroundSession):
+        self._session_factory = session_factory
+        self._stream = cache_key("ingest", "jobs")
+        self._delayed = cache_key("ingest", "delayed")
+        self._group_ready = False
+
+    def _client(self):
+        client = get_redis()
+        if client is None:
+            raise RuntimeError("REDIS_URL must be set for KB_INGEST_BACKEND=redis")
+        if not self._group_ready:
+            try:
+                client.xgroup_create(self._stream, KB_INGEST_STREAM_GROUP, id="0", mkstream=True)
+            except Exception as exc:
+                if "BUSYGROUP" not in str(exc):
+                    raise
+            self._group_ready = True
+        return client
+
+    def enqueue(self, job_id: str, delay_seconds: float = 0) -> None:
+        client = self._client()
+        if delay_seconds > 0:
+            client.zadd(self._delayed, {job_id: time.time() + delay_seconds})
+        else:
+            client.xadd(self._stream, {"job_id": job_id})
+
+    def _promote_due(self, client) -> None:
+        for job_id in client.zrangebyscore(self._delayed, 0, time.time(), start=0, num=100):
+            if client.zrem(self._delayed, job_id):
+                client.xadd(self._stream, {"job_id": job_id})
+
+    def _lease_from_message(self, message_id: str, fields: dict, consumer: str) -> Optional[IngestLease]:
+        job_id = fields.get("job_id")
+        db = self._session_factory()
+        try:
+            job = db.query(models.KBIngestJob).filter(models.KBIngestJob.id == uuid.UUID(str(job_id))).first() if job_id else None
+            leased_elsewhere = (
+                job is not None
+                and job.state == models.JobState.running
+                and job.locked_by not in (None, consumer)
+                and job.lease_expires_at is not None
+                and job.lease_expires_at > _utcnow()
+            )
+            if not job or leased_elsewhere or job.state in (models.JobState.succeeded, models.JobState.failed):
+                client = self._client()
+                client.xack(self._stream, KB_INGEST_STREAM_GROUP, message_id)
+                client.xdel(self._stream, message_id)
+                return None
+            lease = _lease_job(db, job, consumer)
+            return IngestLease(job_id=lease.job_id, attempt=lease.attempt, token=message_id)
+        finally:
+            db.close()
+
+    def claim(self, consumer: str, block_seconds: float = 5) -> Optional[IngestLease]:
+        client = self._client()
+        self._promote_due(client)
+        reclaimed = client.xautoclaim(
+            self._stream,
+            KB_INGEST_STREAM_GROUP,
+            consumer,
+            min_idle_time=KB_INGEST_VISIBILITY_TIMEOUT_SECONDS * 1000,
+            start_id="0-0",
+            count=1,
+        )
+        messages = reclaimed[1] if reclaimed else []
+        if messages:
+            logger.warning("ingest_job_reclaimed message_id=%s consumer=%s", messages[0][0], consumer)
+        else:
+            response = client.xreadgroup(
+                KB_INGEST_STREAM_GROUP,
+                consumer,
+                {self._stream: ">"},
+                count=1,
+                block=int(block_seconds * 1000),
+            )
+            messages = response[0][1] if response else []
+        if not messages:
+            return None
+        message_id, fields = messages[0]
+        return self._lease_from_message(message_id, fields, consumer)
+
+    def touch(self, lease: IngestLease, consumer: str) -> None:
+        client = self._client()
+        client.xclaim(self._stream, KB_INGEST_STREAM_GROUP, consumer, 0, [lease.token], justid=True)
+        db = self._session_factory()
+        try:
+            _extend_lease(db, lease.job_id, consumer)
+        finally:
+            db.close()
+
+    def ack(self, lease: IngestLease) -> None:
+        client = self._client()
+        client.xack(self._stream, KB_INGEST_STREAM_GROUP, lease.token)
+        client.xdel(self._stream, lease.token)
+        db = self._session_factory()
+        try:
+            _release_job(db, lease.job_id, None)
+        finally:
+            db.close()
+
+    def retry(self, lease: IngestLease, delay_seconds: float) -> None:
+        db = self._session_factory()
+        try:
+            _release_job(db, lease.job_id, _utcnow() + timedelta(seconds=delay_seconds))
+        finally:
+            db.close()
+        client = self._client()
+        client.zadd(self._delayed, {lease.job_id: time.time() + delay_seconds})
+        client.xack(self._stream, KB_INGEST_STREAM_GROUP, lease.token)
+        client.xdel(self._stream, lease.token)
+
+    def recover_stale_jobs(self) -> int:
+        # Jobs still pending in the stream are reclaimed by xautoclaim; this
+        # covers rows whose stream entry is gone (e.g. enqueued in-process).
+        db = self._session_factory()
+        try:
+            jobs = _expired_running_jobs(db)
+            requeue: list[str] = []
+            for job in jobs:
+                if (job.attempts or 0) >= KB_INGEST_MAX_ATTEMPTS:
+                    _fail_exhausted(db, job)
+                else:
+                    job.state = models.JobState.queued
+                    job.lease_expires_at = None
+                    job.locked_by = None
+                    requeue.append(str(job.id))
+            db.commit()
+        finally:
+            db.close()
+        for job_id in requeue:
+            self.enqueue(job_id)
+        if jobs:
+            logger.warning("ingest_jobs_recovered backend=redis count=%s", len(jobs))
+        return len(jobs)
+
+
+_broker = None
+
+
+def get_ingest_broker():
+    global _broker
+    if _broker is None:
+        if KB_INGEST_BACKEND == "redis":
+            _broker = RedisStreamIngestBroker()
+        elif KB_INGEST_BACKEND == "postgres":
+            _broker = PostgresIngestBroker()
+        else:
+            raise RuntimeError(f"KB_INGEST_BACKEND={KB_INGEST_BACKEND!r} has no durable broker")
+    return _broker
+
+
+def uses_durable_queue() -> bool:
+    return KB_INGEST_BACKEND in {"redis", "postgres"}
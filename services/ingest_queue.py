@@ -3,15 +3,23 @@ import logging
 import os
 import tempfile
 import threading
+import time
 from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from threading import BoundedSemaphore
 from typing import Optional
 
 from db import models
 from db.database import BackgroundSession
 from services.http_client import close_http_clients
+from services.ingest_broker import KB_INGEST_BACKEND, get_ingest_broker, uses_durable_queue
+from services.ingest_scheduler import (
+    BULK_LANE,
+    INTERACTIVE_LANE,
+    IngestScheduler,
+    ScheduledJob,
+    parse_tenant_weights,
+)
 from services.ingest_worker import process_kb_ingest_job
 from services.redis_client import close_redis_clients
 
@@ -20,10 +28,19 @@ logger = logging.getLogger(__name__)
 
 _MAX_WORKERS = int(os.getenv("KB_INGEST_WORKERS", "1"))
 _MAX_PENDING = int(os.getenv("KB_INGEST_QUEUE_SIZE", "25"))
+_MAX_BULK_PENDING = int(os.getenv("KB_INGEST_BULK_QUEUE_SIZE", "500"))
+_MAX_TENANT_PENDING = int(os.getenv("KB_INGEST_TENANT_QUEUE_SIZE", "10"))
+_MAX_TENANT_BULK_PENDING = int(os.getenv("KB_INGEST_TENANT_BULK_QUEUE_SIZE", "250"))
 _SPOOL_DIR = Path(os.getenv("KB_INGEST_SPOOL_DIR", "/tmp/helpdeskai-ingest"))
 
 _executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix="kb-ingest")
-_slots = BoundedSemaphore(_MAX_PENDING)
+# Each accepted job submits one _run_next call; the scheduler decides which
+# job that call runs, so interactive uploads overtake queued bulk retrains.
+_scheduler = IngestScheduler(
+    lane_limits={INTERACTIVE_LANE: _MAX_PENDING, BULK_LANE: _MAX_BULK_PENDING},
+    tenant_limits={INTERACTIVE_LANE: _MAX_TENANT_PENDING, BULK_LANE: _MAX_TENANT_BULK_PENDING},
+    weights=parse_tenant_weights(os.getenv("KB_INGEST_TENANT_WEIGHTS")),
+)
 
 
 def _mark_job_failed(job_id: str, error: str) -> None:
@@ -60,17 +77,14 @@ def _write_spool_file(job_id: str, text: str) -> str:
         return handle.name
 
 
-def _release_slot(future: Future) -> None:
+def _log_worker_failure(future: Future) -> None:
     try:
-        try:
-            exc = future.exception()
-        except BaseException as exc:
-            logger.error("ingest_worker_future_failed", exc_info=(type(exc), exc, exc.__traceback__))
-            return
-        if exc:
-            logger.error("ingest_worker_crashed", exc_info=(type(exc), exc, exc.__traceback__))
-    finally:
-        _slots.release()
+        exc = future.exception()
+    except BaseException as exc:
+        logger.error("ingest_worker_future_failed", exc_info=(type(exc), exc, exc.__traceback__))
+        return
+    if exc:
+        logger.error("ingest_worker_crashed", exc_info=(type(exc), exc, exc.__traceback__))
 
 
 # Cache one event loop per thread instead of creating one per job
@@ -99,23 +113,64 @@ def _run_job(job_id: str, spool_path: Optional[str]) -> None:
     loop.run_until_complete(_run_async_job(job_id, spool_path))
 
 
-def enqueue_kb_ingest(job_id: str, transient_text: Optional[str] = None) -> bool:
-    if not _slots.acquire(blocking=False):
-        message = "Knowledge ingestion queue is full. Please try again shortly."
-        _mark_job_failed(job_id, message)
-        logger.warning("ingest_queue_full job_id=%s", job_id)
+def _run_next() -> None:
+    job = _scheduler.pop()
+    if job is None:
+        return
+    logger.info(
+        "ingest_job_dispatched job_id=%s lane=%s user_id=%s wait_ms=%.0f",
+        job.job_id,
+        job.lane,
+        job.user_id,
+        (time.monotonic() - job.enqueued_at) * 1000,
+    )
+    _run_job(job.job_id, job.payload)
+
+
+def ingest_queue_stats() -> dict:
+    if uses_durable_queue():
+        return {"backend": KB_INGEST_BACKEND, "lanes": {}}
+    return {"backend": KB_INGEST_BACKEND, "workers": _MAX_WORKERS, "lanes": _scheduler.stats()}
+
+
+def _enqueue_durable(job_id: str) -> bool:
+    # Durable workers may run on other hosts, so they re-read the stored
+    # source instead of a local spool file.
+    try:
+        get_ingest_broker().enqueue(job_id)
+        logger.info("ingest_job_enqueued job_id=%s backend=%s", job_id, KB_INGEST_BACKEND)
+        return True
+    except Exception as exc:
+        _mark_job_failed(job_id, str(exc))
+        logger.exception("failed_to_enqueue_ingest_job job_id=%s backend=%s", job_id, KB_INGEST_BACKEND)
         return False
 
+
+def enqueue_kb_ingest(
+    job_id: str,
+    transient_text: Optional[str] = None,
+    user_id: Optional[int] = None,
+    lane: str = INTERACTIVE_LANE,
+) -> bool:
+    if uses_durable_queue():
+        return _enqueue_durable(job_id)
+
     spool_path: Optional[str] = None
     try:
         if transient_text is not None:
             spool_path = _write_spool_file(job_id, transient_text)
-        future = _executor.submit(_run_job, job_id, spool_path)
-        future.add_done_callback(_release_slot)
-        logger.info("ingest_job_enqueued job_id=%s", job_id)
+        if not _scheduler.push(ScheduledJob(job_id=job_id, user_id=user_id, lane=lane, payload=spool_path)):
+            if spool_path:
+                Path(spool_path).unlink(missing_ok=True)
+            message = "Knowledge ingestion queue is full. Please try again shortly."
+            _mark_job_failed(job_id, message)
+            logger.warning("ingest_queue_full job_id=%s lane=%s user_id=%s", job_id, lane, user_id)
+            return False
+        future = _executor.submit(_run_next)
+        future.add_done_callback(_log_worker_failure)
+        logger.info("ingest_job_enqueued job_id=%s lane=%s user_id=%s", job_id, lane, user_id)
         return True
     except Exception as exc:
-        _slots.release()
         if spool_path:
             try:
                 Path(spool_path).unlink(missing_ok=True)
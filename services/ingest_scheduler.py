@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+
+INTERACTIVE_LANE = "interactive"
+BULK_LANE = "bulk"
+LANES = (INTERACTIVE_LANE, BULK_LANE)
+
+KB_INGEST_BULK_MAX_WAIT_SECONDS = float(os.getenv("KB_INGEST_BULK_MAX_WAIT_SECONDS", "300"))
+
+
+def parse_tenant_weights(raw: Optional[str]) -> dict[int, int]:
+    weights: dict[int, int] = {}
+    for item in (raw or "").split(","):
+        user_id, _, weight = item.strip().partition(":")
+        if user_id.strip().isdigit() and weight.strip().isdigit():
+            weights[int(user_id)] = max(int(weight), 1)
+    return weights
+
+
+@dataclass
+class ScheduledJob:
+    job_id: str
+    user_id: Optional[int]
+    lane: str
+    payload: Any = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class _Lane:
+    def __init__(self, max_pending: int, max_per_tenant: int):
+        self.max_pending = max_pending
+        self.max_per_tenant = max_per_tenant
+        self.queues: dict[Optional[int], deque[ScheduledJob]] = {}
+        self.order: deque[Optional[int]] = deque()
+        self.credits = 0
+        self.depth = 0
+        self.dispatched = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def oldest_enqueued_at(self) -> Optional[float]:
+        heads = [queue[0].enqueued_at for queue in self.queues.values() if queue]
+        return min(heads) if heads else None
+
+
+class IngestScheduler:
+    """Strict-priority lanes with weighted round-robin across tenants inside each lane.
+
+    Bulk work is still served ahead of interactive work once its oldest job has
+    waited longer than KB_INGEST_BULK_MAX_WAIT_SECONDS, so retrains cannot starve.
+    """
+
+    def __init__(
+        self,
+        lane_limits: dict[str, int],
+        tenant_limits: dict[str, int],
+        weights: Optional[dict[int, int]] = None,
+        bulk_max_wait_seconds: float = KB_INGEST_BULK_MAX_WAIT_SECONDS,
+    ):
+        self._lock = threading.Lock()
+        self._lanes = {lane: _Lane(lane_limits[lane], tenant_limits[lane]) for lane in LANES}
+        self._weights = weights or {}
+        self._bulk_max_wait_seconds = bulk_max_wait_seconds
+
+    def push(self, job: ScheduledJob) -> bool:
+        with self._lock:
+            lane = self._lanes[job.lane]
+            queue = lane.queues.get(job.user_id)
+            if lane.depth >= lane.max_pending or (queue is not None and len(queue) >= lane.max_per_tenant):
+                return False
+            if queue is None:
+                queue = lane.queues[job.user_id] = deque()
+                lane.order.append(job.user_id)
+            queue.append(job)
+            lane.depth += 1
+            return True
+
+    def _next_lane(self, now: float) -> Optional[_Lane]:
+        interactive = self._lanes[INTERACTIVE_LANE]
+        bulk = self._lanes[BULK_LANE]
+        bulk_oldest = bulk.oldest_enqueued_at()
+        if bulk_oldest is not None and now - bulk_oldest >= self._bulk_max_wait_seconds:
+            return bulk
+        if interactive.depth:
+            return interactive
+        return bulk if bulk.depth else None
+
+    def pop(self) -> Optional[ScheduledJob]:
+        with self._lock:
+            now = time.monotonic()
+            lane = self._next_lane(now)
+            if lane is None:
+                return None
+            user_id = lane.order[0]
+            queue = lane.queues[user_id]
+            job = queue.popleft()
+            lane.depth -= 1
+            lane.credits += 1
+            if not queue:
+                del lane.queues[user_id]
+                lane.order.popleft()
+                lane.credits = 0
+            elif lane.credits >= self._weights.get(user_id, 1):
+                lane.order.rotate(-1)
+                lane.credits = 0
+
+            waited = now - job.enqueued_at
+            lane.dispatched += 1
+            lane.wait_total += waited
+            lane.wait_max = max(lane.wait_max, waited)
+            return job
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            now = time.monotonic()
+            result: dict[str, dict[str, Any]] = {}
+            for name, lane in self._lanes.items():
+                oldest = lane.oldest_enqueued_at()
+                result[name] = {
+                    "depth": lane.depth,
+                    "tenants": len(lane.queues),
+                    "max_pending": lane.max_pending,
+                    "oldest_wait_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+                    "dispatched": lane.dispatched,
+                    "avg_wait_seconds": round(lane.wait_total / lane.dispatched, 3) if lane.dispatched else 0.0,
+                    "max_wait_seconds": round(lane.wait_max, 3),
+                }
+            return result
@@ -1,54 +1,108 @@
+import argparse
+import asyncio
 import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import itertools
+import time
 import anyio
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from db.database import BackgroundSession
 from db import models
-from services.rag_service import aindex_kb_text
-from services.kb_limits import enforce_text_limit
+from services.rag_service import IndexStats, aindex_kb_text
+from services.kb_limits import LimitedText, enforce_text_limit
 from services.web_scraper import scrape_url_content
-from services.file_parser import extract_text_from_file
+from services.file_parser import iter_text_from_file
 from services.kb_source_storage import download_kb_source
 from services.vector_store import delete_for_kb
+from services.http_client import close_http_clients
+from services.redis_client import close_redis_clients
+from services.semantic_cache import abump_namespace_version
+from services.ingest_broker import (
+    KB_INGEST_MAX_ATTEMPTS,
+    KB_INGEST_VISIBILITY_TIMEOUT_SECONDS,
+    IngestLease,
+    get_ingest_broker,
+    retry_delay_seconds,
+)
 from dotenv import load_dotenv
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+KB_INGEST_INCREMENTAL = os.getenv("KB_INGEST_INCREMENTAL", "true").strip().lower() in {"1", "true", "yes", "on"}
+KB_INGEST_SPOOL_READ_CHARS = int(os.getenv("KB_INGEST_SPOOL_READ_CHARS", str(64 * 1024)))
+
+
+def _iter_spool_file(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8") as handle:
+        while segment := handle.read(KB_INGEST_SPOOL_READ_CHARS):
+            yield segment
+
+
+def _skip_blank_prefix(segments: Iterable[str]) -> Optional[Iterator[str]]:
+    """Return the segments from the first non-blank one, or None if all are blank."""
+    remaining = iter(segments)
+    for segment in remaining:
+        if segment.strip():
+            return itertools.chain([segment], remaining)
+    return None
+
+
+async def _discard_partial_index(namespace: str, kb_id: str) -> None:
+    # Extraction streams into indexing, so a size overflow or extraction error
+    # can fire after some batches were upserted; a failed KB must not stay
+    # partly searchable.
+    try:
+        await anyio.to_thread.run_sync(delete_for_kb, namespace, kb_id)
+        await abump_namespace_version(namespace)
+    except Exception:
+        logger.exception("failed_to_discard_partial_index namespace=%s kb_id=%s", namespace, kb_id)
+
 
 async def process_kb_ingest_job(
     job_id: str,
     transient_text: Optional[str] = None,
     transient_text_path: Optional[str] = None,
-) -> None:
+) -> bool:
     """
     Worker function to process a KB ingest job.
     - Looks up the job and KB
     - Marks job running, then succeeded/failed
     - Sets KB status accordingly
     - Does NOT store chunks or embeddings in Postgres
-    - Writes embeddings to the configured vector store
+    - Writes embeddings to the configured vector store; in incremental mode only
+      new chunks are embedded and chunks missing from the new text are deleted
 
     transient_text_path: temporary spool file supplied by the ingest queue.
+    Returns True when the job succeeded.
     """
     db: Session = BackgroundSession()
+    # Set once vectors for this KB may have been written or deleted.
+    indexed_namespace: Optional[str] = None
+    indexed_kb_id: Optional[str] = None
     try:
         job = db.query(models.KBIngestJob).filter(models.KBIngestJob.id == job_id).first()
         if not job:
-            return
+            return False
         kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.id == job.kb_id).first()
         if not kb:
             job.state = models.JobState.failed
             job.error = "KB not found"
             db.commit()
-            return
+            return False
 
         # Mark running
         job.state = models.JobState.running
         job.processed_chunks = 0
         job.total_chunks = None
+        job.skipped_chunks = None
         db.commit()
 
         # Read minimal info for vector upsert
@@ -56,26 +110,36 @@ async def process_kb_ingest_job(
         config = db.query(models.AgentConfig).filter(models.AgentConfig.agent_id == kb.agent_id).first()
         namespace = config.vector_store_namespace if config else None
 
-        text_content: Optional[str] = None
-        
+        segments: Optional[Iterable[str]] = None
+        size_hint: Optional[int] = None
+        limited: Optional[LimitedText] = None
+
         if transient_text_path:
-            text_content = Path(transient_text_path).read_text(encoding="utf-8")
+            segments = _iter_spool_file(transient_text_path)
+            size_hint = os.path.getsize(transient_text_path)
         elif transient_text is not None and len(transient_text.strip()) > 0:
-            text_content = transient_text
+            segments = [transient_text]
+            size_hint = len(transient_text)
         elif kb.source_type == models.KBSourceType.url and kb.source_uri:
             scraped_data = await scrape_url_content(kb.source_uri)
             text_content = scraped_data.get("text", "")
             kb.title = kb.title or scraped_data.get("title")
             kb.extracted_size_bytes = enforce_text_limit(text_content)
             db.commit()
+            segments = [text_content]
+            size_hint = len(text_content)
         elif kb.source_storage_url:
             source_bytes = await download_kb_source(kb.source_storage_url)
             filename = kb.original_filename or kb.title or f"{kb.id}.txt"
-            text_content = await anyio.to_thread.run_sync(extract_text_from_file, source_bytes, filename)
-            kb.extracted_size_bytes = enforce_text_limit(text_content)
-            db.commit()
+            # Pages are chunked as they are extracted; the limit is enforced while streaming.
+            limited = LimitedText(f"{page}\n\n" for page in iter_text_from_file(source_bytes, filename))
+            segments = limited
+            if not filename.lower().endswith((".pdf", ".docx")):
+                size_hint = len(source_bytes)
 
-        if not text_content or len(text_content.strip()) == 0:
+        if segments is not None:
+            segments = await anyio.to_thread.run_sync(_skip_blank_prefix, segments)
+        if segments is None:
             raise ValueError("No text content extracted for KB")
 
         if not agent:
@@ -83,23 +147,33 @@ async def process_kb_ingest_job(
         if not namespace:
             raise ValueError("Missing vector store namespace")
 
-        await anyio.to_thread.run_sync(lambda: delete_for_kb(namespace, str(kb.id)))
+        indexed_namespace, indexed_kb_id = namespace, str(kb.id)
+        if not KB_INGEST_INCREMENTAL:
+            await anyio.to_thread.run_sync(lambda: delete_for_kb(namespace, str(kb.id)))
 
-        def update_progress(done_chunks: int, total_chunks: int) -> None:
+        def update_progress(done_chunks: int, total_chunks: Optional[int]) -> None:
             job.total_chunks = total_chunks
             job.processed_chunks = done_chunks
             kb.chunk_count = done_chunks
             db.commit()
 
+        index_stats = IndexStats()
         chunk_count = await aindex_kb_text(
             db=db,
             user_id=agent.user_id,
             agent_id=str(agent.id),
             kb_id=str(kb.id),
             namespace=namespace,
-            text_value=text_content,
+            text_value=segments,
             on_batch=update_progress,
+            incremental=KB_INGEST_INCREMENTAL,
+            size_hint=size_hint,
+            stats=index_stats,
+            embedding_model=config.embedding_model,
         )
+        job.skipped_chunks = index_stats.skipped
+        if limited is not None:
+            kb.extracted_size_bytes = limited.size
 
         # Update KB with chunk count
         kb.chunk_count = chunk_count
@@ -109,8 +183,11 @@ async def process_kb_ingest_job(
         job.state = models.JobState.succeeded
         job.error = None
         db.commit()
+        return True
     except Exception as e:
         logger.exception("kb_ingest_job_failed job_id=%s", job_id)
+        if indexed_namespace and indexed_kb_id:
+            await _discard_partial_index(indexed_namespace, indexed_kb_id)
         try:
             job = db.query(models.KBIngestJob).filter(models.KBIngestJob.id == job_id).first()
             if job:
@@ -122,6 +199,7 @@ async def process_kb_ingest_job(
             db.commit()
         except SQLAlchemyError:
             db.rollback()
+        return False
     finally:
         if transient_text_path:
             try:
@@ -129,3 +207,115 @@ async def process_kb_ingest_job(
             except Exception:
                 logger.warning("failed_to_remove_ingest_spool path=%s", transient_text_path)
         db.close()
+
+
+def _keep_lease_alive(broker, lease: IngestLease, consumer: str, stop: threading.Event) -> None:
+    interval = max(KB_INGEST_VISIBILITY_TIMEOUT_SECONDS / 3, 1)
+    while not stop.wait(interval):
+        try:
+            broker.touch(lease, consumer)
+        except Exception:
+            logger.warning("ingest_lease_heartbeat_failed job_id=%s", lease.job_id, exc_info=True)
+
+
+def _process_lease(broker, lease: IngestLease, consumer: str, loop: asyncio.AbstractEventLoop) -> None:
+    heartbeat_stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=_keep_lease_alive,
+        args=(broker, lease, consumer, heartbeat_stop),
+        name=f"kb-ingest-lease-{lease.job_id}",
+        daemon=True,
+    )
+    heartbeat.start()
+    try:
+        succeeded = loop.run_until_complete(process_kb_ingest_job(lease.job_id))
+    finally:
+        heartbeat_stop.set()
+        heartbeat.join()
+
+    if succeeded or lease.attempt >= KB_INGEST_MAX_ATTEMPTS:
+        broker.ack(lease)
+        return
+    delay = retry_delay_seconds(lease.attempt)
+    broker.retry(lease, delay)
+    logger.warning("ingest_job_retry_scheduled job_id=%s attempt=%s delay_s=%.1f", lease.job_id, lease.attempt, delay)
+
+
+def run_ingest_worker(consumer: str, stop: threading.Event) -> None:
+    broker = get_ingest_broker()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    next_recovery = 0.0
+    logger.info("ingest_worker_started consumer=%s", consumer)
+    try:
+        while not stop.is_set():
+            try:
+                if time.monotonic() >= next_recovery:
+                    broker.recover_stale_jobs()
+                    next_recovery = time.monotonic() + KB_INGEST_VISIBILITY_TIMEOUT_SECONDS / 2
+                lease = broker.claim(consumer)
+            except Exception:
+                logger.exception("ingest_worker_claim_failed consumer=%s", consumer)
+                stop.wait(5)
+                continue
+            if lease is None:
+                continue
+            logger.info("ingest_job_claimed job_id=%s attempt=%s consumer=%s", lease.job_id, lease.attempt, consumer)
+            try:
+                _process_lease(broker, lease, consumer, loop)
+            except Exception:
+                logger.exception("ingest_worker_job_crashed job_id=%s", lease.job_id)
+    finally:
+        loop.run_until_complete(close_http_clients(close_all=True))
+        loop.run_until_complete(close_redis_clients(close_all=True))
+        loop.close()
+        logger.info("ingest_worker_stopped consumer=%s", consumer)
+
+
+def _configure_logging() -> None:
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+    )
+
+
+def _worker_process(index: int) -> None:
+    _configure_logging()
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_args: stop.set())
+    run_ingest_worker(f"{socket.gethostname()}-{os.getpid()}-{index}", stop)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run knowledge base ingest workers against the durable queue.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("KB_INGEST_WORKER_PROCESSES", "1")),
+        help="Number of worker processes to run.",
+    )
+    args = parser.parse_args(argv)
+    if args.workers <= 1:
+        _worker_process(0)
+        return
+
+    _configure_logging()
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_worker_process, args=(index,), name=f"kb-ingest-{index}") for index in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    def _stop_children(*_args) -> None:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, _stop_children)
+    signal.signal(signal.SIGINT, _stop_children)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import os
-from typing import Protocol
+from typing import Iterable, Iterator, Protocol
 
 
 class AsyncUploadFile(Protocol):
@@ -37,3 +37,22 @@ def enforce_text_limit(text: str, max_bytes: int = MAX_KB_TEXT_BYTES) -> int:
             f"Extracted text is too large. Maximum extracted text size is {max_bytes // (1024 * 1024)}MB."
         )
     return size
+
+
+class LimitedText:
+    """Iterate text segments while enforcing MAX_KB_TEXT_BYTES; size holds the bytes seen so far."""
+
+    def __init__(self, segments: Iterable[str], max_bytes: int = MAX_KB_TEXT_BYTES):
+        self.segments = segments
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def __iter__(self) -> Iterator[str]:
+        for segment in self.segments:
+            self.size += len(segment.encode("utf-8"))
+            if self.size > self.max_bytes:
+                raise PayloadTooLargeError(
+                    "Extracted text is too large. "
+                    f"Maximum extracted text size is {self.max_bytes // (1024 * 1024)}MB."
+                )
+            yield segment
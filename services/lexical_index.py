@@ -0,0 +1,188 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+
+from services.vector_store import iter_namespace_texts
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_TTL_SECONDS = float(os.getenv("LEXICAL_INDEX_TTL_SECONDS", "300"))
+LEXICAL_INDEX_MAX_NAMESPACES = int(os.getenv("LEXICAL_INDEX_MAX_NAMESPACES", "64"))
+LEXICAL_INDEX_BUILD_THREADS = int(os.getenv("LEXICAL_INDEX_BUILD_THREADS", "2"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Compound tokens (SKU-123, ERR_404, v2.1) are indexed whole and by their parts.
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_PARTS = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = _PARTS.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, texts: Iterable[str]):
+        self.texts: List[str] = []
+        postings: dict[str, dict[int, int]] = {}
+        lengths: List[int] = []
+        for doc, text in enumerate(texts):
+            self.texts.append(text)
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[doc] = counts.get(doc, 0) + 1
+        self.doc_lengths = np.asarray(lengths, dtype=np.float32)
+        avg_length = float(self.doc_lengths.mean()) if lengths else 0.0
+        self.length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / (avg_length or 1.0))
+        total = len(self.texts)
+        self.postings: dict[str, tuple[np.ndarray, np.ndarray, float]] = {}
+        for token, counts in postings.items():
+            docs = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+            tfs = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            idf = math.log(1 + (total - len(counts) + 0.5) / (len(counts) + 0.5))
+            self.postings[token] = (docs, tfs, idf)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search(self, query: str, top_k: int) -> List[tuple[str, float]]:
+        if not self.texts:
+            return []
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            docs, tfs, idf = posting
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + self.length_norm[docs])
+        matched = int(np.count_nonzero(scores))
+        count = min(top_k, matched)
+        if count <= 0:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top])]
+        return [(self.texts[doc], float(scores[doc])) for doc in top]
+
+
+class _CachedIndex:
+    def __init__(self, index: BM25Index, built_at: float, version: Optional[int]):
+        self.index = index
+        self.built_at = built_at
+        self.version = version
+
+    def is_fresh(self, version: Optional[int]) -> bool:
+        # The namespace version changes on every ingest, so when callers have
+        # one it is the only freshness signal; the TTL covers callers without.
+        if version is not None:
+            return self.version == version
+        return time.monotonic() - self.built_at < LEXICAL_INDEX_TTL_SECONDS
+
+
+_cache: "OrderedDict[str, _CachedIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+# Namespace -> version of the build queued or running for it.
+_building: dict[str, Optional[int]] = {}
+_build_pool: Optional[ThreadPoolExecutor] = None
+
+
+def invalidate_lexical_index(namespace: str) -> None:
+    with _cache_lock:
+        _cache.pop(namespace, None)
+
+
+def _build_index(namespace: str, version: Optional[int]) -> None:
+    try:
+        started = time.monotonic()
+        index = BM25Index(text for _, text in iter_namespace_texts(namespace))
+        logger.info(
+            "lexical_index_built namespace=%s docs=%s terms=%s build_ms=%.0f",
+            namespace,
+            len(index),
+            len(index.postings),
+            (time.monotonic() - started) * 1000,
+        )
+        with _cache_lock:
+            current = _cache.get(namespace)
+            # A slower build of an older version must not replace a newer one.
+            if current is None or current.version is None or version is None or version >= current.version:
+                _cache[namespace] = _CachedIndex(index, time.monotonic(), version)
+                _cache.move_to_end(namespace)
+            while len(_cache) > LEXICAL_INDEX_MAX_NAMESPACES:
+                _cache.popitem(last=False)
+    except Exception:
+        logger.warning("lexical_index_build_failed namespace=%s", namespace, exc_info=True)
+    finally:
+        with _cache_lock:
+            if _building.get(namespace, -1) == version:
+                _building.pop(namespace, None)
+
+
+def schedule_lexical_index_build(namespace: str, version: Optional[int] = None) -> None:
+    """Queue a background build of the namespace's index unless one for this version is pending."""
+    global _build_pool
+    with _cache_lock:
+        if namespace in _building and _building[namespace] == version:
+            return
+        _building[namespace] = version
+        if _build_pool is None:
+            _build_pool = ThreadPoolExecutor(max_workers=LEXICAL_INDEX_BUILD_THREADS, thread_name_prefix="lexical-index")
+    _build_pool.submit(_build_index, namespace, version)
+
+
+def get_lexical_index(namespace: str, version: Optional[int] = None) -> Optional[BM25Index]:
+    """Return the namespace's cached BM25 index, or None while it is being built.
+
+    Builds scan every stored chunk, so they run on a background pool rather
+    than on the retrieval path. An index from an older namespace version is
+    not served; one that only outlived the TTL is served while it rebuilds.
+    """
+    with _cache_lock:
+        cached = _cache.get(namespace)
+        if cached is not None:
+            _cache.move_to_end(namespace)
+    if cached is not None and cached.is_fresh(version):
+        return cached.index
+    schedule_lexical_index_build(namespace, version)
+    if cached is not None and version is None:
+        return cached.index
+    return None
+
+
+def lexical_search(namespace: str, query: str, top_k: int, version: Optional[int] = None) -> List[tuple[str, float]]:
+    index = get_lexical_index(namespace, version)
+    return index.search(query, top_k) if index is not None else []
+
+
+def reciprocal_rank_fusion(
+    result_lists: Iterable[List[tuple[str, float]]],
+    top_k: int,
+    k: int = 60,
+    key: Optional[Callable[[str], str]] = None,
+) -> List[tuple[str, float]]:
+    """Fuse ranked (text, score) lists by summing 1 / (k + rank) per text."""
+    key = key or (lambda text: text)
+    fused: dict[str, float] = {}
+    texts: dict[str, str] = {}
+    for results in result_lists:
+        for rank, (text, _) in enumerate(results, start=1):
+            text_key = key(text)
+            texts.setdefault(text_key, text)
+            fused[text_key] = fused.get(text_key, 0.0) + 1.0 / (k + rank)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [(texts[text_key], score) for text_key, score in ranked]
@@ -0,0 +1,96 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, Optional
+
+import anyio
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LOCAL_EMBED_PREFIX = "local:"
+# Comma-separated sentence-transformers model ids agents may select as "local:<model>".
+LOCAL_EMBED_MODELS = [name.strip() for name in os.getenv("LOCAL_EMBED_MODELS", "").split(",") if name.strip()]
+LOCAL_EMBED_PROCESSES = int(os.getenv("LOCAL_EMBED_PROCESSES", str(min(2, os.cpu_count() or 1))))
+LOCAL_EMBED_BATCH_SIZE = int(os.getenv("LOCAL_EMBED_BATCH_SIZE", "32"))
+# "torch" or "onnx"; ONNX needs onnxruntime and is usually faster on CPU.
+LOCAL_EMBED_BACKEND = os.getenv("LOCAL_EMBED_BACKEND", "onnx").strip().lower()
+LOCAL_EMBED_THREADS_PER_PROCESS = int(os.getenv("LOCAL_EMBED_THREADS_PER_PROCESS", "0"))
+
+# Prompt names sentence-transformers models commonly define per retrieval side.
+_TASK_PROMPTS = {
+    "retrieval.query": ("query",),
+    "retrieval.passage": ("document", "passage"),
+}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_worker_models: dict[str, Any] = {}
+
+
+def is_local_model(name: Optional[str]) -> bool:
+    return bool(name and name.startswith(LOCAL_EMBED_PREFIX))
+
+
+def local_model_id(name: str) -> str:
+    return name[len(LOCAL_EMBED_PREFIX):]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Each worker loads its own copy of the model; spawn keeps them free of
+        # the API's threads and connection pools.
+        _pool = ProcessPoolExecutor(
+            max_workers=LOCAL_EMBED_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def _load_model(model_id: str):
+    model = _worker_models.get(model_id)
+    if model is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as exc:
+            raise RuntimeError("sentence-transformers is not installed; it is required for local embedding models") from exc
+        if LOCAL_EMBED_THREADS_PER_PROCESS > 0:
+            import torch
+
+            torch.set_num_threads(LOCAL_EMBED_THREADS_PER_PROCESS)
+        model = SentenceTransformer(model_id, device="cpu", backend=LOCAL_EMBED_BACKEND)
+        _worker_models[model_id] = model
+    return model
+
+
+def _encode_batch(model_id: str, texts: list[str], task: str) -> np.ndarray:
+    model = _load_model(model_id)
+    prompts = getattr(model, "prompts", None) or {}
+    prompt_name = next((name for name in _TASK_PROMPTS.get(task, ()) if name in prompts), None)
+    vectors = model.encode(
+        texts,
+        prompt_name=prompt_name,
+        batch_size=len(texts),
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+    )
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def embed_local(model_id: str, texts: Iterable[str], task: str) -> np.ndarray:
+    """Embed texts with a local model, spreading batches over the worker processes."""
+    values = list(texts)
+    if not values:
+        return np.zeros((0, 0), dtype=np.float32)
+    pool = _get_pool()
+    futures = [
+        pool.submit(_encode_batch, model_id, values[start : start + LOCAL_EMBED_BATCH_SIZE], task)
+        for start in range(0, len(values), LOCAL_EMBED_BATCH_SIZE)
+    ]
+    return np.vstack([future.result() for future in futures])
+
+
+async def aembed_local(model_id: str, texts: Iterable[str], task: str) -> np.ndarray:
+    values = list(texts)
+    return await anyio.to_thread.run_sync(embed_local, model_id, values, task)
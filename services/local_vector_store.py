@@ -0,0 +1,401 @@
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional
+
+import numpy as np
+
+from services.vector_quantization import VECTOR_STORAGE_DTYPE, as_float32_matrix, quantize, storage_dtype
+from services.vector_store import build_rows
+
+logger = logging.getLogger(__name__)
+
+LOCAL_VECTOR_DIR = Path(os.getenv("LOCAL_VECTOR_DIR", "/tmp/helpdeskai-vectors"))
+LOCAL_VECTOR_IVF_MIN_ROWS = int(os.getenv("LOCAL_VECTOR_IVF_MIN_ROWS", "50000"))
+LOCAL_VECTOR_IVF_NPROBE = int(os.getenv("LOCAL_VECTOR_IVF_NPROBE", "8"))
+LOCAL_VECTOR_COMPACT_RATIO = float(os.getenv("LOCAL_VECTOR_COMPACT_RATIO", "0.3"))
+
+# Historical name; the element type is recorded in the namespace's "dim" log record.
+_VECTORS_FILE = "vectors.f32"
+_LOG_FILE = "rows.jsonl"
+_LOCK_FILE = ".lock"
+_IVF_TRAIN_SAMPLE = 20000
+_IVF_ITERATIONS = 8
+
+_ivf_pool: Optional[ThreadPoolExecutor] = None
+_ivf_pool_lock = threading.Lock()
+
+
+def _submit_ivf_build(fn: Callable[..., None], *args: Any) -> None:
+    global _ivf_pool
+    with _ivf_pool_lock:
+        if _ivf_pool is None:
+            _ivf_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-vector-ivf")
+    _ivf_pool.submit(fn, *args)
+
+
+def _namespace_dir(namespace: str) -> Path:
+    digest = hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:24]
+    return LOCAL_VECTOR_DIR / digest
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class _IvfIndex:
+    """Coarse k-means partitioning; search scans only the nprobe closest lists."""
+
+    def __init__(self, matrix: np.ndarray, rows: np.ndarray):
+        nlist = max(1, min(1024, int(math.sqrt(len(rows)))))
+        rng = np.random.default_rng(0)
+        sample = rows if len(rows) <= _IVF_TRAIN_SAMPLE else rng.choice(rows, _IVF_TRAIN_SAMPLE, replace=False)
+        train = _normalize(np.asarray(matrix[np.sort(sample)], dtype=np.float32))
+        centroids = train[rng.choice(len(train), nlist, replace=False)]
+        for _ in range(_IVF_ITERATIONS):
+            assignment = np.argmax(train @ centroids.T, axis=1)
+            for index in range(nlist):
+                members = train[assignment == index]
+                if len(members):
+                    centroids[index] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        self.centroids = centroids
+        assignment = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), 8192):
+            block = np.asarray(matrix[rows[start : start + 8192]], dtype=np.float32)
+            assignment[start : start + 8192] = np.argmax(block @ centroids.T, axis=1)
+        self.lists = [rows[assignment == index] for index in range(nlist)]
+        self.built_rows = int(rows.max()) + 1 if len(rows) else 0
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        nearest = np.argsort(-(self.centroids @ query))[:nprobe]
+        return np.concatenate([self.lists[index] for index in nearest])
+
+
+class _NamespaceIndex:
+    """In-memory view of one namespace, replayed from its append-only row log."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.dim: Optional[int] = None
+        self.dtype = "float32"
+        self.scales: Optional[np.ndarray] = None
+        self.rows: list[Optional[dict[str, Any]]] = []
+        self.id_rows: dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.matrix: Optional[np.ndarray] = None
+        self.log_offset = 0
+        self.log_inode: Optional[int] = None
+        self.ivf: Optional[_IvfIndex] = None
+        self.ivf_building = False
+
+    @property
+    def live_count(self) -> int:
+        return len(self.id_rows)
+
+    @contextmanager
+    def file_lock(self, exclusive: bool) -> Iterator[None]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / _LOCK_FILE, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _apply(self, record: dict[str, Any]) -> None:
+        op = record.get("op")
+        if op == "dim":
+            self.dim = int(record["dim"])
+            self.dtype = record.get("dtype", "float32")
+        elif op == "add":
+            row = int(record["row"])
+            if row >= len(self.rows):
+                self.rows.extend([None] * (row + 1 - len(self.rows)))
+            self.rows[row] = record
+            self.id_rows[record["id"]] = row
+        elif op == "del":
+            for row in record["rows"]:
+                existing = self.rows[row] if row < len(self.rows) else None
+                if existing is not None:
+                    self.rows[row] = None
+                    if self.id_rows.get(existing["id"]) == row:
+                        del self.id_rows[existing["id"]]
+
+    def refresh(self) -> None:
+        """Apply log records written since the last refresh, by this or another process."""
+        log_path = self.directory / _LOG_FILE
+        try:
+            stat = log_path.stat()
+        except FileNotFoundError:
+            self._reset()
+            return
+        if stat.st_ino != self.log_inode:
+            self._reset()
+            self.log_inode = stat.st_ino
+        if stat.st_size == self.log_offset:
+            return
+        with open(log_path, "rb") as handle:
+            handle.seek(self.log_offset)
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break
+                self.log_offset += len(line)
+                self._apply(json.loads(line))
+
+        alive = np.zeros(len(self.rows), dtype=bool)
+        for row in self.id_rows.values():
+            alive[row] = True
+        self.alive = alive
+        if self.dtype == "int8":
+            self.scales = np.asarray([row.get("scale", 1.0) if row else 0.0 for row in self.rows], dtype=np.float32)
+        else:
+            self.scales = None
+        vectors_path = self.directory / _VECTORS_FILE
+        if self.dim and vectors_path.exists() and len(self.rows):
+            self.matrix = np.memmap(
+                vectors_path, dtype=storage_dtype(self.dtype), mode="r", shape=(len(self.rows), self.dim)
+            )
+        else:
+            self.matrix = None
+
+    def _append_log(self, records: List[dict[str, Any]]) -> None:
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with open(self.directory / _LOG_FILE, "a", encoding="utf-8") as handle:
+            handle.write(payload)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def upsert(self, rows: List[dict[str, Any]]) -> int:
+        vectors = _normalize(as_float32_matrix([row.pop("embedding") for row in rows]))
+        with self.lock, self.file_lock(exclusive=True):
+            self.refresh()
+            records: List[dict[str, Any]] = []
+            dim = self.dim or vectors.shape[1]
+            if self.dim is None:
+                # The storage type is fixed when a namespace is created.
+                self.dtype = VECTOR_STORAGE_DTYPE
+                records.append({"op": "dim", "dim": dim, "dtype": self.dtype})
+            elif vectors.shape[1] != dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match namespace dimension {dim}")
+
+            replaced = [self.id_rows[row["id"]] for row in rows if row["id"] in self.id_rows]
+            if replaced:
+                records.append({"op": "del", "rows": replaced})
+            vectors_path = self.directory / _VECTORS_FILE
+            # Row numbers follow the vector file so a crash between the two
+            # appends leaves orphaned vectors rather than misaligned rows.
+            stored, scales = quantize(vectors, self.dtype)
+            row_bytes = dim * stored.dtype.itemsize
+            first_row = (vectors_path.stat().st_size if vectors_path.exists() else 0) // row_bytes
+            with open(vectors_path, "ab") as handle:
+                handle.write(stored.tobytes())
+                handle.flush()
+                os.fsync(handle.fileno())
+            for offset, row in enumerate(rows):
+                record = {"op": "add", "row": first_row + offset, **row}
+                if scales is not None:
+                    record["scale"] = float(scales[offset])
+                records.append(record)
+            self._append_log(records)
+            self.refresh()
+        return len(rows)
+
+    def rows_where(self, predicate: Callable[[dict[str, Any]], bool]) -> List[int]:
+        return [row for row in self.id_rows.values() if predicate(self.rows[row])]
+
+    def delete_where(self, predicate: Callable[[dict[str, Any]], bool]) -> int:
+        # Rows are matched under the exclusive lock because compaction renumbers them.
+        with self.lock, self.file_lock(exclusive=True):
+            self.refresh()
+            rows = self.rows_where(predicate)
+            if not rows:
+                return 0
+            self._append_log([{"op": "del", "rows": rows}])
+            self.refresh()
+            dead = len(self.rows) - self.live_count
+            if len(self.rows) >= 1000 and dead > len(self.rows) * LOCAL_VECTOR_COMPACT_RATIO:
+                self._compact()
+        return len(rows)
+
+    def _compact(self) -> None:
+        keep = sorted(self.id_rows.values())
+        vectors_tmp = self.directory / f"{_VECTORS_FILE}.tmp"
+        log_tmp = self.directory / f"{_LOG_FILE}.tmp"
+        with open(vectors_tmp, "wb") as handle:
+            for start in range(0, len(keep), 8192):
+                handle.write(np.asarray(self.matrix[keep[start : start + 8192]]).tobytes())
+        with open(log_tmp, "w", encoding="utf-8") as handle:
+            handle.write(json.dumps({"op": "dim", "dim": self.dim, "dtype": self.dtype}) + "\n")
+            for new_row, old_row in enumerate(keep):
+                record = {**self.rows[old_row], "row": new_row}
+                handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # Readers reload when the log inode changes, always under the shared lock.
+        os.replace(vectors_tmp, self.directory / _VECTORS_FILE)
+        os.replace(log_tmp, self.directory / _LOG_FILE)
+        logger.info("local_vector_compacted dir=%s rows=%s", self.directory, len(keep))
+        self.refresh()
+
+    def search(self, query_vector: np.ndarray, limit: int) -> List[tuple[str, float]]:
+        with self.lock:
+            with self.file_lock(exclusive=False):
+                self.refresh()
+            if self.matrix is None or not self.live_count or limit <= 0:
+                return []
+            query = _normalize(as_float32_matrix(query_vector))[0]
+            candidates = self._ivf_candidates(query)
+            if candidates is None:
+                rows = np.arange(len(self.rows))
+                scores = self._scores(rows, query)
+                scores[~self.alive] = -np.inf
+            else:
+                rows = candidates[self.alive[candidates]]
+                scores = self._scores(rows, query)
+            count = min(limit, int(np.isfinite(scores).sum()))
+            if count <= 0:
+                return []
+            top = np.argpartition(-scores, count - 1)[:count]
+            top = top[np.argsort(-scores[top])]
+            return [(self.rows[rows[index]]["text"], float(scores[index])) for index in top]
+
+    def _scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if self.dtype == "float32":
+            matrix = self.matrix if len(rows) == len(self.rows) else self.matrix[rows]
+            return np.asarray(matrix) @ query
+        scores = np.empty(len(rows), dtype=np.float32)
+        # Widen quantized rows block by block to keep the float32 copy small.
+        for start in range(0, len(rows), 8192):
+            block = rows[start : start + 8192]
+            scores[start : start + 8192] = np.asarray(self.matrix[block], dtype=np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales[rows]
+        return scores
+
+    def _ivf_candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """IVF candidate rows, or None to scan every row exactly.
+
+        Building the index is a k-means pass over the namespace, so it runs on a
+        background thread; searches keep using the exact scan (or the previous
+        index) until it is ready.
+        """
+        if LOCAL_VECTOR_IVF_MIN_ROWS <= 0 or self.live_count < LOCAL_VECTOR_IVF_MIN_ROWS:
+            self.ivf = None
+            return None
+        if (self.ivf is None or len(self.rows) > self.ivf.built_rows * 1.2) and not self.ivf_building:
+            self.ivf_building = True
+            _submit_ivf_build(self._build_ivf, self.matrix, np.flatnonzero(self.alive), self.log_inode)
+        if self.ivf is None:
+            return None
+        # Rows appended since the index was built are scanned exactly.
+        tail = np.arange(self.ivf.built_rows, len(self.rows))
+        return np.concatenate([self.ivf.candidates(query, LOCAL_VECTOR_IVF_NPROBE), tail])
+
+    def _build_ivf(self, matrix: np.ndarray, live_rows: np.ndarray, log_inode: Optional[int]) -> None:
+        try:
+            ivf = _IvfIndex(matrix, live_rows)
+        except Exception:
+            logger.warning("local_vector_ivf_build_failed dir=%s", self.directory, exc_info=True)
+            with self.lock:
+                self.ivf_building = False
+            return
+        with self.lock:
+            self.ivf_building = False
+            # Compaction renumbers rows and replaces the log; an index of the old rows is useless.
+            if self.log_inode != log_inode:
+                return
+            self.ivf = ivf
+        logger.info("local_vector_ivf_built dir=%s rows=%s lists=%s", self.directory, len(live_rows), len(ivf.lists))
+
+
+class LocalVectorBackend:
+    """In-process vector store: per-namespace memory-mapped matrices with exact cosine search.
+
+    Vectors are stored as float32, float16 or int8 (VECTOR_STORAGE_DTYPE, fixed
+    per namespace when it is first written).
+
+    Large namespaces (LOCAL_VECTOR_IVF_MIN_ROWS and up) are searched through a
+    numpy IVF index instead, once a background thread has built it. Files live under LOCAL_VECTOR_DIR and are shared by
+    API and worker processes on the same host through file locks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes: dict[str, _NamespaceIndex] = {}
+
+    def _index(self, namespace: str) -> _NamespaceIndex:
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None:
+                index = self._indexes[namespace] = _NamespaceIndex(_namespace_dir(namespace))
+            return index
+
+    def upsert_texts(
+        self,
+        namespace: str,
+        kb_id: str,
+        agent_id: str,
+        texts: List[str],
+        embeddings: np.ndarray,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> int:
+        rows = build_rows(namespace, kb_id, agent_id, texts, embeddings, metadatas, ids)
+        for row in rows:
+            row.pop("namespace")
+        return self._index(namespace).upsert(rows) if rows else 0
+
+    def search(self, namespace: str, query_vector: np.ndarray, limit: int) -> List[tuple[str, float]]:
+        if not _namespace_dir(namespace).exists():
+            return []
+        return self._index(namespace).search(query_vector, limit)
+
+    def delete_for_kb(self, namespace: str, kb_id: str) -> int:
+        if not _namespace_dir(namespace).exists():
+            return 0
+        return self._index(namespace).delete_where(lambda row: row["kb_id"] == kb_id)
+
+    def delete_namespace(self, namespace: str) -> int:
+        directory = _namespace_dir(namespace)
+        with self._lock:
+            self._indexes.pop(namespace, None)
+        if not directory.exists():
+            return 0
+        shutil.rmtree(directory, ignore_errors=True)
+        return 1
+
+    def list_ids_for_kb(self, namespace: str, kb_id: str) -> set[str]:
+        if not _namespace_dir(namespace).exists():
+            return set()
+        index = self._index(namespace)
+        with index.lock, index.file_lock(exclusive=False):
+            index.refresh()
+            return {index.rows[row]["id"] for row in index.rows_where(lambda row: row["kb_id"] == kb_id)}
+
+    def iter_texts(self, namespace: str) -> Iterator[tuple[str, str]]:
+        if not _namespace_dir(namespace).exists():
+            return iter(())
+        index = self._index(namespace)
+        with index.lock, index.file_lock(exclusive=False):
+            index.refresh()
+            rows = [index.rows[row] for row in sorted(index.id_rows.values())]
+        return ((row["id"], row["text"]) for row in rows)
+
+    def delete_ids(self, namespace: str, ids: List[str]) -> int:
+        if not _namespace_dir(namespace).exists():
+            return 0
+        wanted = set(ids)
+        return self._index(namespace).delete_where(lambda row: row["id"] in wanted)
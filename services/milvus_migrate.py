@@ -0,0 +1,92 @@
+import argparse
+import logging
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+from services.vector_quantization import VECTOR_DTYPES, VECTOR_STORAGE_DTYPE, quantize
+from services.vector_store import MILVUS_LAYOUTS, MilvusVectorBackend, get_milvus_client
+
+logger = logging.getLogger(__name__)
+
+
+def _requantize(embedding: Any, source_dtype: str, target_dtype: str) -> np.ndarray:
+    # Float16 and int8 vectors may come back as raw bytes. int8 rows lose their
+    # scale on the way in, which cosine scoring ignores.
+    if isinstance(embedding, (bytes, bytearray)):
+        vector = np.frombuffer(embedding, dtype=source_dtype)
+    elif isinstance(embedding, list) and embedding and isinstance(embedding[0], (bytes, bytearray)):
+        vector = np.frombuffer(embedding[0], dtype=source_dtype)
+    else:
+        vector = np.asarray(embedding)
+    return quantize(vector.astype(np.float32), target_dtype)[0][0]
+
+
+def migrate_layout(
+    source_layout: str,
+    target_layout: str,
+    namespace: Optional[str] = None,
+    batch_size: int = 1000,
+    drop_source: bool = False,
+    source_dtype: str = VECTOR_STORAGE_DTYPE,
+    target_dtype: str = VECTOR_STORAGE_DTYPE,
+) -> int:
+    """Copy rows between Milvus layouts or storage dtypes, keeping ids and dynamic fields.
+
+    Upserts make the copy safe to re-run; switch MILVUS_LAYOUT or
+    VECTOR_STORAGE_DTYPE once it finishes.
+    """
+    if source_layout == target_layout and source_dtype == target_dtype:
+        raise ValueError("Source and target must differ in layout or dtype")
+    source = MilvusVectorBackend(source_layout, source_dtype)
+    target = MilvusVectorBackend(target_layout, target_dtype)
+    copied = 0
+    started = time.monotonic()
+    for page in source.iter_rows(namespace, batch_size=batch_size):
+        rows = [{key: value for key, value in row.items() if key != "$meta"} for row in page]
+        if source_dtype != target_dtype:
+            for row in rows:
+                row["embedding"] = _requantize(row["embedding"], source_dtype, target_dtype)
+        target.upsert_rows(rows)
+        copied += len(page)
+        logger.info(
+            "milvus_layout_migration_progress source=%s target=%s rows=%s elapsed_s=%.1f",
+            source.collection,
+            target.collection,
+            copied,
+            time.monotonic() - started,
+        )
+    if drop_source:
+        if namespace is None:
+            get_milvus_client().drop_collection(source.collection)
+        else:
+            source.delete_namespace(namespace)
+    logger.info("milvus_layout_migration_done source=%s target=%s rows=%s", source.collection, target.collection, copied)
+    return copied
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Copy vectors between Milvus collection layouts or storage dtypes.")
+    parser.add_argument("--from-layout", choices=MILVUS_LAYOUTS, default="filter")
+    parser.add_argument("--to-layout", choices=MILVUS_LAYOUTS, required=True)
+    parser.add_argument("--from-dtype", choices=VECTOR_DTYPES, default=VECTOR_STORAGE_DTYPE)
+    parser.add_argument("--to-dtype", choices=VECTOR_DTYPES, default=VECTOR_STORAGE_DTYPE)
+    parser.add_argument("--namespace", help="Only migrate one namespace")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--drop-source", action="store_true", help="Remove migrated rows from the source collection")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    migrate_layout(
+        args.from_layout,
+        args.to_layout,
+        args.namespace,
+        args.batch_size,
+        args.drop_source,
+        args.from_dtype,
+        args.to_dtype,
+    )
+
+
+if __name__ == "__main__":
+    main()
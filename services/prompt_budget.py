@@ -0,0 +1,196 @@
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Input tokens a prompt may use even when the model window allows more.
+PROMPT_MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "6000"))
+PROMPT_DEFAULT_CONTEXT_WINDOW = int(os.getenv("PROMPT_DEFAULT_CONTEXT_WINDOW", "8192"))
+PROMPT_RESERVED_OUTPUT_TOKENS = int(os.getenv("PROMPT_RESERVED_OUTPUT_TOKENS", "700"))
+PROMPT_SYSTEM_MAX_SHARE = float(os.getenv("PROMPT_SYSTEM_MAX_SHARE", "0.4"))
+# Share of what is left after the system prompt and question that goes to retrieved context first.
+PROMPT_CONTEXT_SHARE = float(os.getenv("PROMPT_CONTEXT_SHARE", "0.65"))
+PROMPT_MIN_TRIMMED_TOKENS = int(os.getenv("PROMPT_MIN_TRIMMED_TOKENS", "24"))
+PROMPT_TOKEN_COUNT_CACHE_SIZE = int(os.getenv("PROMPT_TOKEN_COUNT_CACHE_SIZE", "4096"))
+
+# The separator is captured so trimmed text keeps its line breaks and list layout.
+_SENTENCE_END = re.compile(r"((?<=[.!?])\s+|\n+)")
+
+
+@lru_cache(maxsize=64)
+def model_input_window(model: str) -> int:
+    try:
+        from litellm import get_model_info
+
+        info = get_model_info(model)
+        window = info.get("max_input_tokens") or info.get("max_tokens")
+        if window:
+            return int(window)
+    except Exception:
+        logger.debug("model_window_unknown model=%s", model)
+    return PROMPT_DEFAULT_CONTEXT_WINDOW
+
+
+@lru_cache(maxsize=PROMPT_TOKEN_COUNT_CACHE_SIZE)
+def count_tokens(model: str, text: str) -> int:
+    # Retrieved chunks repeat across requests, so counts are cached per text.
+    if not text:
+        return 0
+    try:
+        from litellm import token_counter
+
+        return int(token_counter(model=model, text=text))
+    except Exception:
+        return math.ceil(len(text) / 4)
+
+
+def input_budget(model: str) -> int:
+    return max(256, min(model_input_window(model) - PROMPT_RESERVED_OUTPUT_TOKENS, PROMPT_MAX_INPUT_TOKENS))
+
+
+def trim_to_tokens(model: str, text: str, max_tokens: int, keep: str = "head") -> str:
+    """Cut text to at most max_tokens at sentence boundaries, keeping the head or the tail."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(model, text) <= max_tokens:
+        return text
+    pieces = _SENTENCE_END.split(text)
+    sentences = pieces[0::2]
+    order = range(len(sentences) - 1, -1, -1) if keep == "tail" else range(len(sentences))
+    kept = 0
+    used = 0
+    for index in order:
+        tokens = count_tokens(model, sentences[index]) + 1
+        if used + tokens > max_tokens:
+            break
+        kept += 1
+        used += tokens
+    if not kept:
+        # Not even one sentence fits: cut inside it rather than lose the text entirely.
+        return _cut_sentence(model, sentences[-1 if keep == "tail" else 0].strip() or text.strip(), max_tokens, keep)
+    start, stop = (len(sentences) - kept, len(sentences)) if keep == "tail" else (0, kept)
+    # Sentence i sits at pieces[2 * i]; the slice keeps the separators that stood between them.
+    return "".join(pieces[2 * start : 2 * stop - 1]).strip()
+
+
+def _cut_sentence(model: str, sentence: str, max_tokens: int, keep: str) -> str:
+    """Longest head or tail of sentence within max_tokens, cut at a word boundary when one fits."""
+    tail = keep == "tail"
+
+    def piece(cut: int) -> str:
+        return sentence[cut:] if tail else sentence[:cut]
+
+    def longest(cuts: list[int]) -> Optional[str]:
+        # Later cuts give longer pieces, so the last one that fits is found by bisection.
+        low, high = -1, len(cuts) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(model, piece(cuts[middle])) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return piece(cuts[low]).strip() if low >= 0 else None
+
+    words = [match.start() if tail else match.end() for match in re.finditer(r"\S+", sentence)]
+    by_word = longest(words[::-1] if tail else words)
+    if by_word:
+        return by_word
+    # A single word is over budget (a long URL, unspaced script): cut by characters.
+    chars = range(len(sentence) - 1, -1, -1) if tail else range(1, len(sentence) + 1)
+    return longest(list(chars)) or piece(len(sentence) - 1 if tail else 1)
+
+
+@dataclass
+class PromptParts:
+    system: str
+    context: str
+    history: list[dict[str, str]]
+
+
+def _pack_context(model: str, context: str, budget: int) -> tuple[str, int]:
+    """Keep whole chunks in rank order and trim the first one that overflows."""
+    packed: list[str] = []
+    used = 0
+    for chunk in context.split("\n\n"):
+        tokens = count_tokens(model, chunk)
+        if used + tokens <= budget:
+            packed.append(chunk)
+            used += tokens
+            continue
+        remaining = budget - used
+        if remaining >= PROMPT_MIN_TRIMMED_TOKENS:
+            trimmed = trim_to_tokens(model, chunk, remaining)
+            if trimmed:
+                packed.append(trimmed)
+                used += count_tokens(model, trimmed)
+        break
+    return "\n\n".join(packed), used
+
+
+def _pack_history(model: str, history: list[dict[str, str]], budget: int) -> tuple[list[dict[str, str]], int]:
+    """Keep the most recent turns; the oldest one kept may lose its opening sentences."""
+    kept: list[dict[str, str]] = []
+    used = 0
+    for turn in reversed(history):
+        tokens = count_tokens(model, turn["content"]) + 4
+        if used + tokens <= budget:
+            kept.append(turn)
+            used += tokens
+            continue
+        remaining = budget - used - 4
+        if remaining >= PROMPT_MIN_TRIMMED_TOKENS:
+            trimmed = trim_to_tokens(model, turn["content"], remaining, keep="tail")
+            if trimmed:
+                kept.append({**turn, "content": trimmed})
+                used += count_tokens(model, trimmed) + 4
+        break
+    kept.reverse()
+    return kept, used
+
+
+def allocate_prompt(
+    model: str,
+    system: str,
+    context: str,
+    message: str,
+    history: Optional[list[dict[str, str]]] = None,
+    overhead: str = "",
+) -> PromptParts:
+    """Fit system prompt, retrieved context and history into the model's input budget.
+
+    The question and fixed overhead are always kept. The system prompt may use
+    at most PROMPT_SYSTEM_MAX_SHARE of the budget; the rest is split between
+    context and history, and whatever one side leaves unused goes to the other.
+    """
+    history = history or []
+    budget = input_budget(model)
+    fixed = count_tokens(model, message) + count_tokens(model, overhead) + 16
+    system_budget = max(0, min(budget - fixed, int(budget * PROMPT_SYSTEM_MAX_SHARE)))
+    trimmed_system = trim_to_tokens(model, system, system_budget)
+    remaining = max(0, budget - fixed - count_tokens(model, trimmed_system))
+
+    context_budget = int(remaining * PROMPT_CONTEXT_SHARE) if history else remaining
+    packed_context, context_used = _pack_context(model, context, context_budget) if context else ("", 0)
+    packed_history, _ = _pack_history(model, history, remaining - context_used)
+    if len(packed_history) == len(history) and context and packed_context != context:
+        # History fit with room to spare; give the remainder back to the context.
+        history_used = sum(count_tokens(model, turn["content"]) + 4 for turn in packed_history)
+        packed_context, _ = _pack_context(model, context, remaining - history_used)
+
+    if trimmed_system != system or packed_context != context or len(packed_history) != len(history):
+        logger.info(
+            "prompt_trimmed model=%s budget=%s system_trimmed=%s context_chunks=%s/%s history=%s/%s",
+            model,
+            budget,
+            trimmed_system != system,
+            len(packed_context.split("\n\n")) if packed_context else 0,
+            len(context.split("\n\n")) if context else 0,
+            len(packed_history),
+            len(history),
+        )
+    return PromptParts(trimmed_system, packed_context, packed_history)
@@ -1,26 +1,62 @@
+import base64
 import hashlib
+import logging
+import math
 import os
 import re
-import uuid
 import anyio
 import httpx
-from typing import Callable, Iterable, Iterator, List, Optional, AsyncIterator
+import numpy as np
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, AsyncIterator, Union
 
 from sqlalchemy.orm import Session
 
+from services.chunker import (
+    KB_CHUNKING_STRATEGY,
+    Chunk,
+    estimate_chunk_count as estimate_structured_chunk_count,
+    iter_structured_chunks,
+)
+from services.dedup import NearDuplicateIndex, normalized_text_hash
+from services.embedding_cache import aget_cached_embeddings, aset_cached_embeddings, embedding_cache_id
+from services.lexical_index import invalidate_lexical_index, lexical_search, reciprocal_rank_fusion
+from services.local_embeddings import LOCAL_EMBED_MODELS, aembed_local, embed_local, is_local_model, local_model_id
 from services.http_client import default_timeout, get_async_http_client
 from services.redis_client import aredis_get_json, aredis_set_json, cache_key
-from services.vector_store import format_context, search as milvus_search, upsert_texts
+from services.singleflight import SingleFlight
+from services.semantic_cache import abump_namespace_version, aget_namespace_version, semantic_lookup, semantic_store
+from services.prompt_budget import allocate_prompt
+from services.reranker import RAG_RERANK_CANDIDATES, RAG_RERANK_MODE, adaptive_cutoff, mmr_rerank, pack_by_density
+from services.vector_store import RAG_CONTEXT_MAX_CHARS, delete_ids, format_context, list_ids_for_kb, search as milvus_search, upsert_texts
 from utils.env import get_secret
 
+logger = logging.getLogger(__name__)
+
 JINA_EMBED_MODEL = os.getenv("JINA_EMBED_MODEL", "jina-embeddings-v5-text-small")
 JINA_EMBEDDING_URL = os.getenv("JINA_EMBEDDING_URL", "https://api.jina.ai/v1/embeddings")
 JINA_EMBED_MAX_CONCURRENCY = int(os.getenv("JINA_EMBED_MAX_CONCURRENCY", "4"))
 LLM_STREAM_MAX_CONCURRENCY = int(os.getenv("LLM_STREAM_MAX_CONCURRENCY", "8"))
 RAG_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("RAG_CONTEXT_CACHE_TTL_SECONDS", "180"))
+# Questions without hits are cached briefly so waiting replicas and repeats do not search again.
+RAG_EMPTY_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("RAG_EMPTY_CONTEXT_CACHE_TTL_SECONDS", "30"))
 RAG_RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("RAG_RETRIEVAL_TIMEOUT_SECONDS", "2.5"))
+# Take a Redis lock so only one replica searches for a given uncached question.
+# Off by default: every uncached retrieval then pays two extra Redis round trips.
+RAG_SINGLEFLIGHT_DISTRIBUTED = os.getenv("RAG_SINGLEFLIGHT_DISTRIBUTED", "false").strip().lower() in {"1", "true", "yes", "on"}
+KB_INGEST_PIPELINE_DEPTH = int(os.getenv("KB_INGEST_PIPELINE_DEPTH", "2"))
+RAG_HYBRID_ENABLED = os.getenv("RAG_HYBRID_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "10"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+JINA_RERANK_URL = os.getenv("JINA_RERANK_URL", "https://api.jina.ai/v1/rerank")
+JINA_RERANK_MODEL = os.getenv("JINA_RERANK_MODEL", "jina-reranker-v2-base-multilingual")
+RAG_RERANK_TIMEOUT_SECONDS = float(os.getenv("RAG_RERANK_TIMEOUT_SECONDS", "0.8"))
+# Concurrent chat queries are embedded together: a batch closes after the wait or once full.
+RAG_QUERY_EMBED_BATCH_MAX = int(os.getenv("RAG_QUERY_EMBED_BATCH_MAX", "32"))
+RAG_QUERY_EMBED_BATCH_WAIT_MS = float(os.getenv("RAG_QUERY_EMBED_BATCH_WAIT_MS", "5"))
 _embed_semaphore = anyio.Semaphore(JINA_EMBED_MAX_CONCURRENCY)
 _llm_semaphore = anyio.Semaphore(LLM_STREAM_MAX_CONCURRENCY)
+_retrieval_flight = SingleFlight()
 CONCISE_RUNTIME_INSTRUCTION = """### Response Style
 - Keep answers concise and easy to scan.
 - Prefer 1-3 short paragraphs.
@@ -32,35 +68,96 @@ CONCISE_RUNTIME_INSTRUCTION = """### Response Style
 _MULTI_WS = re.compile(r"\s+")
 
 
-def chunk_text(text_value: str, size: int = 1000, overlap: int = 150) -> List[str]:
-    cleaned = _MULTI_WS.sub(" ", text_value).strip()
-    if not cleaned:
-        return []
-    chunks: list[str] = []
+def iter_chunks(segments: Iterable[str], size: int = 1000, overlap: int = 150) -> Iterator[str]:
+    """Chunk the concatenation of segments lazily; output matches chunk_text on the joined text."""
+    buffer = ""
     start = 0
-    text_len = len(cleaned)
+    started = False
+    pending_space = False
+    for segment in segments:
+        cleaned = _MULTI_WS.sub(" ", segment)
+        if not cleaned:
+            continue
+        core = cleaned.strip(" ")
+        if not core:
+            pending_space = pending_space or started
+            continue
+        if started and (pending_space or cleaned[0] == " "):
+            buffer += " "
+        buffer += core
+        started = True
+        pending_space = cleaned[-1] == " "
+
+        # Only emit once text beyond the window exists, so cuts match chunk_text.
+        while len(buffer) - start > size:
+            end = start + size
+            cut = buffer.rfind(" ", start + 1, end)
+            if cut > start + size // 2:
+                end = cut
+            yield buffer[start:end]
+            start = end - overlap
+        buffer = buffer[start:]
+        start = 0
+
+    text_len = len(buffer)
     while start < text_len:
         end = min(start + size, text_len)
         if end < text_len:
-            cut = cleaned.rfind(" ", start + 1, end)
+            cut = buffer.rfind(" ", start + 1, end)
             if cut > start + size // 2:
                 end = cut
-        chunks.append(cleaned[start:end])
+        yield buffer[start:end]
         start = end - overlap if end < text_len else end
-    return chunks
 
 
-def embed_texts(texts: Iterable[str], task: str = "retrieval.passage") -> List[List[float]]:
+def chunk_text(text_value: str, size: int = 1000, overlap: int = 150) -> List[str]:
+    return list(iter_chunks([text_value], size=size, overlap=overlap))
+
+
+def estimate_chunk_count(text_len: int, size: int = 1000, overlap: int = 150) -> int:
+    if text_len <= size:
+        return 1 if text_len else 0
+    return math.ceil((text_len - overlap) / (size - overlap))
+
+
+def iter_index_chunks(segments: Iterable[str]) -> Iterator[Chunk]:
+    if KB_CHUNKING_STRATEGY == "fixed":
+        return (Chunk(text) for text in iter_chunks(segments))
+    return iter_structured_chunks(segments)
+
+
+def validate_embedding_model(name: Optional[str]) -> None:
+    """Reject agent embedding models this deployment cannot serve."""
+    if is_local_model(name) and local_model_id(name) not in LOCAL_EMBED_MODELS:
+        raise ValueError(f"Local embedding model is not enabled: {local_model_id(name)}")
+
+
+def _decode_embeddings(data: List[dict]) -> np.ndarray:
+    # base64 embeddings are little-endian float32 bytes; plain float lists are accepted too.
+    rows = [
+        np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+        if isinstance(embedding, str)
+        else np.asarray(embedding, dtype=np.float32)
+        for embedding in (item["embedding"] for item in sorted(data, key=lambda item: item.get("index", 0)))
+    ]
+    return np.vstack(rows).astype(np.float32, copy=False) if rows else np.zeros((0, 0), dtype=np.float32)
+
+
+def embed_texts(texts: Iterable[str], task: str = "retrieval.passage", model: Optional[str] = None) -> np.ndarray:
+    """Embed texts as a float32 matrix with one row per text."""
     values = list(texts)
     if not values:
-        return []
+        return np.zeros((0, 0), dtype=np.float32)
+    if is_local_model(model):
+        return embed_local(local_model_id(model), values, task)
     api_key = get_secret("JINAAI_API_KEY", prefixes=("jina_",)) or get_secret("JINA_API_KEY", prefixes=("jina_",))
     if not api_key:
         raise RuntimeError("JINAAI_API_KEY is not set")
     payload = {
-        "model": JINA_EMBED_MODEL,
+        "model": model or JINA_EMBED_MODEL,
         "task": task,
         "normalized": True,
+        "embedding_type": "base64",
         "input": values,
     }
     with httpx.Client(timeout=default_timeout()) as client:
@@ -70,21 +167,23 @@ def embed_texts(texts: Iterable[str], task: str = "retrieval.passage") -> List[L
             json=payload,
         )
     response.raise_for_status()
-    data = response.json().get("data", [])
-    return [item["embedding"] for item in data]
+    return _decode_embeddings(response.json().get("data", []))
 
 
-async def aembed_texts(texts: Iterable[str], task: str = "retrieval.passage") -> List[List[float]]:
+async def aembed_texts(texts: Iterable[str], task: str = "retrieval.passage", model: Optional[str] = None) -> np.ndarray:
     values = list(texts)
     if not values:
-        return []
+        return np.zeros((0, 0), dtype=np.float32)
+    if is_local_model(model):
+        return await aembed_local(local_model_id(model), values, task)
     api_key = get_secret("JINAAI_API_KEY", prefixes=("jina_",)) or get_secret("JINA_API_KEY", prefixes=("jina_",))
     if not api_key:
         raise RuntimeError("JINAAI_API_KEY is not set")
     payload = {
-        "model": JINA_EMBED_MODEL,
+        "model": model or JINA_EMBED_MODEL,
         "task": task,
         "normalized": True,
+        "embedding_type": "base64",
         "input": values,
     }
     async with _embed_semaphore:
@@ -95,8 +194,145 @@ async def aembed_texts(texts: Iterable[str], task: str = "retrieval.passage") ->
             json=payload,
         )
     response.raise_for_status()
-    data = response.json().get("data", [])
-    return [item["embedding"] for item in data]
+    return _decode_embeddings(response.json().get("data", []))
+
+
+class _PendingQuery:
+    __slots__ = ("text", "done", "settled", "vector", "error")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.done = anyio.Event()
+        self.settled = False
+        self.vector: Optional[np.ndarray] = None
+        self.error: Optional[Exception] = None
+
+
+class _QueryBatch:
+    def __init__(self):
+        self.items: List[_PendingQuery] = []
+        self.closed = anyio.Event()
+
+
+class QueryEmbeddingBatcher:
+    """Coalesce single-query embedding calls from concurrent requests into one POST.
+
+    The first caller of a batch leads it: it waits up to max_wait_ms (or until
+    max_batch queries joined), embeds every distinct text in one call and
+    hands each waiter its vector.
+    """
+
+    def __init__(self, task: str, max_batch: int, max_wait_ms: float, model: Optional[str] = None):
+        self.task = task
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._open: Optional[_QueryBatch] = None
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        if self.max_batch <= 1 or self.max_wait_ms <= 0:
+            return await self._embed_one(text)
+
+        batch = self._open
+        leader = batch is None
+        if batch is None:
+            batch = self._open = _QueryBatch()
+        item = _PendingQuery(text)
+        batch.items.append(item)
+        if len(batch.items) >= self.max_batch:
+            self._close(batch)
+
+        if leader:
+            await self._lead(batch)
+        else:
+            await item.done.wait()
+        if item.error is not None:
+            raise item.error
+        if not item.settled:
+            # The leader was cancelled before this query was embedded.
+            return await self._embed_one(text)
+        return item.vector
+
+    async def _embed_one(self, text: str) -> Optional[np.ndarray]:
+        vectors = await aembed_texts([text], task=self.task, model=self.model)
+        return vectors[0] if len(vectors) else None
+
+    def _close(self, batch: _QueryBatch) -> None:
+        if self._open is batch:
+            self._open = None
+        batch.closed.set()
+
+    async def _lead(self, batch: _QueryBatch) -> None:
+        try:
+            with anyio.move_on_after(self.max_wait_ms / 1000):
+                await batch.closed.wait()
+            self._close(batch)
+            texts = list(dict.fromkeys(item.text for item in batch.items))
+            try:
+                vectors = dict(zip(texts, await aembed_texts(texts, task=self.task, model=self.model)))
+            except Exception as exc:
+                for item in batch.items:
+                    item.error = exc
+            else:
+                for item in batch.items:
+                    item.vector = vectors.get(item.text)
+            for item in batch.items:
+                item.settled = True
+            if len(batch.items) > 1:
+                logger.debug("query_embed_batch size=%s distinct=%s", len(batch.items), len(texts))
+        finally:
+            self._close(batch)
+            for item in batch.items:
+                item.done.set()
+
+
+_query_batchers: dict[Optional[str], QueryEmbeddingBatcher] = {}
+
+
+async def aembed_query(text: str, model: Optional[str] = None) -> Optional[np.ndarray]:
+    batcher = _query_batchers.get(model)
+    if batcher is None:
+        batcher = _query_batchers[model] = QueryEmbeddingBatcher(
+            "retrieval.query", RAG_QUERY_EMBED_BATCH_MAX, RAG_QUERY_EMBED_BATCH_WAIT_MS, model=model
+        )
+    return await batcher.embed(text)
+
+
+async def aembed_texts_cached(
+    texts: Iterable[str], task: str = "retrieval.passage", model: Optional[str] = None
+) -> np.ndarray:
+    values = list(texts)
+    if not values:
+        return np.zeros((0, 0), dtype=np.float32)
+    cache_ids = [embedding_cache_id(model or JINA_EMBED_MODEL, task, value) for value in values]
+    vectors = await aget_cached_embeddings(cache_ids)
+    missing = {cache_id: value for cache_id, value in zip(cache_ids, values) if cache_id not in vectors}
+    if missing:
+        fresh = dict(zip(missing.keys(), await aembed_texts(missing.values(), task=task, model=model)))
+        await aset_cached_embeddings(fresh)
+        vectors.update(fresh)
+    return np.vstack([vectors[cache_id] for cache_id in cache_ids]).astype(np.float32, copy=False)
+
+
+@dataclass
+class IndexStats:
+    chunks: int = 0
+    skipped: int = 0
+    upserted: int = 0
+    deleted: int = 0
+
+
+def _first_exception(group: BaseExceptionGroup) -> BaseException:
+    exc: BaseException = group
+    while isinstance(exc, BaseExceptionGroup):
+        exc = exc.exceptions[0]
+    return exc
+
+
+def chunk_id(kb_id: str, text_value: str, model: Optional[str] = None) -> str:
+    # The model is part of the id so switching models re-embeds every chunk on retrain.
+    digest = hashlib.sha256(f"{model or JINA_EMBED_MODEL}\0{kb_id}\0{text_value}".encode("utf-8"))
+    return digest.hexdigest()[:40]
 
 
 async def aindex_kb_text(
@@ -105,55 +341,311 @@ async def aindex_kb_text(
     agent_id: str,
     kb_id: str,
     namespace: str,
-    text_value: str,
+    text_value: Union[str, Iterable[str]],
     batch_size: int = 32,
-    on_batch: Optional[Callable[[int, int], None]] = None,
+    on_batch: Optional[Callable[[int, Optional[int]], None]] = None,
+    incremental: bool = False,
+    size_hint: Optional[int] = None,
+    stats: Optional[IndexStats] = None,
+    embedding_model: Optional[str] = None,
 ) -> int:
-    chunks = chunk_text(text_value)
-    total_chunks = len(chunks)
-    if total_chunks == 0:
-        return 0
-
-    for start in range(0, total_chunks, batch_size):
-        end = min(start + batch_size, total_chunks)
-        batch = chunks[start:end]
-        vectors = await aembed_texts(batch, task="retrieval.passage")
-        ids = [str(uuid.uuid4()) for _ in batch]
-        # Upsert is blocking, run in thread
-        await anyio.to_thread.run_sync(
-            lambda: upsert_texts(namespace, kb_id, agent_id, batch, vectors, ids=ids)
-        )
-        if on_batch:
-            on_batch(end, total_chunks)
-
-    return total_chunks
-
-
-def retrieve_context(db: Session, namespace: str, agent_id: str, query: str, top_k: int = 4) -> str:
-    qvec = embed_texts([query], task="retrieval.query")[0]
+    """Index text_value, a string or an iterable of segments that is chunked lazily.
+
+    on_batch receives (done, total); total is estimated from size_hint (or the
+    string length) until chunking finishes, and None if neither is known.
+    Chunks whose body duplicates or nearly duplicates an earlier one in this KB
+    (repeated footers, navigation) are skipped and counted in stats.
+    """
+    stats = stats if stats is not None else IndexStats()
+    if isinstance(text_value, str):
+        size_hint = len(text_value) if size_hint is None else size_hint
+        text_value = [text_value]
+    estimate = estimate_chunk_count if KB_CHUNKING_STRATEGY == "fixed" else estimate_structured_chunk_count
+    estimated_total = estimate(size_hint) if size_hint is not None else None
+    existing_ids: set[str] = set()
+    if incremental:
+        existing_ids = await anyio.to_thread.run_sync(list_ids_for_kb, namespace, kb_id)
+
+    seen_ids: set[str] = set()
+    duplicates = NearDuplicateIndex()
+    total_chunks = 0
+    chunking_done = False
+    upserted = 0
+    done_chunks = 0
+    last_reported: Optional[tuple[int, Optional[int]]] = None
+
+    def plan_batches() -> Iterator[tuple[int, list[str], list[str], list[dict]]]:
+        nonlocal total_chunks, chunking_done
+        chunks = iter_index_chunks(text_value)
+        while True:
+            span = 0
+            batch: list[str] = []
+            ids: list[str] = []
+            metadatas: list[dict] = []
+            for chunk in chunks:
+                span += 1
+                cid = chunk_id(kb_id, chunk.text, embedding_model)
+                if cid in seen_ids or duplicates.is_duplicate(chunk.body):
+                    stats.skipped += 1
+                else:
+                    seen_ids.add(cid)
+                    if cid not in existing_ids:
+                        batch.append(chunk.text)
+                        ids.append(cid)
+                        metadatas.append(chunk.metadata)
+                if span >= batch_size:
+                    break
+            total_chunks += span
+            if span < batch_size:
+                chunking_done = True
+            if span:
+                yield span, batch, ids, metadatas
+            if chunking_done:
+                return
+
+    def reported_total() -> Optional[int]:
+        if chunking_done:
+            return total_chunks
+        if estimated_total is None:
+            return None
+        return max(estimated_total, done_chunks)
+
+    # Three stages joined by bounded streams: up to JINA_EMBED_MAX_CONCURRENCY
+    # batches embedding at once, one upsert at a time, then progress commits.
+    embed_slots = anyio.Semaphore(JINA_EMBED_MAX_CONCURRENCY)
+    upsert_send, upsert_recv = anyio.create_memory_object_stream(KB_INGEST_PIPELINE_DEPTH)
+    progress_send, progress_recv = anyio.create_memory_object_stream(KB_INGEST_PIPELINE_DEPTH)
+
+    async def embed_stage(span: int, batch: list[str], ids: list[str], metadatas: list[dict], send) -> None:
+        try:
+            async with send:
+                vectors = await aembed_texts_cached(batch, task="retrieval.passage", model=embedding_model) if batch else []
+                await send.send((span, batch, ids, metadatas, vectors))
+        finally:
+            embed_slots.release()
+
+    async def upsert_stage() -> None:
+        nonlocal upserted
+        async with upsert_recv, progress_send:
+            async for span, batch, ids, metadatas, vectors in upsert_recv:
+                if batch:
+                    # Upsert is blocking, run in thread
+                    await anyio.to_thread.run_sync(
+                        lambda: upsert_texts(
+                            namespace, kb_id, agent_id, batch, vectors, metadatas=metadatas, ids=ids
+                        )
+                    )
+                    upserted += len(batch)
+                await progress_send.send(span)
+
+    async def report_progress() -> None:
+        nonlocal last_reported
+        progress = (done_chunks, reported_total())
+        if on_batch and progress != last_reported:
+            last_reported = progress
+            await anyio.to_thread.run_sync(on_batch, *progress)
+
+    async def progress_stage() -> None:
+        nonlocal done_chunks
+        async with progress_recv:
+            async for span in progress_recv:
+                done_chunks += span
+                await report_progress()
+
+    try:
+        async with anyio.create_task_group() as stages:
+            stages.start_soon(upsert_stage)
+            stages.start_soon(progress_stage)
+            async with upsert_send:
+                async with anyio.create_task_group() as embedders:
+                    # Segments may come from blocking sources (spool files, PDF
+                    # page workers), so chunking is pulled in a worker thread.
+                    batches = plan_batches()
+                    while (planned := await anyio.to_thread.run_sync(next, batches, None)) is not None:
+                        await embed_slots.acquire()
+                        embedders.start_soon(embed_stage, *planned, upsert_send.clone())
+    except BaseExceptionGroup as group:
+        raise _first_exception(group) from None
+    # The last batch can finish before the chunker notices the input ended.
+    await report_progress()
+
+    stale_ids = sorted(existing_ids - seen_ids)
+    if stale_ids:
+        await anyio.to_thread.run_sync(delete_ids, namespace, stale_ids)
+    if upserted or stale_ids:
+        invalidate_lexical_index(namespace)
+        await abump_namespace_version(namespace)
+    stats.chunks = total_chunks
+    stats.upserted = upserted
+    stats.deleted = len(stale_ids)
+    logger.info(
+        "kb_index_done kb_id=%s chunks=%s skipped=%s upserted=%s deleted=%s incremental=%s",
+        kb_id,
+        total_chunks,
+        stats.skipped,
+        upserted,
+        len(stale_ids),
+        incremental,
+    )
+    return len(seen_ids)
+
+
+def retrieve_context(
+    db: Session, namespace: str, agent_id: str, query: str, top_k: int = 4, embedding_model: Optional[str] = None
+) -> str:
+    qvec = embed_texts([query], task="retrieval.query", model=embedding_model)[0]
     return format_context(milvus_search(namespace, qvec, top_k=top_k))
 
 
-async def aretrieve_context(db: Session, namespace: str, agent_id: str, query: str, top_k: int = 4) -> str:
+async def aretrieve_context(
+    db: Session, namespace: str, agent_id: str, query: str, top_k: int = 4, embedding_model: Optional[str] = None
+) -> str:
     if should_skip_retrieval(query):
         return ""
+    # The namespace version changes on every ingest, so cached contexts never outlive the KB content.
+    version = await aget_namespace_version(namespace)
     query_hash = hashlib.sha256(query.strip().lower().encode("utf-8")).hexdigest()
-    cache_id = cache_key("rag", "context", namespace, top_k, query_hash)
+    cache_id = cache_key("rag", "context", namespace, version, top_k, query_hash)
     cached_context = await aredis_get_json(cache_id)
     if isinstance(cached_context, str):
         return cached_context
 
+    async def search() -> str:
+        context = await _asearch_context(namespace, version, query, top_k, embedding_model)
+        ttl = RAG_CONTEXT_CACHE_TTL_SECONDS if context else RAG_EMPTY_CONTEXT_CACHE_TTL_SECONDS
+        await aredis_set_json(cache_id, context, ttl)
+        return context
+
+    async def recheck() -> Optional[str]:
+        value = await aredis_get_json(cache_id)
+        return value if isinstance(value, str) else None
+
+    # Identical concurrent questions share one embedding, search and rerank.
+    # A replica that loses the lock waits at most half the budget, leaving time to search itself.
     with anyio.fail_after(RAG_RETRIEVAL_TIMEOUT_SECONDS):
-        qvecs = await aembed_texts([query], task="retrieval.query")
-        if not qvecs:
-            return ""
-        results = await anyio.to_thread.run_sync(lambda: milvus_search(namespace, qvecs[0], top_k=top_k))
-        context = format_context(results)
-    if context:
-        await aredis_set_json(cache_id, context, RAG_CONTEXT_CACHE_TTL_SECONDS)
+        return await _retrieval_flight.do(
+            cache_id,
+            search,
+            recheck=recheck,
+            distributed=RAG_SINGLEFLIGHT_DISTRIBUTED,
+            lock_wait=RAG_RETRIEVAL_TIMEOUT_SECONDS * 0.5,
+        )
+
+
+async def _asearch_context(
+    namespace: str, version: int, query: str, top_k: int, embedding_model: Optional[str] = None
+) -> str:
+    candidates = max(top_k * 2, RAG_HYBRID_CANDIDATES) if RAG_HYBRID_ENABLED else top_k
+    if RAG_RERANK_MODE != "off":
+        candidates = max(candidates, RAG_RERANK_CANDIDATES)
+    query_vector: Optional[np.ndarray] = None
+    semantic_hit: Optional[str] = None
+    dense: List[tuple[str, float]] = []
+    lexical: List[tuple[str, float]] = []
+
+    async def run_lexical() -> None:
+        nonlocal lexical
+        lexical = await _alexical_search(namespace, query, candidates, version)
+
+    try:
+        async with anyio.create_task_group() as legs:
+            if RAG_HYBRID_ENABLED:
+                legs.start_soon(run_lexical)
+            query_vector = await aembed_query(query, embedding_model)
+            if query_vector is not None:
+                semantic_hit = semantic_lookup(namespace, version, top_k, query_vector)
+            if semantic_hit is not None:
+                # A paraphrase of a recent query: its context is reused and the lexical leg is dropped.
+                legs.cancel_scope.cancel()
+            elif query_vector is not None:
+                dense = await _adense_search(namespace, query_vector, candidates)
+    except BaseExceptionGroup as group:
+        raise _first_exception(group) from None
+    if semantic_hit is not None:
+        return semantic_hit
+
+    if RAG_HYBRID_ENABLED:
+        results = reciprocal_rank_fusion([dense, lexical], candidates, k=RAG_RRF_K, key=normalized_text_hash)
+    else:
+        results = dense
+    if RAG_RERANK_MODE == "off":
+        context = format_context(results[:top_k])
+    else:
+        # RRF scores only reflect ranks, so the depth is judged on the dense similarities.
+        context = pack_by_density(await _arerank(query, results, top_k, depth_scores=dense), RAG_CONTEXT_MAX_CHARS)
+    if context and query_vector is not None:
+        semantic_store(namespace, version, top_k, query_vector, context)
     return context
 
 
+async def _ajina_rerank_scores(query: str, texts: List[str]) -> List[float]:
+    api_key = get_secret("JINAAI_API_KEY", prefixes=("jina_",)) or get_secret("JINA_API_KEY", prefixes=("jina_",))
+    if not api_key:
+        raise RuntimeError("JINAAI_API_KEY is not set")
+    payload = {"model": JINA_RERANK_MODEL, "query": query, "documents": texts, "top_n": len(texts), "return_documents": False}
+    async with _embed_semaphore:
+        client = await get_async_http_client()
+        response = await client.post(
+            JINA_RERANK_URL,
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            json=payload,
+        )
+    response.raise_for_status()
+    scores = [0.0] * len(texts)
+    for item in response.json().get("results", []):
+        scores[int(item["index"])] = float(item["relevance_score"])
+    return scores
+
+
+async def _arerank(
+    query: str,
+    results: List[tuple[str, float]],
+    top_k: int,
+    depth_scores: Optional[List[tuple[str, float]]] = None,
+) -> List[tuple[str, float]]:
+    """Re-rank fused candidates and cut them to an adaptive depth of at most top_k.
+
+    Without a cross-encoder the depth is decided on depth_scores (the dense
+    similarities, defaulting to the results' own scores) and applied to the
+    head of results.
+    """
+    if not results:
+        return []
+    if RAG_RERANK_MODE == "jina":
+        texts = [text for text, _ in results]
+        scores: Optional[List[float]] = None
+        # The cross-encoder is optional: on timeout or error the MMR pass still runs.
+        with anyio.move_on_after(RAG_RERANK_TIMEOUT_SECONDS):
+            try:
+                scores = await _ajina_rerank_scores(query, texts)
+            except Exception:
+                logger.warning("rerank_failed candidates=%s", len(texts), exc_info=True)
+        if scores is not None:
+            ranked = sorted(zip(texts, scores), key=lambda item: item[1], reverse=True)
+            return adaptive_cutoff(ranked, top_k)
+    # The depth is decided on the full candidate scores; MMR then only chooses among the survivors.
+    depth_scores = depth_scores or results
+    depth = len(adaptive_cutoff(depth_scores, len(depth_scores)))
+    return mmr_rerank(results[:depth], top_k)
+
+
+async def _adense_search(namespace: str, query_vector: np.ndarray, top_k: int) -> List[tuple[str, float]]:
+    return await anyio.to_thread.run_sync(lambda: milvus_search(namespace, query_vector, top_k=top_k))
+
+
+async def _alexical_search(namespace: str, query: str, top_k: int, version: int) -> List[tuple[str, float]]:
+    # The lexical leg is best effort: it answers nothing while the index is
+    # built in the background, and a failure must not cost the dense results.
+    with anyio.move_on_after(RAG_RETRIEVAL_TIMEOUT_SECONDS * 0.8):
+        try:
+            return await anyio.to_thread.run_sync(
+                lexical_search, namespace, query, top_k, version, abandon_on_cancel=True
+            )
+        except Exception:
+            logger.warning("lexical_search_failed namespace=%s", namespace, exc_info=True)
+    return []
+
+
 def should_skip_retrieval(query: str) -> bool:
     normalized = " ".join(query.lower().strip().split())
     if not normalized:
@@ -180,7 +672,12 @@ def build_messages(
     context: str,
     message: str,
     history: Optional[list[dict[str, str]]] = None,
+    model: Optional[str] = None,
 ) -> list[dict[str, str]]:
+    """Assemble the chat prompt; with a model, parts are fitted to its token budget."""
+    if model:
+        parts = allocate_prompt(model, system_prompt, context, message, history, overhead=CONCISE_RUNTIME_INSTRUCTION)
+        system_prompt, context, history = parts.system, parts.context, parts.history
     content = f"{system_prompt}\n\n{CONCISE_RUNTIME_INSTRUCTION}".strip()
     if context:
         content = f"{content}\n\nRelevant context:\n<context>\n{context}\n</context>"
@@ -191,6 +688,19 @@ def build_messages(
     return messages
 
 
+async def abuild_messages(
+    system_prompt: str,
+    context: str,
+    message: str,
+    history: Optional[list[dict[str, str]]] = None,
+    model: Optional[str] = None,
+) -> list[dict[str, str]]:
+    # Token counting may load a tokenizer and runs once per chunk and turn, so it stays off the event loop.
+    if not model:
+        return build_messages(system_prompt, context, message, history)
+    return await anyio.to_thread.run_sync(build_messages, system_prompt, context, message, history, model)
+
+
 def generate_answer(model: str, messages: list[dict[str, str]]) -> str:
     from litellm import completion
 
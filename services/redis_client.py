@@ -1,8 +1,10 @@
-import json
 import logging
 import os
 import asyncio
 import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from functools import lru_cache
 from typing import Any, Optional
 
@@ -10,10 +12,25 @@ import redis
 from redis import Redis
 from redis.asyncio import Redis as AsyncRedis
 
+from services.serialization import decode_cache_value, dumps, encode_cache_value, loads
+
 
 logger = logging.getLogger(__name__)
 _async_clients: dict[tuple[int, int], AsyncRedis] = {}
 
+# Small, hot, rarely changing values are also kept in process for a few
+# seconds. Families are "<part>:<part>" after the prefix; deletes are
+# broadcast so other replicas drop their copies as well.
+LOCAL_CACHE_FAMILIES = frozenset(
+    family.strip()
+    for family in os.getenv(
+        "LOCAL_CACHE_FAMILIES", "chat:runtime,widget:config,widget:runtime,models:available"
+    ).split(",")
+    if family.strip()
+)
+LOCAL_CACHE_TTL_SECONDS = float(os.getenv("LOCAL_CACHE_TTL_SECONDS", "5"))
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "2048"))
+
 
 def _redis_url() -> Optional[str]:
     return (os.getenv("REDIS_URL") or os.getenv("UPSTASH_REDIS_URL") or "").strip() or None
@@ -71,13 +88,169 @@ def get_async_redis() -> Optional[AsyncRedis]:
         return None
 
 
+@dataclass
+class _FamilyStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+class LocalCache:
+    """Bounded LRU of raw JSON strings with a TTL, tracked per key family.
+
+    Raw strings are stored so every caller gets its own decoded copy.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, str, str]] = OrderedDict()
+        self._stats: dict[str, _FamilyStats] = {}
+        self._lock = threading.Lock()
+
+    def _family_stats(self, family: str) -> _FamilyStats:
+        stats = self._stats.get(family)
+        if stats is None:
+            stats = self._stats[family] = _FamilyStats()
+        return stats
+
+    def _remove(self, key: str) -> None:
+        _, raw, family = self._entries.pop(key)
+        stats = self._family_stats(family)
+        stats.entries -= 1
+        stats.bytes -= len(raw)
+
+    def get(self, key: str, family: str) -> Optional[str]:
+        with self._lock:
+            stats = self._family_stats(family)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            stats.hits += 1
+            return entry[1]
+
+    def set(self, key: str, family: str, raw: str, ttl_seconds: Optional[float] = None) -> None:
+        ttl = min(self.ttl_seconds, ttl_seconds) if ttl_seconds else self.ttl_seconds
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, raw, family)
+            stats = self._family_stats(family)
+            stats.entries += 1
+            stats.bytes += len(raw)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._family_stats(self._entries[oldest][2]).evictions += 1
+                self._remove(oldest)
+
+    def discard(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            report = {}
+            for family, stats in self._stats.items():
+                lookups = stats.hits + stats.misses
+                report[family] = {
+                    "hits": stats.hits,
+                    "misses": stats.misses,
+                    "hit_rate": round(stats.hits / lookups, 4) if lookups else 0.0,
+                    "evictions": stats.evictions,
+                    "entries": stats.entries,
+                    "bytes": stats.bytes,
+                }
+            return report
+
+
+_local_cache = LocalCache(LOCAL_CACHE_MAX_ENTRIES, LOCAL_CACHE_TTL_SECONDS)
+_invalidation_listener: Optional[threading.Thread] = None
+_invalidation_lock = threading.Lock()
+
+
+def _invalidation_channel() -> str:
+    return cache_key("cache", "invalidate")
+
+
+def _local_family(key: str) -> Optional[str]:
+    prefix = f"{_key_prefix()}:"
+    if not key.startswith(prefix):
+        return None
+    family = ":".join(key[len(prefix):].split(":", 2)[:2])
+    return family if family in LOCAL_CACHE_FAMILIES else None
+
+
+def _listen_for_invalidations() -> None:
+    channel = _invalidation_channel()
+    while True:
+        client = get_redis()
+        if not client:
+            return
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(channel)
+            # Deletes published while we were not subscribed were missed.
+            _local_cache.clear()
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message and message.get("type") == "message":
+                    _local_cache.discard(*loads(message["data"]))
+        except Exception:
+            logger.warning("local_cache_invalidation_listener_failed", exc_info=True)
+            _local_cache.clear()
+            time.sleep(1.0)
+
+
+def _ensure_invalidation_listener() -> None:
+    global _invalidation_listener
+    if _invalidation_listener is not None:
+        return
+    with _invalidation_lock:
+        if _invalidation_listener is None:
+            _invalidation_listener = threading.Thread(
+                target=_listen_for_invalidations, name="local-cache-invalidation", daemon=True
+            )
+            _invalidation_listener.start()
+
+
+def _local_get(key: str) -> tuple[Optional[str], Optional[str]]:
+    """Return (family, raw) for keys in a locally cached family."""
+    family = _local_family(key)
+    if family is None:
+        return None, None
+    _ensure_invalidation_listener()
+    return family, _local_cache.get(key, family)
+
+
+def local_cache_stats() -> dict[str, dict[str, Any]]:
+    return _local_cache.stats()
+
+
 def redis_get_json(key: str) -> Optional[Any]:
     client = get_redis()
     if not client:
         return None
+    family, raw = _local_get(key)
+    if raw is not None:
+        return decode_cache_value(raw)
     try:
         value = client.get(key)
-        return json.loads(value) if value else None
+        if value and family:
+            _local_cache.set(key, family, value)
+        return decode_cache_value(value) if value else None
     except Exception:
         logger.warning("redis_get_failed key=%s", key, exc_info=True)
         return None
@@ -88,7 +261,11 @@ def redis_set_json(key: str, value: Any, ttl_seconds: int) -> None:
     if not client:
         return
     try:
-        client.setex(key, ttl_seconds, json.dumps(value, default=str))
+        raw = encode_cache_value(value)
+        client.setex(key, ttl_seconds, raw)
+        family = _local_family(key)
+        if family:
+            _local_cache.set(key, family, raw, ttl_seconds)
     except Exception:
         logger.warning("redis_set_failed key=%s", key, exc_info=True)
 
@@ -97,19 +274,90 @@ def redis_delete(*keys: str) -> None:
     client = get_redis()
     if not client or not keys:
         return
+    _local_cache.discard(*keys)
     try:
         client.delete(*keys)
+        local_keys = [key for key in keys if _local_family(key)]
+        if local_keys:
+            client.publish(_invalidation_channel(), dumps(local_keys))
     except Exception:
         logger.warning("redis_delete_failed keys=%s", keys, exc_info=True)
 
 
+async def aredis_incr(key: str) -> Optional[int]:
+    client = get_async_redis()
+    if not client:
+        return None
+    try:
+        return int(await client.incr(key))
+    except Exception:
+        logger.warning("async_redis_incr_failed key=%s", key, exc_info=True)
+        return None
+
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def redis_acquire_lock(key: str, token: str, ttl_ms: int) -> Optional[bool]:
+    """Try to take a lock; None means Redis is unavailable and the caller should proceed."""
+    client = get_redis()
+    if not client:
+        return None
+    try:
+        return bool(client.set(key, token, nx=True, px=ttl_ms))
+    except Exception:
+        logger.warning("redis_lock_failed key=%s", key, exc_info=True)
+        return None
+
+
+def redis_release_lock(key: str, token: str) -> None:
+    client = get_redis()
+    if not client:
+        return
+    try:
+        client.eval(_RELEASE_LOCK_SCRIPT, 1, key, token)
+    except Exception:
+        logger.warning("redis_unlock_failed key=%s", key, exc_info=True)
+
+
+async def aredis_acquire_lock(key: str, token: str, ttl_ms: int) -> Optional[bool]:
+    client = get_async_redis()
+    if not client:
+        return None
+    try:
+        return bool(await client.set(key, token, nx=True, px=ttl_ms))
+    except Exception:
+        logger.warning("async_redis_lock_failed key=%s", key, exc_info=True)
+        return None
+
+
+async def aredis_release_lock(key: str, token: str) -> None:
+    client = get_async_redis()
+    if not client:
+        return
+    try:
+        await client.eval(_RELEASE_LOCK_SCRIPT, 1, key, token)
+    except Exception:
+        logger.warning("async_redis_unlock_failed key=%s", key, exc_info=True)
+
+
 async def aredis_get_json(key: str) -> Optional[Any]:
     client = get_async_redis()
     if not client:
         return None
+    family, raw = _local_get(key)
+    if raw is not None:
+        return decode_cache_value(raw)
     try:
         value = await client.get(key)
-        return json.loads(value) if value else None
+        if value and family:
+            _local_cache.set(key, family, value)
+        return decode_cache_value(value) if value else None
     except Exception:
         logger.warning("async_redis_get_failed key=%s", key, exc_info=True)
         return None
@@ -120,11 +368,29 @@ async def aredis_set_json(key: str, value: Any, ttl_seconds: int) -> None:
     if not client:
         return
     try:
-        await client.setex(key, ttl_seconds, json.dumps(value, default=str))
+        raw = encode_cache_value(value)
+        await client.setex(key, ttl_seconds, raw)
+        family = _local_family(key)
+        if family:
+            _local_cache.set(key, family, raw, ttl_seconds)
     except Exception:
         logger.warning("async_redis_set_failed key=%s", key, exc_info=True)
 
 
+async def aredis_delete(*keys: str) -> None:
+    client = get_async_redis()
+    if not client or not keys:
+        return
+    _local_cache.discard(*keys)
+    try:
+        await client.delete(*keys)
+        local_keys = [key for key in keys if _local_family(key)]
+        if local_keys:
+            await client.publish(_invalidation_channel(), dumps(local_keys))
+    except Exception:
+        logger.warning("async_redis_delete_failed keys=%s", keys, exc_info=True)
+
+
 async def close_redis_clients(close_all: bool = False) -> None:
     if close_all:
         clients = list(_async_clients.items())
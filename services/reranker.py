@@ -0,0 +1,101 @@
+import os
+from typing import List
+
+import numpy as np
+
+from services.lexical_index import tokenize
+
+# "mmr" (local diversity pass), "jina" (cross-encoder API, MMR on failure) or "off".
+RAG_RERANK_MODE = os.getenv("RAG_RERANK_MODE", "mmr").strip().lower()
+RAG_RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "12"))
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+# Candidates scoring below this share of the top hit's score are dropped, so
+# one sharp hit yields a short context while near-ties are all kept.
+RAG_RERANK_RELATIVE_CUTOFF = float(os.getenv("RAG_RERANK_RELATIVE_CUTOFF", "0.5"))
+
+
+def _relative_scores(scores: np.ndarray) -> np.ndarray:
+    spread = float(scores.max() - scores.min()) if len(scores) else 0.0
+    if spread <= 0:
+        return np.ones(len(scores), dtype=np.float32)
+    return (scores - scores.min()) / spread
+
+
+def _token_sets(texts: List[str]) -> List[frozenset[str]]:
+    return [frozenset(tokenize(text)) for text in texts]
+
+
+def _jaccard(left: frozenset[str], right: frozenset[str]) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def mmr_rerank(results: List[tuple[str, float]], top_k: int, diversity_lambda: float = RAG_MMR_LAMBDA) -> List[tuple[str, float]]:
+    """Maximal marginal relevance over (text, score) candidates.
+
+    Relevance is the min-max normalized retrieval score and redundancy the
+    token Jaccard overlap with already selected chunks, so near-copies of a
+    chosen chunk give way to chunks that add new information. Returned scores
+    are the normalized relevance.
+    """
+    if not results:
+        return []
+    texts = [text for text, _ in results]
+    relevance = _relative_scores(np.asarray([score for _, score in results], dtype=np.float32))
+    tokens = _token_sets(texts)
+    remaining = list(range(len(results)))
+    selected: List[int] = []
+    while remaining and len(selected) < top_k:
+        best, best_value = remaining[0], -np.inf
+        for index in remaining:
+            redundancy = max((_jaccard(tokens[index], tokens[chosen]) for chosen in selected), default=0.0)
+            value = diversity_lambda * relevance[index] - (1 - diversity_lambda) * redundancy
+            if value > best_value:
+                best, best_value = index, value
+        selected.append(best)
+        remaining.remove(best)
+    return [(texts[index], float(relevance[index])) for index in selected]
+
+
+def adaptive_cutoff(
+    results: List[tuple[str, float]], max_k: int, relative_cutoff: float = RAG_RERANK_RELATIVE_CUTOFF
+) -> List[tuple[str, float]]:
+    """Keep at most max_k results, dropping those far below the top score.
+
+    The threshold is a share of the best score rather than a min-max rescale,
+    so the weakest result is not dropped just for being last and flat score
+    lists keep their full depth. Scores are expected to be non-negative.
+    """
+    if not results:
+        return []
+    top = max(score for _, score in results)
+    if top <= 0:
+        return results[:max_k]
+    kept = [result for result in results if result[1] >= top * relative_cutoff]
+    return (kept or results[:1])[:max_k]
+
+
+def pack_by_density(results: List[tuple[str, float]], max_chars: int) -> str:
+    """Fill the context budget with the most relevance per character, kept in rank order.
+
+    First-fit stops adding once a long chunk no longer fits; choosing by
+    score density instead lets several short, relevant chunks take its place.
+    """
+    if not results:
+        return ""
+    floor = min(score for _, score in results)
+    # Scores are shifted positive so the weakest candidate still has some density.
+    weights = [score - floor + 1e-3 for _, score in results]
+    # The top hit always goes first; the rest compete on density.
+    order = [0] + sorted(
+        range(1, len(results)), key=lambda index: weights[index] / max(len(results[index][0]), 1), reverse=True
+    )
+    chosen: set[int] = set()
+    total = 0
+    for index in order:
+        text = results[index][0]
+        if text and total + len(text) + 2 <= max_chars:
+            chosen.add(index)
+            total += len(text) + 2
+    return "\n\n".join(results[index][0] for index in range(len(results)) if index in chosen)
@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from services.redis_client import aredis_get_json, aredis_incr, cache_key
+
+logger = logging.getLogger(__name__)
+
+RAG_SEMANTIC_CACHE_ENABLED = os.getenv("RAG_SEMANTIC_CACHE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+RAG_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+RAG_SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("RAG_SEMANTIC_CACHE_TTL_SECONDS", "600"))
+RAG_SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("RAG_SEMANTIC_CACHE_MAX_ENTRIES", "256"))
+RAG_SEMANTIC_CACHE_MAX_NAMESPACES = int(os.getenv("RAG_SEMANTIC_CACHE_MAX_NAMESPACES", "256"))
+NAMESPACE_VERSION_LOCAL_TTL_SECONDS = float(os.getenv("NAMESPACE_VERSION_LOCAL_TTL_SECONDS", "5"))
+
+_versions: dict[str, tuple[int, float]] = {}
+_versions_lock = threading.Lock()
+
+
+def _version_key(namespace: str) -> str:
+    return cache_key("rag", "nsver", namespace)
+
+
+def _remember_version(namespace: str, version: int) -> None:
+    with _versions_lock:
+        _versions[namespace] = (version, time.monotonic())
+
+
+async def aget_namespace_version(namespace: str) -> int:
+    """Current content version of a namespace, shared through Redis and cached locally for a few seconds."""
+    with _versions_lock:
+        cached = _versions.get(namespace)
+    if cached and time.monotonic() - cached[1] < NAMESPACE_VERSION_LOCAL_TTL_SECONDS:
+        return cached[0]
+    value = await aredis_get_json(_version_key(namespace))
+    if isinstance(value, int):
+        version = value
+    else:
+        # Without Redis the local counter is the only source of truth.
+        version = cached[0] if cached else 0
+    _remember_version(namespace, version)
+    return version
+
+
+async def abump_namespace_version(namespace: str) -> int:
+    """Advance the namespace version after its vectors change, dropping cached contexts."""
+    shared = await aredis_incr(_version_key(namespace))
+    with _versions_lock:
+        local = _versions.get(namespace, (0, 0.0))[0] + 1
+    version = shared if shared is not None else local
+    _remember_version(namespace, version)
+    invalidate_semantic_cache(namespace)
+    return version
+
+
+class SemanticQueryCache:
+    """Recent query embeddings of one namespace and the context retrieved for them.
+
+    Rows grow on demand up to max_entries, so idle tenants stay small.
+    """
+
+    def __init__(self, dim: int, version: int, max_entries: int = RAG_SEMANTIC_CACHE_MAX_ENTRIES):
+        self.version = version
+        self.max_entries = max_entries
+        self.size = 0
+        capacity = min(16, max_entries)
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.top_ks = np.zeros(capacity, dtype=np.int32)
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.contexts: list[Optional[str]] = [None] * capacity
+        self.lock = threading.Lock()
+
+    def lookup(self, query_vector: np.ndarray, top_k: int, threshold: float) -> Optional[str]:
+        now = time.monotonic()
+        with self.lock:
+            size = self.size
+            valid = (self.expires_at[:size] > now) & (self.top_ks[:size] == top_k)
+            if not valid.any():
+                return None
+            scores = self.vectors[:size] @ query_vector
+            scores[~valid] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                return None
+            self.last_used[best] = now
+            return self.contexts[best]
+
+    def _grow(self) -> None:
+        capacity = min(len(self.top_ks) * 2, self.max_entries)
+        extra = capacity - len(self.top_ks)
+        self.vectors = np.vstack([self.vectors, np.zeros((extra, self.vectors.shape[1]), dtype=np.float32)])
+        self.top_ks = np.concatenate([self.top_ks, np.zeros(extra, dtype=np.int32)])
+        self.expires_at = np.concatenate([self.expires_at, np.zeros(extra)])
+        self.last_used = np.concatenate([self.last_used, np.zeros(extra)])
+        self.contexts.extend([None] * extra)
+
+    def store(self, query_vector: np.ndarray, top_k: int, context: str, ttl_seconds: float) -> None:
+        now = time.monotonic()
+        with self.lock:
+            expired = np.flatnonzero(self.expires_at[: self.size] <= now)
+            if len(expired):
+                slot = int(expired[0])
+            elif self.size < self.max_entries:
+                if self.size == len(self.top_ks):
+                    self._grow()
+                slot = self.size
+                self.size += 1
+            else:
+                slot = int(np.argmin(self.last_used))
+            self.vectors[slot] = query_vector
+            self.top_ks[slot] = top_k
+            self.expires_at[slot] = now + ttl_seconds
+            self.last_used[slot] = now
+            self.contexts[slot] = context
+
+
+_caches: "OrderedDict[str, SemanticQueryCache]" = OrderedDict()
+_caches_lock = threading.Lock()
+
+
+def _normalize(vector: list[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    return array / norm if norm else array
+
+
+def invalidate_semantic_cache(namespace: str) -> None:
+    with _caches_lock:
+        _caches.pop(namespace, None)
+
+
+def _cache_for(namespace: str, version: int, dim: int, create: bool) -> Optional[SemanticQueryCache]:
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is not None and cache.version > version:
+            # A request that started before the last ingest must not replace newer entries.
+            return None
+        if cache is not None and (cache.version != version or cache.vectors.shape[1] != dim):
+            del _caches[namespace]
+            cache = None
+        if cache is None and create:
+            cache = _caches[namespace] = SemanticQueryCache(dim, version)
+            while len(_caches) > RAG_SEMANTIC_CACHE_MAX_NAMESPACES:
+                _caches.popitem(last=False)
+        if cache is not None:
+            _caches.move_to_end(namespace)
+        return cache
+
+
+def semantic_lookup(namespace: str, version: int, top_k: int, query_vector: list[float]) -> Optional[str]:
+    if not RAG_SEMANTIC_CACHE_ENABLED:
+        return None
+    cache = _cache_for(namespace, version, len(query_vector), create=False)
+    if cache is None:
+        return None
+    return cache.lookup(_normalize(query_vector), top_k, RAG_SEMANTIC_CACHE_THRESHOLD)
+
+
+def semantic_store(namespace: str, version: int, top_k: int, query_vector: list[float], context: str) -> None:
+    if not RAG_SEMANTIC_CACHE_ENABLED:
+        return
+    cache = _cache_for(namespace, version, len(query_vector), create=True)
+    if cache is not None:
+        cache.store(_normalize(query_vector), top_k, context, RAG_SEMANTIC_CACHE_TTL_SECONDS)
@@ -0,0 +1,67 @@
+import base64
+import os
+import threading
+from typing import Any, Union
+
+import orjson
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is a pinned dependency
+    zstandard = None
+
+# Cached payloads at least this large are zstd-compressed when it pays off.
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", "3"))
+
+# Redis clients decode responses as text, so compressed frames are stored
+# base64-encoded behind a marker no JSON document can start with.
+_COMPRESSED_MARKER = "z:"
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+_codecs = threading.local()
+
+
+def _default(value: Any) -> str:
+    return str(value)
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    return orjson.loads(data)
+
+
+def _compressor():
+    compressor = getattr(_codecs, "compressor", None)
+    if compressor is None:
+        compressor = _codecs.compressor = zstandard.ZstdCompressor(level=CACHE_COMPRESS_LEVEL)
+    return compressor
+
+
+def _decompressor():
+    decompressor = getattr(_codecs, "decompressor", None)
+    if decompressor is None:
+        decompressor = _codecs.decompressor = zstandard.ZstdDecompressor()
+    return decompressor
+
+
+def encode_cache_value(value: Any) -> str:
+    raw = dumps(value)
+    if zstandard is not None and len(raw) >= CACHE_COMPRESS_MIN_BYTES:
+        compressed = _compressor().compress(raw)
+        # base64 adds a third; only keep the compressed form when it still wins.
+        if len(compressed) * 4 // 3 + len(_COMPRESSED_MARKER) < len(raw):
+            return _COMPRESSED_MARKER + base64.b64encode(compressed).decode("ascii")
+    return raw.decode("utf-8")
+
+
+def decode_cache_value(data: Union[str, bytes]) -> Any:
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    if data.startswith(_COMPRESSED_MARKER):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed; it is required to read compressed cache entries")
+        return loads(_decompressor().decompress(base64.b64decode(data[len(_COMPRESSED_MARKER):])))
+    return loads(data)
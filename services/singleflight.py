@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+import anyio
+
+from services.redis_client import (
+    aredis_acquire_lock,
+    aredis_delete,
+    aredis_get_json,
+    aredis_release_lock,
+    aredis_set_json,
+    redis_acquire_lock,
+    redis_delete,
+    redis_get_json,
+    redis_release_lock,
+    redis_set_json,
+)
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_LOCK_TTL_MS = int(os.getenv("SINGLEFLIGHT_LOCK_TTL_MS", "10000"))
+# How long a replica that lost the lock waits for the winner's result before computing itself.
+SINGLEFLIGHT_LOCK_WAIT_MS = int(os.getenv("SINGLEFLIGHT_LOCK_WAIT_MS", "3000"))
+SINGLEFLIGHT_POLL_MS = int(os.getenv("SINGLEFLIGHT_POLL_MS", "50"))
+SINGLEFLIGHT_REFRESH_THREADS = int(os.getenv("SINGLEFLIGHT_REFRESH_THREADS", "2"))
+
+
+def _lock_key(key: str) -> str:
+    return f"{key}:lock"
+
+
+class _Call:
+    def __init__(self, done):
+        self.done = done
+        self.settled = False
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Run one computation per key at a time; concurrent callers share its result.
+
+    With distributed=True a Redis lock extends this across replicas: callers
+    that lose the lock poll ``recheck`` (usually a cache read) until the
+    winner has published a value, and compute themselves if it never does.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        recheck: Optional[Callable[[], Awaitable[Any]]] = None,
+        distributed: bool = False,
+        lock_wait: Optional[float] = None,
+    ) -> Any:
+        """``lock_wait`` (seconds) caps how long a lock loser polls; SINGLEFLIGHT_LOCK_WAIT_MS by default."""
+        call = self._calls.get(key)
+        if call is not None:
+            await call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if call.settled:
+                return call.result
+            # The leader was cancelled before it finished.
+            return await fn()
+
+        call = self._calls[key] = _Call(anyio.Event())
+        try:
+            call.result = await self._run(key, fn, recheck, distributed, lock_wait)
+            call.settled = True
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            del self._calls[key]
+            call.done.set()
+
+    async def _run(self, key, fn, recheck, distributed, lock_wait=None) -> Any:
+        if not distributed:
+            return await fn()
+        lock = _lock_key(key)
+        token = uuid.uuid4().hex
+        acquired = await aredis_acquire_lock(lock, token, SINGLEFLIGHT_LOCK_TTL_MS)
+        if acquired is False and recheck is not None:
+            deadline = time.monotonic() + (SINGLEFLIGHT_LOCK_WAIT_MS / 1000 if lock_wait is None else lock_wait)
+            while time.monotonic() < deadline:
+                await anyio.sleep(SINGLEFLIGHT_POLL_MS / 1000)
+                value = await recheck()
+                if value is not None:
+                    return value
+        try:
+            return await fn()
+        finally:
+            if acquired:
+                await aredis_release_lock(lock, token)
+
+
+class SyncSingleFlight:
+    """Thread-based counterpart of SingleFlight for sync code paths."""
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        recheck: Optional[Callable[[], Any]] = None,
+        distributed: bool = False,
+        lock_wait: Optional[float] = None,
+    ) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(threading.Event())
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._run(key, fn, recheck, distributed, lock_wait)
+            call.settled = True
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run(self, key, fn, recheck, distributed, lock_wait=None) -> Any:
+        if not distributed:
+            return fn()
+        lock = _lock_key(key)
+        token = uuid.uuid4().hex
+        acquired = redis_acquire_lock(lock, token, SINGLEFLIGHT_LOCK_TTL_MS)
+        if acquired is False and recheck is not None:
+            deadline = time.monotonic() + (SINGLEFLIGHT_LOCK_WAIT_MS / 1000 if lock_wait is None else lock_wait)
+            while time.monotonic() < deadline:
+                time.sleep(SINGLEFLIGHT_POLL_MS / 1000)
+                value = recheck()
+                if value is not None:
+                    return value
+        try:
+            return fn()
+        finally:
+            if acquired:
+                redis_release_lock(lock, token)
+
+
+_flight = SingleFlight()
+_sync_flight = SyncSingleFlight()
+_refresh_tasks: set[asyncio.Future] = set()
+_refresh_pool: Optional[ThreadPoolExecutor] = None
+_refresh_pool_lock = threading.Lock()
+
+
+def _envelope(value: Any, fresh_seconds: float) -> dict:
+    return {"value": value, "fresh_until": time.time() + fresh_seconds}
+
+
+def _unwrap(cached: Any, fresh_only: bool) -> tuple[Any, bool]:
+    """Return (value, is_fresh) for a cache envelope, or (None, False)."""
+    if not isinstance(cached, dict) or "fresh_until" not in cached:
+        return None, False
+    fresh = float(cached["fresh_until"]) > time.time()
+    if fresh_only and not fresh:
+        return None, False
+    return cached.get("value"), fresh
+
+
+async def acached(
+    key: str,
+    fresh_seconds: int,
+    stale_seconds: int,
+    compute: Callable[[], Awaitable[Any]],
+    refresh: Optional[Callable[[], Awaitable[Any]]] = None,
+    distributed: bool = False,
+) -> Any:
+    """Read-through cache with single-flight fills and stale-while-revalidate.
+
+    Entries are served as-is for fresh_seconds, then for up to stale_seconds
+    more while one background refresh runs. ``refresh`` replaces ``compute``
+    for that background run when ``compute`` is tied to request-scoped state
+    such as a DB session. None results are not cached.
+    """
+    value, fresh = _unwrap(await aredis_get_json(key), fresh_only=False)
+    if value is not None:
+        if not fresh and not _flight.in_flight(key):
+            task = asyncio.ensure_future(
+                _afill(key, fresh_seconds, stale_seconds, refresh or compute, distributed, evict_on_none=True)
+            )
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_done)
+        return value
+    return await _afill(key, fresh_seconds, stale_seconds, compute, distributed)
+
+
+async def _afill(key, fresh_seconds, stale_seconds, compute, distributed, evict_on_none=False) -> Any:
+    async def compute_and_store():
+        value = await compute()
+        if value is not None:
+            await aredis_set_json(key, _envelope(value, fresh_seconds), fresh_seconds + stale_seconds)
+        elif evict_on_none:
+            # The source is gone (deleted or disabled); stop serving the stale entry.
+            await aredis_delete(key)
+        return value
+
+    async def recheck():
+        return _unwrap(await aredis_get_json(key), fresh_only=True)[0]
+
+    return await _flight.do(key, compute_and_store, recheck=recheck, distributed=distributed)
+
+
+def _refresh_done(task: asyncio.Future) -> None:
+    _refresh_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("cache_refresh_failed", exc_info=task.exception())
+
+
+def cached(
+    key: str,
+    fresh_seconds: int,
+    stale_seconds: int,
+    compute: Callable[[], Any],
+    refresh: Optional[Callable[[], Any]] = None,
+    distributed: bool = False,
+) -> Any:
+    """Sync counterpart of acached; background refreshes run on a small thread pool."""
+    global _refresh_pool
+    value, fresh = _unwrap(redis_get_json(key), fresh_only=False)
+    if value is not None:
+        if not fresh and not _sync_flight.in_flight(key):
+            with _refresh_pool_lock:
+                if _refresh_pool is None:
+                    _refresh_pool = ThreadPoolExecutor(
+                        max_workers=SINGLEFLIGHT_REFRESH_THREADS, thread_name_prefix="cache-refresh"
+                    )
+            future = _refresh_pool.submit(
+                _fill, key, fresh_seconds, stale_seconds, refresh or compute, distributed, evict_on_none=True
+            )
+            future.add_done_callback(_sync_refresh_done)
+        return value
+    return _fill(key, fresh_seconds, stale_seconds, compute, distributed)
+
+
+def _fill(key, fresh_seconds, stale_seconds, compute, distributed, evict_on_none=False) -> Any:
+    def compute_and_store():
+        value = compute()
+        if value is not None:
+            redis_set_json(key, _envelope(value, fresh_seconds), fresh_seconds + stale_seconds)
+        elif evict_on_none:
+            redis_delete(key)
+        return value
+
+    def recheck():
+        return _unwrap(redis_get_json(key), fresh_only=True)[0]
+
+    return _sync_flight.do(key, compute_and_store, recheck=recheck, distributed=distributed)
+
+
+def _sync_refresh_done(future) -> None:
+    if future.exception() is not None:
+        logger.warning("cache_refresh_failed", exc_info=future.exception())
@@ -0,0 +1,94 @@
+import asyncio
+import os
+from typing import AsyncIterator, Optional
+
+import orjson
+
+from services.serialization import dumps
+
+# Deltas are coalesced into one frame until this many bytes are buffered or
+# the oldest buffered delta has waited this long; 0 bytes disables it.
+SSE_COALESCE_MAX_BYTES = int(os.getenv("SSE_COALESCE_MAX_BYTES", "48"))
+SSE_COALESCE_MAX_WAIT_MS = float(os.getenv("SSE_COALESCE_MAX_WAIT_MS", "30"))
+_COALESCE_QUEUE_SIZE = 256
+
+# GZipMiddleware already skips text/event-stream, so frames go out as written.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Token frames are the hot path: the frame around the JSON-escaped content
+# is fixed, so no dict is built per token.
+_TOKEN_PREFIX = b'event: token\ndata: {"content":'
+_TOKEN_SUFFIX = b"}\n\n"
+_END = object()
+
+
+def sse_event(event: str, data: dict) -> bytes:
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+def sse_token(content: str) -> bytes:
+    return _TOKEN_PREFIX + orjson.dumps(content) + _TOKEN_SUFFIX
+
+
+async def coalesce_tokens(
+    tokens: AsyncIterator[str],
+    max_bytes: Optional[int] = None,
+    max_wait_ms: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Merge small deltas into fewer, larger chunks; the first delta is never held back.
+
+    The source is drained by a separate task so a buffered chunk can be
+    flushed on time even while the provider is between deltas.
+    """
+    max_bytes = SSE_COALESCE_MAX_BYTES if max_bytes is None else max_bytes
+    max_wait = (SSE_COALESCE_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+    if max_bytes <= 0:
+        async for token in tokens:
+            yield token
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=_COALESCE_QUEUE_SIZE)
+
+    async def pump() -> None:
+        error = None
+        try:
+            async for token in tokens:
+                await queue.put(token)
+        except Exception as exc:
+            error = exc
+        await queue.put((_END, error))
+
+    pump_task = asyncio.ensure_future(pump())
+    buffer: list[str] = []
+    size = 0
+    deadline: Optional[float] = None
+    first = True
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+                continue
+            if isinstance(item, tuple):
+                if buffer:
+                    yield "".join(buffer)
+                if item[1] is not None:
+                    raise item[1]
+                return
+            if first:
+                first = False
+                yield item
+                continue
+            buffer.append(item)
+            size += len(item.encode("utf-8"))
+            if deadline is None:
+                deadline = loop.time() + max_wait
+            if size >= max_bytes:
+                yield "".join(buffer)
+                buffer, size, deadline = [], 0, None
+    finally:
+        pump_task.cancel()
@@ -0,0 +1,97 @@
+import argparse
+import os
+from typing import Optional
+
+import numpy as np
+
+# Element type vectors are stored as: float32, float16 (half the bytes) or
+# int8 (a quarter, one scale per vector). Scores are cosine, so int8 keeps
+# the direction of each vector and only the magnitude is rescaled.
+VECTOR_STORAGE_DTYPE = os.getenv("VECTOR_STORAGE_DTYPE", "float32").strip().lower()
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+_INT8_MAX = 127.0
+
+
+def storage_dtype(name: str) -> np.dtype:
+    if name not in VECTOR_DTYPES:
+        raise ValueError(f"Unsupported vector storage dtype: {name}")
+    return np.dtype(name)
+
+
+def as_float32_matrix(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix.reshape(1, -1) if matrix.ndim == 1 else matrix
+
+
+def quantize(vectors, dtype: str) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """Return (stored, scales) where stored * scales[:, None] approximates the input rows.
+
+    scales is None for float types.
+    """
+    matrix = as_float32_matrix(vectors)
+    if dtype == "float32":
+        return matrix, None
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    storage_dtype(dtype)
+    max_abs = np.abs(matrix).max(axis=1)
+    scales = np.where(max_abs > 0, max_abs / _INT8_MAX, 1.0).astype(np.float32)
+    stored = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return stored, scales
+
+
+def dequantize(stored: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    matrix = np.asarray(stored, dtype=np.float32)
+    return matrix * scales[:, None] if scales is not None else matrix
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def recall_at_k(base: np.ndarray, queries: np.ndarray, dtype: str, k: int = 10) -> float:
+    """Share of the exact float32 top-k neighbours that the quantized vectors also rank in their top-k."""
+    base = _normalize(as_float32_matrix(base))
+    queries = _normalize(as_float32_matrix(queries))
+    k = min(k, len(base))
+    exact = np.argpartition(-(queries @ base.T), k - 1, axis=1)[:, :k]
+    stored, scales = quantize(base, dtype)
+    approx_scores = queries.astype(np.float32) @ _normalize(dequantize(stored, scales)).T
+    approx = np.argpartition(-approx_scores, k - 1, axis=1)[:, :k]
+    hits = sum(len(np.intersect1d(exact[row], approx[row])) for row in range(len(queries)))
+    return hits / (len(queries) * k)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Recall@k of quantized vector storage against float32.")
+    parser.add_argument("--vectors", help="Optional .npy matrix of real embeddings; random unit vectors otherwise")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    if args.vectors:
+        base = as_float32_matrix(np.load(args.vectors))
+        picked = rng.choice(len(base), min(args.queries, len(base)), replace=False)
+        # Perturbed copies of stored vectors stand in for real queries.
+        queries = base[picked] + rng.normal(0, 0.05, (len(picked), base.shape[1])).astype(np.float32)
+    else:
+        base = rng.normal(size=(args.rows, args.dim)).astype(np.float32)
+        queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+    for dtype in VECTOR_DTYPES:
+        stored, scales = quantize(base, dtype)
+        size = stored.nbytes + (scales.nbytes if scales is not None else 0)
+        print(
+            f"{dtype:8s} recall@{args.k}={recall_at_k(base, queries, dtype, args.k):.4f} "
+            f"bytes_per_vector={size / len(base):.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
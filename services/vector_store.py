@@ -1,10 +1,16 @@
+import hashlib
 import logging
 import os
-from typing import Any, List, Optional, TYPE_CHECKING
+import threading
+from typing import Any, Iterator, List, Optional, Protocol, TYPE_CHECKING
 from urllib.parse import urlparse
 
+import numpy as np
 from dotenv import load_dotenv
 
+from services.dedup import normalized_text_hash
+from services.vector_quantization import VECTOR_DTYPES, VECTOR_STORAGE_DTYPE, quantize
+
 if TYPE_CHECKING:
     from pymilvus import MilvusClient
 
@@ -15,9 +21,17 @@ MILVUS_COLLECTION = os.getenv("JINA_MILVUS_COLLECTION", "documents_jina")
 VECTOR_DIM = int(os.getenv("JINA_EMBEDDING_DIMENSION", "1024"))
 
 MILVUS_TIMEOUT_SECONDS = float(os.getenv("MILVUS_TIMEOUT_SECONDS", "10"))
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "milvus").strip().lower()
+# filter: one collection filtered by namespace; partition_key: namespace is the
+# collection's partition key; partition: one named partition per namespace.
+MILVUS_LAYOUT = os.getenv("MILVUS_LAYOUT", "filter").strip().lower()
+MILVUS_LAYOUTS = ("filter", "partition_key", "partition")
+MILVUS_NUM_PARTITIONS = int(os.getenv("MILVUS_NUM_PARTITIONS", "64"))
 RAG_CONTEXT_MAX_CHARS = int(os.getenv("RAG_CONTEXT_MAX_CHARS", "3500"))
 
 _client: Optional["MilvusClient"] = None
+_backend: Optional["VectorBackend"] = None
+_dtype_checked = False
 
 
 def get_milvus_client() -> "MilvusClient":
@@ -36,39 +50,169 @@ def get_milvus_client() -> "MilvusClient":
     return _client
 
 
-def ensure_collection() -> None:
+def milvus_collection_name(layout: str = MILVUS_LAYOUT, dtype: str = VECTOR_STORAGE_DTYPE) -> str:
+    # Layouts and vector storage types need different schemas, so each gets its own collection.
+    suffix = "" if dtype == "float32" else f"_{dtype}"
+    if layout == "filter":
+        return MILVUS_COLLECTION + suffix
+    return os.getenv(f"MILVUS_{layout.upper()}_COLLECTION", f"{MILVUS_COLLECTION}_{layout}{suffix}")
+
+
+def partition_name_for(namespace: str) -> str:
+    # Partition names only allow letters, digits and underscores.
+    return "ns_" + hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:32]
+
+
+def ensure_collection(layout: str = MILVUS_LAYOUT, dtype: str = VECTOR_STORAGE_DTYPE) -> None:
     client = get_milvus_client()
-    if client.has_collection(MILVUS_COLLECTION, timeout=MILVUS_TIMEOUT_SECONDS):
+    collection = milvus_collection_name(layout, dtype)
+    if client.has_collection(collection, timeout=MILVUS_TIMEOUT_SECONDS):
         return
-    logger.info("creating_milvus_collection collection=%s dimension=%s", MILVUS_COLLECTION, VECTOR_DIM)
+    logger.info(
+        "creating_milvus_collection collection=%s dimension=%s layout=%s dtype=%s",
+        collection,
+        VECTOR_DIM,
+        layout,
+        dtype,
+    )
+    if layout != "partition_key" and dtype == "float32":
+        client.create_collection(
+            collection_name=collection,
+            dimension=VECTOR_DIM,
+            primary_field_name="id",
+            id_type="string",
+            vector_field_name="embedding",
+            metric_type="COSINE",
+            auto_id=False,
+            max_length=64,
+            enable_dynamic_field=True,
+            timeout=MILVUS_TIMEOUT_SECONDS,
+        )
+        return
+
+    from pymilvus import DataType, MilvusClient
+
+    if layout == "partition_key":
+        schema = MilvusClient.create_schema(
+            auto_id=False,
+            enable_dynamic_field=True,
+            partition_key_field="namespace",
+            num_partitions=MILVUS_NUM_PARTITIONS,
+        )
+    else:
+        schema = MilvusClient.create_schema(auto_id=False, enable_dynamic_field=True)
+    vector_types = {
+        "float32": DataType.FLOAT_VECTOR,
+        "float16": DataType.FLOAT16_VECTOR,
+        "int8": DataType.INT8_VECTOR,
+    }
+    schema.add_field("id", DataType.VARCHAR, is_primary=True, max_length=64)
+    schema.add_field("namespace", DataType.VARCHAR, max_length=256, is_partition_key=layout == "partition_key")
+    schema.add_field("embedding", vector_types[dtype], dim=VECTOR_DIM)
+    index_params = client.prepare_index_params()
+    # int8 vectors are only indexable with HNSW; cosine ignores the per-vector scale.
+    index_type = "HNSW" if dtype == "int8" else "AUTOINDEX"
+    index_params.add_index(field_name="embedding", index_type=index_type, metric_type="COSINE")
     client.create_collection(
-        collection_name=MILVUS_COLLECTION,
-        dimension=VECTOR_DIM,
-        primary_field_name="id",
-        id_type="string",
-        vector_field_name="embedding",
-        metric_type="COSINE",
-        auto_id=False,
-        max_length=64,
-        enable_dynamic_field=True,
+        collection_name=collection,
+        schema=schema,
+        index_params=index_params,
         timeout=MILVUS_TIMEOUT_SECONDS,
     )
 
 
+def _row_count(collection: str) -> int:
+    client = get_milvus_client()
+    if not client.has_collection(collection, timeout=MILVUS_TIMEOUT_SECONDS):
+        return 0
+    return int(client.get_collection_stats(collection, timeout=MILVUS_TIMEOUT_SECONDS).get("row_count", 0))
+
+
+def check_storage_dtype(layout: str = MILVUS_LAYOUT, dtype: str = VECTOR_STORAGE_DTYPE) -> bool:
+    """Refuse to run against an empty collection while another storage dtype still holds the vectors.
+
+    Each VECTOR_STORAGE_DTYPE reads and writes its own collection, so flipping
+    the setting without copying the rows over would hide every knowledge base
+    from retrieval. To switch, run
+    ``python -m services.milvus_migrate --from-layout L --to-layout L --from-dtype OLD --to-dtype NEW``
+    while the old setting is still deployed, then change VECTOR_STORAGE_DTYPE.
+
+    Raises RuntimeError only for a confirmed mismatch. Returns False when
+    Milvus could not be reached, so the check runs again on a later call.
+    """
+    collection = milvus_collection_name(layout, dtype)
+    try:
+        if _row_count(collection) > 0:
+            return True
+        others = [
+            (other, milvus_collection_name(layout, other), _row_count(milvus_collection_name(layout, other)))
+            for other in VECTOR_DTYPES
+            if other != dtype
+        ]
+    except Exception:
+        logger.warning("vector_dtype_check_skipped collection=%s", collection, exc_info=True)
+        return False
+    for other, other_collection, other_rows in others:
+        if other_rows > 0:
+            logger.error(
+                "vector_dtype_collection_empty collection=%s other=%s other_rows=%s",
+                collection,
+                other_collection,
+                other_rows,
+            )
+            raise RuntimeError(
+                f"VECTOR_STORAGE_DTYPE={dtype} uses collection {collection}, which is empty, while "
+                f"{other_collection} holds {other_rows} {other} rows; run `python -m services.milvus_migrate "
+                f"--from-layout {layout} --to-layout {layout} --from-dtype {other} --to-dtype {dtype}` first"
+            )
+    return True
+
+
 def _quote(value: str) -> str:
     return value.replace("\\", "\\\\").replace('"', '\\"')
 
 
-def upsert_texts(
+class VectorBackend(Protocol):
+    def upsert_texts(
+        self,
+        namespace: str,
+        kb_id: str,
+        agent_id: str,
+        texts: List[str],
+        embeddings: np.ndarray,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> int:
+        ...
+
+    def search(self, namespace: str, query_vector: np.ndarray, limit: int) -> List[tuple[str, float]]:
+        ...
+
+    def delete_for_kb(self, namespace: str, kb_id: str) -> int:
+        ...
+
+    def delete_namespace(self, namespace: str) -> int:
+        ...
+
+    def list_ids_for_kb(self, namespace: str, kb_id: str) -> set[str]:
+        ...
+
+    def delete_ids(self, namespace: str, ids: List[str]) -> int:
+        ...
+
+    def iter_texts(self, namespace: str) -> Iterator[tuple[str, str]]:
+        ...
+
+
+def build_rows(
     namespace: str,
     kb_id: str,
     agent_id: str,
     texts: List[str],
-    embeddings: List[List[float]],
+    embeddings: np.ndarray,
     metadatas: Optional[List[dict]] = None,
     ids: Optional[List[str]] = None,
-) -> int:
-    ensure_collection()
+) -> List[dict[str, Any]]:
     rows: List[dict[str, Any]] = []
     for i, text in enumerate(texts):
         metadata = metadatas[i] if metadatas and i < len(metadatas) else {}
@@ -84,27 +228,234 @@ def upsert_texts(
                 **metadata,
             }
         )
-    if rows:
-        get_milvus_client().upsert(collection_name=MILVUS_COLLECTION, data=rows, timeout=MILVUS_TIMEOUT_SECONDS)
-    return len(rows)
-
-
-def search(namespace: str, query_vector: List[float], top_k: int = 4) -> List[tuple[str, float]]:
-    ensure_collection()
-    results = get_milvus_client().search(
-        collection_name=MILVUS_COLLECTION,
-        data=[query_vector],
-        filter=f'namespace == "{_quote(namespace)}"',
-        limit=top_k,
-        output_fields=["text"],
-        anns_field="embedding",
-        timeout=MILVUS_TIMEOUT_SECONDS,
-    )
-    hits: List[tuple[str, float]] = []
-    for hit in results[0] if results else []:
-        entity = hit.get("entity", hit)
-        hits.append((entity.get("text", ""), float(hit.get("distance", hit.get("score", 0.0)))))
-    return hits
+    return rows
+
+
+class MilvusVectorBackend:
+    """Milvus/Zilliz storage in one of MILVUS_LAYOUTS.
+
+    The partition layout scopes searches and deletes to the namespace's own
+    partition and drops it when the namespace is removed; Milvus caps
+    partitions per collection (1024 by default), so it suits a bounded number
+    of tenants. partition_key hashes namespaces into MILVUS_NUM_PARTITIONS
+    buckets and has no such cap.
+    """
+
+    def __init__(self, layout: str = MILVUS_LAYOUT, dtype: str = VECTOR_STORAGE_DTYPE):
+        if layout not in MILVUS_LAYOUTS:
+            raise RuntimeError(f"Unsupported MILVUS_LAYOUT: {layout}")
+        self.layout = layout
+        self.dtype = dtype
+        self.collection = milvus_collection_name(layout, dtype)
+        self._partitions: set[str] = set()
+        self._partitions_lock = threading.Lock()
+
+    def _ensure_partition(self, namespace: str) -> str:
+        partition = partition_name_for(namespace)
+        if partition in self._partitions:
+            return partition
+        with self._partitions_lock:
+            client = get_milvus_client()
+            if not client.has_partition(self.collection, partition, timeout=MILVUS_TIMEOUT_SECONDS):
+                client.create_partition(self.collection, partition, timeout=MILVUS_TIMEOUT_SECONDS)
+            self._partitions.add(partition)
+        return partition
+
+    def _existing_partition(self, namespace: str) -> Optional[str]:
+        partition = partition_name_for(namespace)
+        if partition in self._partitions:
+            return partition
+        if get_milvus_client().has_partition(self.collection, partition, timeout=MILVUS_TIMEOUT_SECONDS):
+            self._partitions.add(partition)
+            return partition
+        return None
+
+    def _scope(self, namespace: str, extra: str = "") -> Optional[dict[str, Any]]:
+        """Search/query arguments limiting a call to one namespace; None if it has no data."""
+        if self.layout != "partition":
+            namespace_filter = f'namespace == "{_quote(namespace)}"'
+            return {"filter": f"{namespace_filter} and {extra}" if extra else namespace_filter}
+        partition = self._existing_partition(namespace)
+        if partition is None:
+            return None
+        return {"filter": extra, "partition_names": [partition]}
+
+    def upsert_rows(self, rows: List[dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        ensure_collection(self.layout, self.dtype)
+        client = get_milvus_client()
+        if self.layout != "partition":
+            client.upsert(collection_name=self.collection, data=rows, timeout=MILVUS_TIMEOUT_SECONDS)
+            return len(rows)
+        by_namespace: dict[str, List[dict[str, Any]]] = {}
+        for row in rows:
+            by_namespace.setdefault(row["namespace"], []).append(row)
+        for namespace, namespace_rows in by_namespace.items():
+            client.upsert(
+                collection_name=self.collection,
+                data=namespace_rows,
+                partition_name=self._ensure_partition(namespace),
+                timeout=MILVUS_TIMEOUT_SECONDS,
+            )
+        return len(rows)
+
+    def upsert_texts(
+        self,
+        namespace: str,
+        kb_id: str,
+        agent_id: str,
+        texts: List[str],
+        embeddings: np.ndarray,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> int:
+        stored, _ = quantize(embeddings, self.dtype)
+        return self.upsert_rows(build_rows(namespace, kb_id, agent_id, texts, stored, metadatas, ids))
+
+    def search(self, namespace: str, query_vector: np.ndarray, limit: int) -> List[tuple[str, float]]:
+        ensure_collection(self.layout, self.dtype)
+        scope = self._scope(namespace)
+        if scope is None:
+            return []
+        results = get_milvus_client().search(
+            collection_name=self.collection,
+            data=[quantize(query_vector, self.dtype)[0][0]],
+            limit=limit,
+            output_fields=["text"],
+            anns_field="embedding",
+            timeout=MILVUS_TIMEOUT_SECONDS,
+            **scope,
+        )
+        hits: List[tuple[str, float]] = []
+        for hit in results[0] if results else []:
+            entity = hit.get("entity", hit)
+            hits.append((entity.get("text", ""), float(hit.get("distance", hit.get("score", 0.0)))))
+        return hits
+
+    def _delete(self, namespace: str, extra: str = "", ids: Optional[List[str]] = None) -> bool:
+        scope = self._scope(namespace, extra)
+        if scope is None:
+            return False
+        kwargs: dict[str, Any] = {"ids": ids} if ids is not None else {"filter": scope["filter"]}
+        if scope.get("partition_names"):
+            kwargs["partition_name"] = scope["partition_names"][0]
+        get_milvus_client().delete(collection_name=self.collection, timeout=MILVUS_TIMEOUT_SECONDS, **kwargs)
+        return True
+
+    def delete_for_kb(self, namespace: str, kb_id: str) -> int:
+        ensure_collection(self.layout, self.dtype)
+        return int(self._delete(namespace, f'kb_id == "{_quote(kb_id)}"'))
+
+    def delete_namespace(self, namespace: str) -> int:
+        ensure_collection(self.layout, self.dtype)
+        if self.layout != "partition":
+            return int(self._delete(namespace))
+        partition = self._existing_partition(namespace)
+        if partition is None:
+            return 0
+        client = get_milvus_client()
+        client.release_partitions(self.collection, [partition], timeout=MILVUS_TIMEOUT_SECONDS)
+        client.drop_partition(self.collection, partition, timeout=MILVUS_TIMEOUT_SECONDS)
+        self._partitions.discard(partition)
+        return 1
+
+    def iter_rows(
+        self,
+        namespace: Optional[str] = None,
+        output_fields: Optional[List[str]] = None,
+        extra: str = "",
+        batch_size: int = 1000,
+    ) -> Iterator[List[dict[str, Any]]]:
+        """Page through stored rows, optionally limited to one namespace."""
+        ensure_collection(self.layout, self.dtype)
+        if namespace is None:
+            scope: Optional[dict[str, Any]] = {"filter": extra}
+        else:
+            scope = self._scope(namespace, extra)
+        if scope is None:
+            return
+        iterator = get_milvus_client().query_iterator(
+            collection_name=self.collection,
+            batch_size=batch_size,
+            output_fields=output_fields or ["*"],
+            timeout=MILVUS_TIMEOUT_SECONDS,
+            **scope,
+        )
+        try:
+            while True:
+                page = iterator.next()
+                if not page:
+                    break
+                yield page
+        finally:
+            iterator.close()
+
+    def list_ids_for_kb(self, namespace: str, kb_id: str) -> set[str]:
+        ids: set[str] = set()
+        for page in self.iter_rows(namespace, ["id"], f'kb_id == "{_quote(kb_id)}"'):
+            ids.update(str(row["id"]) for row in page)
+        return ids
+
+    def iter_texts(self, namespace: str) -> Iterator[tuple[str, str]]:
+        for page in self.iter_rows(namespace, ["id", "text"]):
+            for row in page:
+                yield str(row["id"]), row.get("text") or ""
+
+    def delete_ids(self, namespace: str, ids: List[str], batch_size: int = 1000) -> int:
+        ensure_collection(self.layout, self.dtype)
+        for start in range(0, len(ids), batch_size):
+            if not self._delete(namespace, ids=ids[start : start + batch_size]):
+                return 0
+        return len(ids)
+
+
+def get_vector_backend() -> VectorBackend:
+    global _backend, _dtype_checked
+    if VECTOR_BACKEND == "milvus" and not _dtype_checked:
+        # Checked lazily so a Milvus outage only affects retrieval; a confirmed
+        # dtype mismatch fails every vector call instead of returning nothing.
+        _dtype_checked = check_storage_dtype()
+    if _backend is None:
+        if VECTOR_BACKEND == "local":
+            from services.local_vector_store import LocalVectorBackend
+
+            _backend = LocalVectorBackend()
+        elif VECTOR_BACKEND == "milvus":
+            _backend = MilvusVectorBackend()
+        else:
+            raise RuntimeError(f"Unsupported VECTOR_BACKEND: {VECTOR_BACKEND}")
+    return _backend
+
+
+def upsert_texts(
+    namespace: str,
+    kb_id: str,
+    agent_id: str,
+    texts: List[str],
+    embeddings: np.ndarray,
+    metadatas: Optional[List[dict]] = None,
+    ids: Optional[List[str]] = None,
+) -> int:
+    return get_vector_backend().upsert_texts(namespace, kb_id, agent_id, texts, embeddings, metadatas, ids)
+
+
+def search(namespace: str, query_vector: np.ndarray, top_k: int = 4) -> List[tuple[str, float]]:
+    # Over-fetch so identical chunks stored under different KBs collapse
+    # without leaving top-k slots empty.
+    hits = get_vector_backend().search(namespace, query_vector, limit=top_k * 2)
+    return collapse_duplicate_hits(hits)[:top_k]
+
+
+def collapse_duplicate_hits(hits: List[tuple[str, float]]) -> List[tuple[str, float]]:
+    seen: set[str] = set()
+    unique: List[tuple[str, float]] = []
+    for text, score in hits:
+        text_hash = normalized_text_hash(text)
+        if text_hash not in seen:
+            seen.add(text_hash)
+            unique.append((text, score))
+    return unique
 
 
 def format_context(results: List[tuple[str, float]], max_chars: int = RAG_CONTEXT_MAX_CHARS) -> str:
@@ -118,20 +469,22 @@ def format_context(results: List[tuple[str, float]], max_chars: int = RAG_CONTEX
 
 
 def delete_for_kb(namespace: str, kb_id: str) -> int:
-    ensure_collection()
-    get_milvus_client().delete(
-        collection_name=MILVUS_COLLECTION,
-        filter=f'namespace == "{_quote(namespace)}" and kb_id == "{_quote(kb_id)}"',
-        timeout=MILVUS_TIMEOUT_SECONDS,
-    )
-    return 1
+    return get_vector_backend().delete_for_kb(namespace, kb_id)
+
+
+def list_ids_for_kb(namespace: str, kb_id: str) -> set[str]:
+    return get_vector_backend().list_ids_for_kb(namespace, kb_id)
+
+
+def delete_ids(namespace: str, ids: List[str]) -> int:
+    if not ids:
+        return 0
+    return get_vector_backend().delete_ids(namespace, ids)
 
 
 def delete_namespace(namespace: str) -> int:
-    ensure_collection()
-    get_milvus_client().delete(
-        collection_name=MILVUS_COLLECTION,
-        filter=f'namespace == "{_quote(namespace)}"',
-        timeout=MILVUS_TIMEOUT_SECONDS,
-    )
-    return 1
+    return get_vector_backend().delete_namespace(namespace)
+
+
+def iter_namespace_texts(namespace: str) -> Iterator[tuple[str, str]]:
+    return get_vector_backend().iter_texts(namespace)
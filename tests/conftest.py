@@ -13,6 +13,8 @@ if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
 os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+# Token counting falls back to a chars-per-token estimate instead of downloading BPE files.
+os.environ.setdefault("KB_CHUNK_TOKENIZER", "")
 
 _real_create_engine = sqlalchemy.create_engine
 
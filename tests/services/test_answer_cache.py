@@ -0,0 +1,26 @@
+from services import answer_cache
+
+
+def test_answer_cache_id_ignores_case_punctuation_and_spacing():
+    first = answer_cache.answer_cache_id("dep", "Be helpful", "groq/m", "True:ns:3", 2, "What are your opening hours?")
+    second = answer_cache.answer_cache_id("dep", "Be helpful", "groq/m", "True:ns:3", 2, "  what are your  OPENING hours ")
+
+    assert first == second, f"Expected normalized questions to share a key; got {first!r} and {second!r}"
+
+
+def test_answer_cache_id_changes_with_instructions_and_kb_version():
+    base = answer_cache.answer_cache_id("dep", "Be helpful", "groq/m", "True:ns:3", 2, "refunds?")
+    new_instructions = answer_cache.answer_cache_id("dep", "Be brief", "groq/m", "True:ns:3", 2, "refunds?")
+    new_kb = answer_cache.answer_cache_id("dep", "Be helpful", "groq/m", "True:ns:3", 3, "refunds?")
+
+    assert len({base, new_instructions, new_kb}) == 3, "Expected agent and KB changes to produce new keys"
+    assert answer_cache.answer_cache_id("dep", "Be helpful", "groq/m", "", 0, "?!") is None
+
+
+def test_iter_replay_tokens_reassembles_the_answer():
+    answer = "Open 9-5,\nMonday to Friday."
+
+    tokens = list(answer_cache.iter_replay_tokens(answer))
+
+    assert len(tokens) > 1, f"Expected the answer to be replayed in pieces; got {tokens!r}"
+    assert "".join(tokens) == answer, f"Expected tokens to concatenate to the answer; got {tokens!r}"
@@ -1,6 +1,6 @@
 import pytest
 
-from services import chat_runtime
+from services import chat_runtime, singleflight
 
 
 class FakeQuery:
@@ -11,6 +11,9 @@ class FakeQuery:
     def outerjoin(self, *_args, **_kwargs):
         return self
 
+    def options(self, *_args, **_kwargs):
+        return self
+
     def filter(self, *_args, **_kwargs):
         return self
 
@@ -40,6 +43,18 @@ class DummyConfig:
         self.retrieval_enabled = True
         self.retrieval_top_k = 5
         self.vector_store_namespace = "ns"
+        self.embedding_model = None
+
+
+class DummyDeployment:
+    def __init__(self):
+        self.id = 3
+        self.deployment_id = "dep-1"
+        self.is_enabled = True
+        self.allowed_domains = ["example.com"]
+        self.answer_cache_enabled = False
+        self.agent = DummyAgent()
+        self.agent.config = DummyConfig()
 
 
 @pytest.mark.anyio
@@ -56,9 +71,9 @@ async def test_get_agent_runtime_returns_cached(monkeypatch):
     }
 
     async def fake_get_json(_key):
-        return cached
+        return {"value": cached, "fresh_until": 4102444800}
 
-    monkeypatch.setattr(chat_runtime, "aredis_get_json", fake_get_json)
+    monkeypatch.setattr(singleflight, "aredis_get_json", fake_get_json)
 
     runtime = await chat_runtime.get_agent_runtime(db=FakeSession(None), agent_id="agent-1", user_id=7)
 
@@ -81,8 +96,8 @@ async def test_get_agent_runtime_builds_from_db(monkeypatch):
         captured["value"] = value
         captured["ttl"] = ttl
 
-    monkeypatch.setattr(chat_runtime, "aredis_get_json", fake_get_json)
-    monkeypatch.setattr(chat_runtime, "aredis_set_json", fake_set_json)
+    monkeypatch.setattr(singleflight, "aredis_get_json", fake_get_json)
+    monkeypatch.setattr(singleflight, "aredis_set_json", fake_set_json)
 
     row = (DummyAgent(), DummyConfig())
     runtime = await chat_runtime.get_agent_runtime(db=FakeSession(row), agent_id="agent-1", user_id=7)
@@ -91,7 +106,7 @@ async def test_get_agent_runtime_builds_from_db(monkeypatch):
     assert runtime.retrieval_top_k == 5, (
         "Expected retrieval_top_k to come from config when set"
     )
-    assert captured["value"]["vector_store_namespace"] == "ns", (
+    assert captured["value"]["value"]["vector_store_namespace"] == "ns", (
         "Expected cached runtime to include vector store namespace"
     )
 
@@ -109,3 +124,39 @@ def test_invalidate_agent_runtime_deletes_cache(monkeypatch):
     assert captured["key"].endswith("chat:runtime:7:agent-1"), (
         "Expected invalidate_agent_runtime to target user-specific cache key"
     )
+
+
+@pytest.mark.anyio
+async def test_get_deployment_runtime_builds_from_deployment_agent_and_config(monkeypatch):
+    captured = {}
+
+    async def fake_get_json(_key):
+        return None
+
+    async def fake_set_json(key, value, ttl):
+        captured["key"] = key
+        captured["value"] = value
+
+    monkeypatch.setattr(singleflight, "aredis_get_json", fake_get_json)
+    monkeypatch.setattr(singleflight, "aredis_set_json", fake_set_json)
+
+    runtime = await chat_runtime.get_deployment_runtime(FakeSession(DummyDeployment()), "dep-1")
+
+    assert runtime is not None and runtime.vector_store_namespace == "ns", (
+        f"Expected runtime to be built from the deployment, agent and config; got {runtime!r}"
+    )
+    assert captured["key"].endswith("widget:runtime:dep-1"), f"Unexpected cache key {captured['key']!r}"
+    assert chat_runtime.DeploymentRuntime(**captured["value"]["value"]) == runtime, (
+        "Expected the cached payload to round-trip to the same runtime"
+    )
+
+
+def test_invalidate_deployment_runtime_deletes_cache(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(chat_runtime, "redis_delete", lambda key: deleted.append(key))
+
+    chat_runtime.invalidate_deployment_runtime("dep-1")
+
+    assert deleted and deleted[0].endswith("widget:runtime:dep-1"), (
+        f"Expected the deployment runtime key to be deleted; got {deleted!r}"
+    )
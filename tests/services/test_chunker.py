@@ -0,0 +1,50 @@
+from services import chunker
+
+
+def test_structured_chunks_never_span_headings():
+    segments = ["H1: Setup\nInstall the widget.\n", "H2: Keys\nCopy the key.\nH1: Billing\nPay monthly."]
+
+    chunks = list(chunker.iter_structured_chunks(segments, max_tokens=200))
+
+    paths = [chunk.heading_path for chunk in chunks]
+    assert paths == [("Setup",), ("Setup", "Keys"), ("Billing",)], (
+        f"Expected one chunk per section with nested heading paths; got {paths!r}"
+    )
+    assert chunks[2].text == "Billing\nPay monthly.", f"Expected heading-prefixed text; got {chunks[2].text!r}"
+
+
+def test_structured_chunks_respect_token_budget_and_keep_list_items_whole():
+    items = "\n".join(f"- item number {index} explains one step" for index in range(30))
+
+    chunks = list(chunker.iter_structured_chunks([items], max_tokens=40, overlap_tokens=0))
+
+    assert len(chunks) > 1, f"Expected the list to be split across chunks; got {len(chunks)}"
+    for chunk in chunks:
+        assert chunker.count_tokens(chunk.text) <= 40, f"Expected chunks within budget; got {chunk.text!r}"
+        assert all(line.startswith("- item") for line in chunk.text.split("\n")), (
+            f"Expected list items not to be cut mid-item; got {chunk.text!r}"
+        )
+
+
+def test_structured_chunks_split_oversized_paragraphs_at_sentences():
+    paragraph = " ".join(f"Sentence {index} is here." for index in range(40))
+
+    chunks = list(chunker.iter_structured_chunks([paragraph], max_tokens=30, overlap_tokens=8))
+
+    assert all(chunk.text.endswith(".") for chunk in chunks), (
+        f"Expected chunks to end on sentence boundaries; got {[chunk.text for chunk in chunks]!r}"
+    )
+    assert chunks[1].text.startswith(chunks[0].text.rsplit(". ", 1)[-1]), (
+        "Expected the next chunk to overlap with the last sentence of the previous one"
+    )
+
+
+def test_newline_free_text_is_chunked_in_bounded_pieces(monkeypatch):
+    monkeypatch.setattr(chunker, "KB_CHUNK_MAX_LINE_CHARS", 500)
+    page = " ".join(f"Sentence {index} describes the refund policy." for index in range(2000))
+
+    lines = list(chunker._iter_lines([page[: len(page) // 2], page[len(page) // 2 :]]))
+
+    assert max(len(line) for line in lines) <= 500, f"Expected bounded pseudo-lines; got {max(len(line) for line in lines)}"
+    assert "".join(lines) == page, "Expected cutting to preserve every character"
+    assert all(line.endswith(". ") for line in lines[:-1]), "Expected cuts to land after a sentence end"
@@ -0,0 +1,38 @@
+from services import dedup
+from services.vector_store import collapse_duplicate_hits
+
+
+BASE = " ".join(
+    f"Section {index} of the guide explains how the support team handles request number {index * 7}."
+    for index in range(12)
+)
+
+
+def test_near_duplicate_index_flags_exact_and_near_duplicates():
+    index = dedup.NearDuplicateIndex(max_distance=3)
+
+    first = index.is_duplicate(BASE)
+    exact = index.is_duplicate(BASE.upper() + "!")
+    near = index.is_duplicate(BASE.replace("request number 35", "request number 36"))
+    different = index.is_duplicate("Refunds are processed to the original payment method within five working days")
+
+    assert first is False, "Expected the first text to be kept"
+    assert exact is True, "Expected case and punctuation variants to count as exact duplicates"
+    assert near is True, "Expected a one-word edit to be detected as a near duplicate"
+    assert different is False, "Expected unrelated text to be kept"
+
+
+def test_short_texts_only_deduplicate_exactly():
+    index = dedup.NearDuplicateIndex(max_distance=3)
+
+    assert dedup.simhash64("Contact us") is None, "Expected short texts to have no fingerprint"
+    assert index.is_duplicate("Contact us") is False
+    assert index.is_duplicate("About us") is False, "Expected short distinct texts not to collide"
+
+
+def test_collapse_duplicate_hits_keeps_best_scoring_copy():
+    hits = [("Same text", 0.9), ("same text.", 0.8), ("Other", 0.7)]
+
+    collapsed = collapse_duplicate_hits(hits)
+
+    assert collapsed == [("Same text", 0.9), ("Other", 0.7)], f"Expected duplicates collapsed; got {collapsed!r}"
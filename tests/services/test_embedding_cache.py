@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+
+from services import embedding_cache, rag_service
+
+
+def test_embedding_cache_id_depends_on_model_task_and_text():
+    base = embedding_cache.embedding_cache_id("model-a", "retrieval.passage", "hello")
+
+    assert base == embedding_cache.embedding_cache_id("model-a", "retrieval.passage", "hello"), (
+        "Expected embedding_cache_id to be deterministic"
+    )
+    assert base != embedding_cache.embedding_cache_id("model-b", "retrieval.passage", "hello"), (
+        "Expected embedding_cache_id to change with the model"
+    )
+    assert base != embedding_cache.embedding_cache_id("model-a", "retrieval.query", "hello"), (
+        "Expected embedding_cache_id to change with the task"
+    )
+
+
+@pytest.mark.anyio
+async def test_disk_tier_round_trips_vectors(monkeypatch, tmp_path):
+    monkeypatch.setattr(embedding_cache, "EMBED_CACHE_DIR", str(tmp_path))
+
+    await embedding_cache.aset_cached_embeddings({"abc123": [0.5, -0.25, 1.0]})
+    found = await embedding_cache.aget_cached_embeddings(["abc123", "missing"])
+
+    found = {cache_id: vector.tolist() for cache_id, vector in found.items()}
+    assert found == {"abc123": [0.5, -0.25, 1.0]}, (
+        "Expected cached vector to be read back from the disk tier; "
+        f"got {found!r}"
+    )
+
+
+def test_disk_tier_prunes_least_recently_used_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(embedding_cache, "EMBED_CACHE_DIR", str(tmp_path))
+    ids = ["aa01", "aa02", "aa03", "aa04"]
+    embedding_cache._write_disk({cache_id: embedding_cache._encode([1.0] * 4) for cache_id in ids})
+    monkeypatch.setattr(embedding_cache, "EMBED_CACHE_MAX_BYTES", 40)
+    now = time.time()
+    for age, cache_id in enumerate(reversed(ids)):
+        os.utime(embedding_cache._disk_path(cache_id), (now - age * 60, now - age * 60))
+    embedding_cache._read_disk(["aa01"])
+
+    embedding_cache._prune_disk()
+
+    kept = sorted(cache_id for cache_id in ids if embedding_cache._disk_path(cache_id).exists())
+    assert kept == ["aa01", "aa04"], f"Expected the recently used files to survive; got {kept!r}"
+
+
+@pytest.mark.anyio
+async def test_aembed_texts_cached_only_embeds_misses(monkeypatch, tmp_path):
+    monkeypatch.setattr(embedding_cache, "EMBED_CACHE_DIR", str(tmp_path))
+    calls = []
+
+    async def fake_aembed_texts(texts, task="retrieval.passage", model=None):
+        values = list(texts)
+        calls.append(values)
+        return [[float(len(value))] for value in values]
+
+    monkeypatch.setattr(rag_service, "aembed_texts", fake_aembed_texts)
+
+    first = await rag_service.aembed_texts_cached(["a", "bb", "a"])
+    second = await rag_service.aembed_texts_cached(["bb", "a"])
+
+    assert first.tolist() == [[1.0], [2.0], [1.0]], f"Unexpected vectors on first call: {first!r}"
+    assert second.tolist() == [[2.0], [1.0]], f"Unexpected vectors on second call: {second!r}"
+    assert calls == [["a", "bb"]], (
+        "Expected only unique cache misses to reach the embedding API; "
+        f"got {calls!r}"
+    )
@@ -0,0 +1,71 @@
+import fitz
+
+from services import file_parser
+
+
+def _pdf_bytes(page_texts):
+    doc = fitz.open()
+    for text in page_texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_iter_pdf_pages_yields_cleaned_pages_in_order():
+    pdf = _pdf_bytes(["First   page", "", "Third page"])
+
+    pages = list(file_parser.iter_pdf_pages(pdf))
+
+    assert pages == ["First page", "Third page"], (
+        "Expected whitespace-normalized non-empty pages in order; "
+        f"got {pages!r}"
+    )
+
+
+def test_iter_pdf_pages_parallel_matches_serial(monkeypatch):
+    texts = [f"Page number {index}" for index in range(7)]
+    pdf = _pdf_bytes(texts)
+    monkeypatch.setattr(file_parser, "PDF_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(file_parser, "PDF_PAGES_PER_TASK", 2)
+    monkeypatch.setattr(file_parser, "PDF_EXTRACT_PROCESSES", 2)
+
+    pages = list(file_parser.iter_pdf_pages(pdf))
+
+    assert pages == texts, f"Expected page-range workers to preserve page order; got {pages!r}"
+
+
+def test_iter_pdf_pages_cancels_queued_ranges_when_consumer_stops(monkeypatch):
+    from concurrent.futures import Future
+
+    submitted = []
+
+    class FakePool:
+        def submit(self, fn, path, start, stop):
+            future = Future()
+            if not submitted:
+                future.set_result([f"Page {start}"])
+            submitted.append(future)
+            return future
+
+    monkeypatch.setattr(file_parser, "PDF_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(file_parser, "PDF_PAGES_PER_TASK", 1)
+    monkeypatch.setattr(file_parser, "PDF_EXTRACT_PROCESSES", 2)
+    monkeypatch.setattr(file_parser, "_get_pdf_pool", lambda: FakePool())
+    pages = file_parser.iter_pdf_pages(_pdf_bytes([f"Page {index}" for index in range(8)]))
+
+    assert next(pages) == "Page 0"
+    pages.close()
+
+    assert len(submitted) > 1 and all(future.cancelled() for future in submitted[1:]), (
+        f"Expected queued page ranges to be cancelled; got {[future._state for future in submitted]!r}"
+    )
+
+
+def test_extract_text_from_file_joins_pdf_pages():
+    pdf = _pdf_bytes(["Hello", "World"])
+
+    text = file_parser.extract_text_from_file(pdf, "doc.PDF")
+
+    assert text == "Hello World", f"Expected pages joined with a space; got {text!r}"
@@ -0,0 +1,96 @@
+import uuid
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.database import Base
+from db import models
+from services import ingest_broker
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine, autocommit=False, autoflush=False, expire_on_commit=False)
+    yield factory
+    engine.dispose()
+
+
+def _add_job(session_factory, **fields):
+    db = session_factory()
+    job = models.KBIngestJob(kb_id=uuid.uuid4(), state=models.JobState.queued, **fields)
+    db.add(job)
+    db.commit()
+    job_id = str(job.id)
+    db.close()
+    return job_id
+
+
+def _get_job(session_factory, job_id):
+    db = session_factory()
+    try:
+        return db.query(models.KBIngestJob).filter(models.KBIngestJob.id == uuid.UUID(job_id)).first()
+    finally:
+        db.close()
+
+
+def test_postgres_broker_claims_queued_job_with_lease(session_factory):
+    job_id = _add_job(session_factory)
+    broker = ingest_broker.PostgresIngestBroker(session_factory)
+
+    lease = broker.claim("worker-1", block_seconds=0)
+    job = _get_job(session_factory, job_id)
+
+    assert lease is not None and lease.job_id == job_id, f"Expected queued job to be claimed; got {lease!r}"
+    assert lease.attempt == 1, f"Expected first attempt; got {lease.attempt}"
+    assert job.state == models.JobState.running, f"Expected claimed job to be running; got {job.state}"
+    assert job.locked_by == "worker-1", f"Expected lease owner to be recorded; got {job.locked_by!r}"
+    assert broker.claim("worker-2", block_seconds=0) is None, "Expected a leased job not to be claimed twice"
+
+
+def test_postgres_broker_retry_delays_next_claim(session_factory):
+    _add_job(session_factory)
+    broker = ingest_broker.PostgresIngestBroker(session_factory)
+    lease = broker.claim("worker-1", block_seconds=0)
+
+    broker.retry(lease, delay_seconds=60)
+
+    assert broker.claim("worker-1", block_seconds=0) is None, "Expected retried job to wait for its backoff"
+
+
+def test_postgres_broker_recovers_expired_running_jobs(session_factory):
+    expired = ingest_broker._utcnow() - timedelta(seconds=5)
+    retryable = _add_job(session_factory, attempts=1, lease_expires_at=expired, locked_by="dead")
+    exhausted = _add_job(
+        session_factory,
+        attempts=ingest_broker.KB_INGEST_MAX_ATTEMPTS,
+        lease_expires_at=expired,
+        locked_by="dead",
+    )
+    db = session_factory()
+    db.query(models.KBIngestJob).update({models.KBIngestJob.state: models.JobState.running})
+    db.commit()
+    db.close()
+
+    recovered = ingest_broker.PostgresIngestBroker(session_factory).recover_stale_jobs()
+
+    assert recovered == 2, f"Expected both expired leases to be recovered; got {recovered}"
+    assert _get_job(session_factory, retryable).state == models.JobState.queued, (
+        "Expected job with attempts left to be requeued"
+    )
+    assert _get_job(session_factory, exhausted).state == models.JobState.failed, (
+        "Expected job without attempts left to be failed"
+    )
+
+
+def test_retry_delay_grows_with_attempts(monkeypatch):
+    monkeypatch.setattr(ingest_broker.random, "uniform", lambda _a, _b: 1.0)
+    monkeypatch.setattr(ingest_broker, "KB_INGEST_RETRY_BASE_SECONDS", 10.0)
+    monkeypatch.setattr(ingest_broker, "KB_INGEST_RETRY_MAX_SECONDS", 35.0)
+
+    delays = [ingest_broker.retry_delay_seconds(attempt) for attempt in (1, 2, 3)]
+
+    assert delays == [10.0, 20.0, 35.0], f"Expected capped exponential backoff; got {delays!r}"
@@ -0,0 +1,74 @@
+from services import ingest_scheduler
+from services.ingest_scheduler import BULK_LANE, INTERACTIVE_LANE, IngestScheduler, ScheduledJob
+
+
+def _scheduler(**kwargs):
+    return IngestScheduler(
+        lane_limits={INTERACTIVE_LANE: 10, BULK_LANE: 10},
+        tenant_limits={INTERACTIVE_LANE: 5, BULK_LANE: 5},
+        **kwargs,
+    )
+
+
+def _drain(scheduler):
+    order = []
+    while (job := scheduler.pop()) is not None:
+        order.append(job.job_id)
+    return order
+
+
+def test_interactive_jobs_run_before_bulk_jobs():
+    scheduler = _scheduler()
+    scheduler.push(ScheduledJob(job_id="bulk-1", user_id=1, lane=BULK_LANE))
+    scheduler.push(ScheduledJob(job_id="upload-1", user_id=2, lane=INTERACTIVE_LANE))
+
+    order = _drain(scheduler)
+
+    assert order == ["upload-1", "bulk-1"], f"Expected interactive lane to be served first; got {order!r}"
+
+
+def test_tenants_are_round_robined_by_weight():
+    scheduler = _scheduler(weights={1: 2})
+    for index in range(3):
+        scheduler.push(ScheduledJob(job_id=f"a{index}", user_id=1, lane=BULK_LANE))
+        scheduler.push(ScheduledJob(job_id=f"b{index}", user_id=2, lane=BULK_LANE))
+
+    order = _drain(scheduler)
+
+    assert order == ["a0", "a1", "b0", "a2", "b1", "b2"], (
+        f"Expected weighted round-robin across tenants; got {order!r}"
+    )
+
+
+def test_tenant_limit_leaves_room_for_other_tenants():
+    scheduler = _scheduler()
+    accepted = [scheduler.push(ScheduledJob(job_id=f"a{i}", user_id=1, lane=BULK_LANE)) for i in range(6)]
+
+    assert accepted == [True] * 5 + [False], f"Expected per-tenant cap to reject the sixth job; got {accepted!r}"
+    assert scheduler.push(ScheduledJob(job_id="b0", user_id=2, lane=BULK_LANE)), (
+        "Expected another tenant to still be admitted"
+    )
+
+
+def test_stale_bulk_jobs_are_not_starved():
+    scheduler = _scheduler(bulk_max_wait_seconds=0)
+    scheduler.push(ScheduledJob(job_id="bulk-1", user_id=1, lane=BULK_LANE))
+    scheduler.push(ScheduledJob(job_id="upload-1", user_id=2, lane=INTERACTIVE_LANE))
+
+    assert scheduler.pop().job_id == "bulk-1", "Expected an overdue bulk job to be served first"
+
+
+def test_stats_report_depth_per_lane():
+    scheduler = _scheduler()
+    scheduler.push(ScheduledJob(job_id="bulk-1", user_id=1, lane=BULK_LANE))
+
+    stats = scheduler.stats()
+
+    assert stats[BULK_LANE]["depth"] == 1, f"Expected bulk depth of 1; got {stats[BULK_LANE]!r}"
+    assert stats[INTERACTIVE_LANE]["depth"] == 0, f"Expected empty interactive lane; got {stats[INTERACTIVE_LANE]!r}"
+
+
+def test_parse_tenant_weights_ignores_invalid_entries():
+    weights = ingest_scheduler.parse_tenant_weights("12:3, bad, 40:0,x:2")
+
+    assert weights == {12: 3, 40: 1}, f"Unexpected parsed weights: {weights!r}"
@@ -0,0 +1,75 @@
+from services import lexical_index
+
+
+def test_tokenize_keeps_compound_codes_and_their_parts():
+    tokens = lexical_index.tokenize("Error ERR-404 on plan Pro_Max")
+
+    assert "err-404" in tokens and "404" in tokens, f"Expected code and parts; got {tokens!r}"
+    assert "pro_max" in tokens and "max" in tokens, f"Expected plan name and parts; got {tokens!r}"
+
+
+def test_bm25_ranks_exact_term_matches_first():
+    index = lexical_index.BM25Index(
+        [
+            "General troubleshooting steps for the dashboard.",
+            "If you see ERR-404 the page was not found; retry later.",
+            "Errors are logged and reviewed weekly.",
+        ]
+    )
+
+    hits = index.search("what does err-404 mean", top_k=3)
+
+    assert hits and "ERR-404" in hits[0][0], f"Expected the exact code to rank first; got {hits!r}"
+    assert index.search("nonexistent", top_k=3) == [], "Expected no hits for unknown terms"
+
+
+class InlinePool:
+    def __init__(self):
+        self.queued = []
+
+    def submit(self, fn, *args):
+        self.queued.append((fn, args))
+
+    def run(self):
+        while self.queued:
+            fn, args = self.queued.pop(0)
+            fn(*args)
+
+
+def test_lexical_index_is_built_in_background_and_cached_per_version(monkeypatch):
+    builds = []
+
+    def fake_texts(namespace):
+        builds.append(namespace)
+        return iter([("a", "alpha beta")])
+
+    pool = InlinePool()
+    monkeypatch.setattr(lexical_index, "iter_namespace_texts", fake_texts)
+    monkeypatch.setattr(lexical_index, "_build_pool", pool)
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_TTL_SECONDS", 0)
+    lexical_index.invalidate_lexical_index("ns-cache")
+
+    assert lexical_index.lexical_search("ns-cache", "alpha", 1, version=1) == [], "Expected no hits while building"
+    lexical_index.lexical_search("ns-cache", "alpha", 1, version=1)
+    pool.run()
+    hits = lexical_index.lexical_search("ns-cache", "alpha", 1, version=1)
+    lexical_index.lexical_search("ns-cache", "beta", 1, version=1)
+    pool.run()
+
+    assert [text for text, _ in hits] == ["alpha beta"], f"Expected the built index to answer; got {hits!r}"
+    assert builds == ["ns-cache"], f"Expected one build per version despite the elapsed TTL; got {builds!r}"
+
+    assert lexical_index.lexical_search("ns-cache", "alpha", 1, version=2) == [], (
+        "Expected an index from an older version not to be served"
+    )
+    pool.run()
+    assert builds == ["ns-cache", "ns-cache"], f"Expected a rebuild for the new version; got {builds!r}"
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    dense = [("a", 0.9), ("b", 0.8), ("c", 0.7)]
+    lexical = [("c", 12.0), ("d", 3.0)]
+
+    fused = lexical_index.reciprocal_rank_fusion([dense, lexical], top_k=2, k=60)
+
+    assert [text for text, _ in fused] == ["c", "a"], f"Expected the text found by both legs first; got {fused!r}"
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from services import local_embeddings, rag_service
+
+
+class FakeModel:
+    prompts = {"query": "query: ", "document": "passage: "}
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, prompt_name=None, **_kwargs):
+        self.calls.append((list(texts), prompt_name))
+        return np.ones((len(texts), 3), dtype=np.float64)
+
+
+def test_encode_batch_uses_task_prompt_and_returns_float32(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setitem(local_embeddings._worker_models, "fake/model", model)
+
+    vectors = local_embeddings._encode_batch("fake/model", ["a", "b"], "retrieval.passage")
+    local_embeddings._encode_batch("fake/model", ["q"], "retrieval.query")
+
+    assert vectors.dtype == np.float32 and vectors.shape == (2, 3), f"Expected float32 rows; got {vectors!r}"
+    assert [prompt for _, prompt in model.calls] == ["document", "query"], f"Expected task prompts; got {model.calls!r}"
+
+
+def test_validate_embedding_model_only_allows_configured_local_models(monkeypatch):
+    monkeypatch.setattr(rag_service, "LOCAL_EMBED_MODELS", ["BAAI/bge-m3"])
+
+    rag_service.validate_embedding_model(None)
+    rag_service.validate_embedding_model("local:BAAI/bge-m3")
+    with pytest.raises(ValueError):
+        rag_service.validate_embedding_model("local:someone/untrusted-model")
+
+
+@pytest.mark.anyio
+async def test_aembed_texts_routes_local_models_to_the_process_pool(monkeypatch):
+    seen = []
+
+    async def fake_local(model_id, texts, task):
+        seen.append((model_id, list(texts), task))
+        return np.full((len(texts), 2), 0.5, dtype=np.float32)
+
+    monkeypatch.setattr(rag_service, "aembed_local", fake_local)
+
+    vectors = await rag_service.aembed_texts(["hi"], task="retrieval.query", model="local:BAAI/bge-m3")
+
+    assert vectors.tolist() == [[0.5, 0.5]], f"Expected the local vectors; got {vectors!r}"
+    assert seen == [("BAAI/bge-m3", ["hi"], "retrieval.query")], f"Expected the model id without prefix; got {seen!r}"
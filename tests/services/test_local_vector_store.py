@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from services import local_vector_store
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_vector_store, "LOCAL_VECTOR_DIR", tmp_path)
+    return local_vector_store.LocalVectorBackend()
+
+
+def test_local_backend_returns_nearest_texts_by_cosine(backend):
+    backend.upsert_texts("ns", "kb-1", "agent", ["east", "north", "west"], [[1, 0], [0, 1], [-1, 0]], ids=["a", "b", "c"])
+
+    hits = backend.search("ns", [0.9, 0.1], limit=2)
+
+    assert [text for text, _ in hits] == ["east", "north"], f"Expected cosine ordering; got {hits!r}"
+    assert hits[0][1] == pytest.approx(0.9939, abs=1e-3), f"Expected cosine similarity scores; got {hits!r}"
+    assert backend.search("other", [1, 0], limit=2) == [], "Expected unknown namespaces to return no hits"
+
+
+def test_local_backend_upsert_replaces_ids_and_deletes_by_kb(backend):
+    backend.upsert_texts("ns", "kb-1", "agent", ["old"], [[1, 0]], ids=["a"])
+    backend.upsert_texts("ns", "kb-1", "agent", ["new"], [[1, 0]], ids=["a"])
+    backend.upsert_texts("ns", "kb-2", "agent", ["other"], [[0, 1]], ids=["b"])
+
+    assert [text for text, _ in backend.search("ns", [1, 0], limit=5)] == ["new", "other"], (
+        "Expected an upsert to replace the row with the same id"
+    )
+    assert backend.list_ids_for_kb("ns", "kb-1") == {"a"}, "Expected ids to be listed per KB"
+
+    backend.delete_for_kb("ns", "kb-1")
+
+    assert backend.list_ids_for_kb("ns", "kb-1") == set(), "Expected KB rows to be deleted"
+    assert [text for text, _ in backend.search("ns", [1, 0], limit=5)] == ["other"]
+
+
+def test_local_backend_sees_writes_from_other_instances_and_compaction(backend, monkeypatch):
+    reader = local_vector_store.LocalVectorBackend()
+    ids = [f"id-{index}" for index in range(1200)]
+    vectors = np.random.default_rng(1).normal(size=(1200, 4)).tolist()
+    backend.upsert_texts("ns", "kb-1", "agent", ids, vectors, ids=ids)
+    assert reader.search("ns", vectors[5], limit=1)[0][0] == "id-5", "Expected a second instance to read new rows"
+
+    backend.delete_ids("ns", ids[:600])
+
+    assert reader.list_ids_for_kb("ns", "kb-1") == set(ids[600:]), "Expected deletes to survive compaction"
+    assert reader.search("ns", vectors[900], limit=1)[0][0] == "id-900", (
+        "Expected compacted rows to stay aligned with their vectors"
+    )
+
+
+def test_local_backend_ivf_is_built_in_background_and_finds_exact_neighbours(backend, monkeypatch):
+    builds = []
+    monkeypatch.setattr(local_vector_store, "LOCAL_VECTOR_IVF_MIN_ROWS", 100)
+    monkeypatch.setattr(local_vector_store, "LOCAL_VECTOR_IVF_NPROBE", 4)
+    monkeypatch.setattr(local_vector_store, "_submit_ivf_build", lambda fn, *args: builds.append((fn, args)))
+    vectors = np.random.default_rng(2).normal(size=(2000, 16)).astype(np.float32)
+    ids = [str(index) for index in range(2000)]
+    backend.upsert_texts("ns", "kb-1", "agent", ids, vectors.tolist(), ids=ids)
+
+    assert backend.search("ns", vectors[0].tolist(), limit=1)[0][0] == "0", "Expected an exact scan while building"
+    backend.search("ns", vectors[1].tolist(), limit=1)
+    assert len(builds) == 1 and backend._index("ns").ivf is None, f"Expected one pending build; got {len(builds)}"
+
+    fn, args = builds.pop()
+    fn(*args)
+    found = sum(backend.search("ns", vectors[index].tolist(), limit=1)[0][0] == ids[index] for index in range(50))
+
+    assert backend._index("ns").ivf is not None, "Expected the finished build to be used"
+    assert found >= 48, f"Expected IVF probes to find the query's own row; got {found}/50"
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_local_backend_quantized_storage_keeps_cosine_ranking(backend, monkeypatch, dtype):
+    monkeypatch.setattr(local_vector_store, "VECTOR_STORAGE_DTYPE", dtype)
+    rng = np.random.default_rng(3)
+    vectors = rng.normal(size=(50, 64)).astype(np.float32)
+    backend.upsert_texts("ns", "kb-1", "agent", [f"t{i}" for i in range(50)], vectors, ids=[str(i) for i in range(50)])
+
+    hits = backend.search("ns", vectors[7] + 0.01, limit=3)
+
+    assert hits[0][0] == "t7", f"Expected the nearest vector first with {dtype} storage; got {hits!r}"
+    assert hits[0][1] == pytest.approx(1.0, abs=0.02), f"Expected cosine-scaled scores; got {hits!r}"
+    assert backend._index("ns").matrix.dtype == np.dtype(dtype), "Expected vectors stored in the configured dtype"
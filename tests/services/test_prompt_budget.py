@@ -0,0 +1,92 @@
+from services import prompt_budget, rag_service
+
+
+def _small_budget(monkeypatch, tokens):
+    monkeypatch.setattr(prompt_budget, "PROMPT_MAX_INPUT_TOKENS", tokens)
+    monkeypatch.setattr(prompt_budget, "count_tokens", lambda _model, text: len(text.split()))
+
+
+def test_trim_to_tokens_cuts_at_sentence_boundaries(monkeypatch):
+    monkeypatch.setattr(prompt_budget, "count_tokens", lambda _model, text: len(text.split()))
+    text = "Refunds take five days. Contact billing for faster refunds. Shipping is free."
+
+    head = prompt_budget.trim_to_tokens("m", text, 10)
+    tail = prompt_budget.trim_to_tokens("m", text, 5, keep="tail")
+
+    assert head == "Refunds take five days.", f"Expected only whole leading sentences; got {head!r}"
+    assert tail == "Shipping is free.", f"Expected only whole trailing sentences; got {tail!r}"
+
+
+def test_trim_to_tokens_keeps_line_breaks_and_lists(monkeypatch):
+    monkeypatch.setattr(prompt_budget, "count_tokens", lambda _model, text: len(text.split()))
+    text = "## Steps\n- Open settings.\n- Pick a plan.\n\n- Confirm payment now please."
+
+    head = prompt_budget.trim_to_tokens("m", text, 9)
+    tail = prompt_budget.trim_to_tokens("m", text, 12, keep="tail")
+
+    assert head == "## Steps\n- Open settings.", f"Expected the original line breaks; got {head!r}"
+    assert tail == "- Pick a plan.\n\n- Confirm payment now please.", f"Expected the original separators; got {tail!r}"
+
+
+def test_trim_to_tokens_cuts_inside_an_oversized_first_sentence(monkeypatch):
+    monkeypatch.setattr(prompt_budget, "count_tokens", lambda _model, text: len(text.split()))
+    text = "always answer politely and cite the policy " * 20
+
+    head = prompt_budget.trim_to_tokens("m", text, 10)
+    tail = prompt_budget.trim_to_tokens("m", text, 4, keep="tail")
+
+    assert head == " ".join(text.split()[:10]), f"Expected the first ten words; got {head!r}"
+    assert tail == "and cite the policy", f"Expected the last words; got {tail!r}"
+
+
+def test_allocate_prompt_keeps_unpunctuated_instructions(monkeypatch):
+    _small_budget(monkeypatch, 300)
+    instructions = "you are the support agent for acme answer in english " * 100
+
+    parts = prompt_budget.allocate_prompt("m", instructions, "", "question?")
+
+    assert parts.system and instructions.startswith(parts.system), (
+        f"Expected over-long instructions to be cut, not dropped; got {parts.system[:40]!r}"
+    )
+
+
+def test_allocate_prompt_trims_overflowing_chunk_instead_of_dropping_it(monkeypatch):
+    _small_budget(monkeypatch, 300)
+    first = "alpha " * 40
+    second = "Beta sentence one. " + "Beta filler words here. " * 60
+
+    parts = prompt_budget.allocate_prompt("m", "Be helpful.", f"{first.strip()}\n\n{second.strip()}", "question?")
+
+    chunks = parts.context.split("\n\n")
+    assert len(chunks) == 2, f"Expected the second chunk to be kept in trimmed form; got {len(chunks)} chunks"
+    assert chunks[1].startswith("Beta sentence one.") and chunks[1].endswith("."), (
+        f"Expected the trimmed chunk to end on a sentence boundary; got {chunks[1][-40:]!r}"
+    )
+    assert len(chunks[1]) < len(second.strip()), "Expected the overflowing chunk to be shortened"
+
+
+def test_allocate_prompt_caps_long_instructions_and_keeps_recent_history(monkeypatch):
+    _small_budget(monkeypatch, 400)
+    instructions = "Follow the policy carefully. " * 200
+    history = [{"role": "user", "content": f"turn {index} " + "word " * 30} for index in range(10)]
+
+    parts = prompt_budget.allocate_prompt("m", instructions, "Some context.", "question?", history)
+
+    system_tokens = len(parts.system.split())
+    assert 0 < system_tokens <= 400 * prompt_budget.PROMPT_SYSTEM_MAX_SHARE, (
+        f"Expected instructions to be capped to their share; got {system_tokens} tokens"
+    )
+    assert parts.history and parts.history[-1] == history[-1], (
+        f"Expected the most recent turn to be kept; got {parts.history[-1:]!r}"
+    )
+    assert len(parts.history) < len(history), "Expected older turns to be dropped"
+    assert parts.context == "Some context.", f"Expected short context to be kept whole; got {parts.context!r}"
+
+
+def test_build_messages_without_model_keeps_everything():
+    history = [{"role": "user", "content": "hi"}]
+
+    messages = rag_service.build_messages("sys", "ctx", "question", history=history)
+
+    assert messages[1] == history[0], f"Expected history to be passed through; got {messages!r}"
+    assert "ctx" in messages[0]["content"], f"Expected context in the system message; got {messages[0]!r}"
@@ -0,0 +1,437 @@
+import base64
+
+import anyio
+import numpy as np
+import pytest
+
+from services import chunker, rag_service, semantic_cache
+
+
+@pytest.fixture(autouse=True)
+def _fresh_semantic_cache(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "_caches", semantic_cache.OrderedDict())
+    monkeypatch.setattr(semantic_cache, "_versions", {})
+
+
+def test_chunk_id_is_stable_per_kb_and_text():
+    first = rag_service.chunk_id("kb-1", "hello world")
+
+    assert first == rag_service.chunk_id("kb-1", "hello world"), "Expected chunk_id to be deterministic"
+    assert first != rag_service.chunk_id("kb-2", "hello world"), (
+        "Expected identical text in different KBs to get different ids"
+    )
+    assert len(first) <= 64, f"Expected chunk ids to fit the Milvus id field; got {len(first)} chars"
+
+
+@pytest.mark.anyio
+async def test_aindex_kb_text_incremental_only_touches_changed_chunks(monkeypatch):
+    text_value = "alpha beta gamma delta"
+    chunks = rag_service.chunk_text(text_value, size=1000)
+    unchanged_id = rag_service.chunk_id("kb-1", chunks[0])
+    upserted = []
+    deleted = []
+
+    monkeypatch.setattr(rag_service, "KB_CHUNKING_STRATEGY", "fixed")
+    monkeypatch.setattr(rag_service, "list_ids_for_kb", lambda _ns, _kb: {unchanged_id, "stale-id"})
+
+    async def fake_embed(texts, task="retrieval.passage", model=None):
+        raise AssertionError(f"Expected no embedding calls for unchanged text; got {texts!r}")
+
+    monkeypatch.setattr(rag_service, "aembed_texts_cached", fake_embed)
+    monkeypatch.setattr(rag_service, "upsert_texts", lambda *args, **kwargs: upserted.append(args))
+    monkeypatch.setattr(rag_service, "delete_ids", lambda _ns, ids: deleted.extend(ids))
+
+    count = await rag_service.aindex_kb_text(
+        db=None,
+        user_id=1,
+        agent_id="agent-1",
+        kb_id="kb-1",
+        namespace="ns",
+        text_value=text_value,
+        incremental=True,
+    )
+
+    assert count == 1, f"Expected one indexed chunk; got {count}"
+    assert upserted == [], f"Expected unchanged chunks to be skipped; got {upserted!r}"
+    assert deleted == ["stale-id"], f"Expected only stale ids to be deleted; got {deleted!r}"
+
+
+@pytest.mark.anyio
+async def test_aindex_kb_text_pipeline_upserts_every_batch_and_reports_progress(monkeypatch):
+    text_value = " ".join(f"word{i}" for i in range(400))
+    upserted = []
+    progress = []
+    monkeypatch.setattr(rag_service, "KB_CHUNKING_STRATEGY", "fixed")
+
+    async def fake_embed(texts, task="retrieval.passage", model=None):
+        return [[0.0] for _ in texts]
+
+    monkeypatch.setattr(rag_service, "aembed_texts_cached", fake_embed)
+    monkeypatch.setattr(
+        rag_service,
+        "upsert_texts",
+        lambda _ns, _kb, _agent, texts, _vectors, metadatas=None, ids=None: upserted.extend(ids),
+    )
+
+    count = await rag_service.aindex_kb_text(
+        db=None,
+        user_id=1,
+        agent_id="agent-1",
+        kb_id="kb-1",
+        namespace="ns",
+        text_value=text_value,
+        batch_size=1,
+        on_batch=lambda done, total: progress.append((done, total)),
+    )
+
+    total = len(rag_service.chunk_text(text_value))
+    assert count == total, f"Expected {total} indexed chunks; got {count}"
+    assert len(upserted) == total, f"Expected every chunk to be upserted; got {len(upserted)}"
+    assert progress[-1] == (total, total), f"Expected final progress to cover all chunks; got {progress[-1]!r}"
+
+
+@pytest.mark.anyio
+async def test_aindex_kb_text_pipeline_surfaces_stage_errors(monkeypatch):
+    async def failing_embed(texts, task="retrieval.passage", model=None):
+        raise RuntimeError("embedding failed")
+
+    monkeypatch.setattr(rag_service, "aembed_texts_cached", failing_embed)
+
+    with pytest.raises(RuntimeError) as exc:
+        await rag_service.aindex_kb_text(
+            db=None,
+            user_id=1,
+            agent_id="agent-1",
+            kb_id="kb-1",
+            namespace="ns",
+            text_value="some text",
+        )
+
+    assert str(exc.value) == "embedding failed", (
+        "Expected the original stage error rather than an exception group; "
+        f"got {exc.value!r}"
+    )
+
+
+def _reference_chunks(text_value, size, overlap):
+    cleaned = " ".join(text_value.split())
+    chunks = []
+    start = 0
+    while start < len(cleaned):
+        end = min(start + size, len(cleaned))
+        if end < len(cleaned):
+            cut = cleaned.rfind(" ", start + 1, end)
+            if cut > start + size // 2:
+                end = cut
+        chunks.append(cleaned[start:end])
+        start = end - overlap if end < len(cleaned) else end
+    return chunks
+
+
+def test_iter_chunks_matches_whole_text_chunking_across_segment_boundaries():
+    words = [f"w{i}" + ("\n\n" if i % 7 == 0 else "  ") for i in range(900)]
+    text_value = "  " + "".join(words)
+    segments = [text_value[i : i + 37] for i in range(0, len(text_value), 37)]
+
+    streamed = list(rag_service.iter_chunks(segments, size=200, overlap=30))
+
+    expected = _reference_chunks(text_value, size=200, overlap=30)
+    assert streamed == expected, "Expected streamed chunks to match chunking of the joined text"
+
+
+@pytest.mark.anyio
+async def test_aindex_kb_text_accepts_segment_iterables(monkeypatch):
+    text_value = " ".join(f"word{i}" for i in range(600))
+    segments = (text_value[i : i + 500] for i in range(0, len(text_value), 500))
+    upserted = []
+    progress = []
+    monkeypatch.setattr(rag_service, "KB_CHUNKING_STRATEGY", "fixed")
+
+    async def fake_embed(texts, task="retrieval.passage", model=None):
+        return [[0.0] for _ in texts]
+
+    monkeypatch.setattr(rag_service, "aembed_texts_cached", fake_embed)
+    monkeypatch.setattr(
+        rag_service,
+        "upsert_texts",
+        lambda _ns, _kb, _agent, texts, _vectors, metadatas=None, ids=None: upserted.extend(texts),
+    )
+
+    count = await rag_service.aindex_kb_text(
+        db=None,
+        user_id=1,
+        agent_id="agent-1",
+        kb_id="kb-1",
+        namespace="ns",
+        text_value=segments,
+        batch_size=2,
+        on_batch=lambda done, total: progress.append((done, total)),
+    )
+
+    expected = rag_service.chunk_text(text_value)
+    assert upserted == expected, "Expected segment input to index the same chunks as the joined string"
+    assert count == len(expected), f"Expected {len(expected)} indexed chunks; got {count}"
+    assert progress[-1] == (len(expected), len(expected)), (
+        f"Expected final progress to report the real total; got {progress[-1]!r}"
+    )
+
+
+@pytest.mark.anyio
+async def test_aindex_kb_text_passes_heading_paths_as_metadata(monkeypatch):
+    text_value = "H1: Billing\nInvoices are sent monthly.\nH2: Refunds\nRefunds take five days."
+    upserted = []
+
+    async def fake_embed(texts, task="retrieval.passage", model=None):
+        return [[0.0] for _ in texts]
+
+    monkeypatch.setattr(rag_service, "KB_CHUNKING_STRATEGY", "structured")
+    monkeypatch.setattr(rag_service, "aembed_texts_cached", fake_embed)
+    monkeypatch.setattr(
+        rag_service,
+        "upsert_texts",
+        lambda _ns, _kb, _agent, texts, _vectors, metadatas=None, ids=None: upserted.extend(zip(texts, metadatas)),
+    )
+
+    await rag_service.aindex_kb_text(
+        db=None,
+        user_id=1,
+        agent_id="agent-1",
+        kb_id="kb-1",
+        namespace="ns",
+        text_value=text_value,
+    )
+
+    assert upserted == [
+        ("Billing\nInvoices are sent monthly.", {"heading_path": "Billing"}),
+        ("Billing > Refunds\nRefunds take five days.", {"heading_path": "Billing > Refunds"}),
+    ], f"Expected one chunk per section with its heading path; got {upserted!r}"
+
+
+@pytest.mark.anyio
+async def test_aindex_kb_text_skips_duplicate_chunks_and_counts_them(monkeypatch):
+    footer = "Copyright Example Corp all rights reserved contact support at example dot com for help"
+    text_value = f"H1: One\nFirst page body.\n\n{footer}\nH1: Two\nSecond page body.\n\n{footer}"
+    upserted = []
+
+    async def fake_embed(texts, task="retrieval.passage", model=None):
+        return [[0.0] for _ in texts]
+
+    monkeypatch.setattr(rag_service, "KB_CHUNKING_STRATEGY", "structured")
+    monkeypatch.setattr(rag_service, "aembed_texts_cached", fake_embed)
+    monkeypatch.setattr(
+        rag_service,
+        "upsert_texts",
+        lambda _ns, _kb, _agent, texts, _vectors, metadatas=None, ids=None: upserted.extend(texts),
+    )
+    monkeypatch.setattr(chunker, "KB_CHUNK_MAX_TOKENS", 25)
+    stats = rag_service.IndexStats()
+
+    count = await rag_service.aindex_kb_text(
+        db=None,
+        user_id=1,
+        agent_id="agent-1",
+        kb_id="kb-1",
+        namespace="ns",
+        text_value=text_value,
+        stats=stats,
+    )
+
+    footers = [text for text in upserted if "Copyright" in text]
+    assert len(footers) == 1, f"Expected the repeated footer to be stored once; got {footers!r}"
+    assert stats.skipped == stats.chunks - count, f"Expected skipped chunks to be counted; got {stats!r}"
+    assert stats.skipped >= 1, f"Expected at least one skipped chunk; got {stats!r}"
+
+
+@pytest.mark.anyio
+async def test_aretrieve_context_fuses_dense_and_lexical_results(monkeypatch):
+    async def fake_embed(texts, task="retrieval.query", model=None):
+        return [[0.1]]
+
+    async def no_cache(_key):
+        return None
+
+    async def store(*_args):
+        return None
+
+    monkeypatch.setattr(rag_service, "RAG_HYBRID_ENABLED", True)
+    monkeypatch.setattr(rag_service, "RAG_RERANK_MODE", "off")
+    monkeypatch.setattr(rag_service, "aembed_texts", fake_embed)
+    monkeypatch.setattr(rag_service, "aredis_get_json", no_cache)
+    monkeypatch.setattr(rag_service, "aredis_set_json", store)
+    monkeypatch.setattr(rag_service, "milvus_search", lambda _ns, _vec, top_k: [("dense only", 0.9), ("both", 0.8)])
+    monkeypatch.setattr(rag_service, "lexical_search", lambda _ns, _query, _k, _version=None: [("both", 7.0), ("SKU-42 sheet", 5.0)])
+
+    context = await rag_service.aretrieve_context(None, "ns", "agent", "price for SKU-42", top_k=3)
+
+    assert context.split("\n\n") == ["both", "dense only", "SKU-42 sheet"], (
+        f"Expected RRF order with the shared hit first; got {context!r}"
+    )
+
+
+@pytest.mark.anyio
+async def test_aretrieve_context_hybrid_mmr_keeps_depth_for_near_tied_dense_scores(monkeypatch):
+    async def fake_embed(texts, task="retrieval.query", model=None):
+        return [[0.1]]
+
+    async def no_cache(_key):
+        return None
+
+    async def store(*_args):
+        return None
+
+    dense = [("alpha refunds", 0.9), ("bravo shipping", 0.89), ("charlie billing", 0.88), ("delta invoices", 0.87)]
+    lexical = [("alpha refunds", 9.0), ("xray codes", 4.0), ("yankee plans", 3.0)]
+    monkeypatch.setattr(rag_service, "RAG_HYBRID_ENABLED", True)
+    monkeypatch.setattr(rag_service, "RAG_RERANK_MODE", "mmr")
+    monkeypatch.setattr(rag_service, "aembed_texts", fake_embed)
+    monkeypatch.setattr(rag_service, "aredis_get_json", no_cache)
+    monkeypatch.setattr(rag_service, "aredis_set_json", store)
+    monkeypatch.setattr(rag_service, "milvus_search", lambda _ns, _vec, top_k: dense)
+    monkeypatch.setattr(rag_service, "lexical_search", lambda _ns, _query, _k, _version=None: lexical)
+
+    context = await rag_service.aretrieve_context(None, "ns", "agent", "alpha refunds", top_k=4)
+
+    chunks = context.split("\n\n")
+    assert len(chunks) == 4, f"Expected near-tied dense scores to keep the full depth; got {chunks!r}"
+    assert chunks[0] == "alpha refunds", f"Expected the hit found by both legs first; got {chunks!r}"
+
+
+@pytest.mark.anyio
+async def test_aretrieve_context_keeps_dense_results_when_lexical_fails(monkeypatch):
+    async def fake_embed(texts, task="retrieval.query", model=None):
+        return [[0.1]]
+
+    async def no_cache(_key):
+        return None
+
+    async def store(*_args):
+        return None
+
+    def broken_lexical(_ns, _query, _k, _version=None):
+        raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(rag_service, "RAG_HYBRID_ENABLED", True)
+    monkeypatch.setattr(rag_service, "aembed_texts", fake_embed)
+    monkeypatch.setattr(rag_service, "aredis_get_json", no_cache)
+    monkeypatch.setattr(rag_service, "aredis_set_json", store)
+    monkeypatch.setattr(rag_service, "milvus_search", lambda _ns, _vec, top_k: [("dense", 0.9)])
+    monkeypatch.setattr(rag_service, "lexical_search", broken_lexical)
+
+    context = await rag_service.aretrieve_context(None, "ns", "agent", "how do refunds work", top_k=3)
+
+    assert context == "dense", f"Expected dense results to survive a lexical failure; got {context!r}"
+
+
+@pytest.mark.anyio
+async def test_aretrieve_context_reuses_context_for_paraphrased_queries(monkeypatch):
+    vectors = {"how do refunds work": [1.0, 0.0], "how does a refund work": [0.99, 0.05]}
+    searches = []
+
+    async def fake_embed(texts, task="retrieval.query", model=None):
+        return [vectors[texts[0]]]
+
+    async def no_cache(_key):
+        return None
+
+    async def store(*_args):
+        return None
+
+    def fake_search(_ns, vec, top_k):
+        searches.append(vec)
+        return [("Refunds take 5 days.", 0.9)]
+
+    monkeypatch.setattr(rag_service, "RAG_HYBRID_ENABLED", False)
+    monkeypatch.setattr(rag_service, "aembed_texts", fake_embed)
+    monkeypatch.setattr(rag_service, "aredis_get_json", no_cache)
+    monkeypatch.setattr(rag_service, "aredis_set_json", store)
+    monkeypatch.setattr(semantic_cache, "aredis_get_json", no_cache)
+    monkeypatch.setattr(semantic_cache, "RAG_SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(rag_service, "milvus_search", fake_search)
+
+    first = await rag_service.aretrieve_context(None, "ns", "agent", "how do refunds work", top_k=3)
+    second = await rag_service.aretrieve_context(None, "ns", "agent", "how does a refund work", top_k=3)
+
+    assert second == first == "Refunds take 5 days.", f"Expected the cached context; got {second!r}"
+    assert len(searches) == 1, f"Expected the paraphrase to skip the vector search; got {searches!r}"
+
+
+@pytest.mark.anyio
+async def test_query_embedding_batcher_coalesces_concurrent_queries(monkeypatch):
+    calls = []
+
+    async def fake_embed(texts, task="retrieval.query", model=None):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(rag_service, "aembed_texts", fake_embed)
+    batcher = rag_service.QueryEmbeddingBatcher("retrieval.query", max_batch=8, max_wait_ms=50)
+    results = {}
+
+    async def ask(text):
+        results[text] = await batcher.embed(text)
+
+    async with anyio.create_task_group() as tg:
+        for text in ["a", "bb", "ccc", "bb"]:
+            tg.start_soon(ask, text)
+
+    assert calls == [["a", "bb", "ccc"]], f"Expected one call with distinct texts; got {calls!r}"
+    assert results == {"a": [1.0], "bb": [2.0], "ccc": [3.0]}, f"Expected vectors fanned back; got {results!r}"
+
+
+@pytest.mark.anyio
+async def test_query_embedding_batcher_followers_recover_when_leader_is_cancelled(monkeypatch):
+    async def fake_embed(texts, task="retrieval.query", model=None):
+        await anyio.sleep(0)
+        return [[1.0] for _ in texts]
+
+    monkeypatch.setattr(rag_service, "aembed_texts", fake_embed)
+    batcher = rag_service.QueryEmbeddingBatcher("retrieval.query", max_batch=8, max_wait_ms=1000)
+    follower_result = []
+
+    async def follower():
+        follower_result.append(await batcher.embed("follower"))
+
+    async with anyio.create_task_group() as tg:
+        with anyio.move_on_after(0.05):
+            tg.start_soon(follower)
+            await batcher.embed("leader")
+
+    assert follower_result == [[1.0]], f"Expected the follower to embed on its own; got {follower_result!r}"
+
+
+def test_decode_embeddings_reads_base64_float32_in_index_order():
+    encoded = [base64.b64encode(np.asarray(row, dtype="<f4").tobytes()).decode() for row in ([1.0, 2.0], [3.0, 4.0])]
+    data = [{"index": 1, "embedding": encoded[1]}, {"index": 0, "embedding": encoded[0]}]
+
+    matrix = rag_service._decode_embeddings(data)
+
+    assert matrix.dtype == np.float32, f"Expected a float32 matrix; got {matrix.dtype}"
+    assert matrix.tolist() == [[1.0, 2.0], [3.0, 4.0]], f"Expected rows in input order; got {matrix!r}"
+
+
+@pytest.mark.anyio
+async def test_aretrieve_context_falls_back_to_mmr_when_the_reranker_fails(monkeypatch):
+    async def fake_embed(texts, task="retrieval.query", model=None):
+        return [[0.1]]
+
+    async def no_cache(_key):
+        return None
+
+    async def store(*_args):
+        return None
+
+    async def broken_rerank(_query, _texts):
+        raise RuntimeError("rerank unavailable")
+
+    hits = [("Refunds take 5 days.", 0.92), ("Refunds go to the original card.", 0.35), ("Shipping is free.", 0.3)]
+    monkeypatch.setattr(rag_service, "RAG_HYBRID_ENABLED", False)
+    monkeypatch.setattr(rag_service, "RAG_RERANK_MODE", "jina")
+    monkeypatch.setattr(rag_service, "aembed_texts", fake_embed)
+    monkeypatch.setattr(rag_service, "aredis_get_json", no_cache)
+    monkeypatch.setattr(rag_service, "aredis_set_json", store)
+    monkeypatch.setattr(rag_service, "_ajina_rerank_scores", broken_rerank)
+    monkeypatch.setattr(rag_service, "milvus_search", lambda _ns, _vec, top_k: hits)
+
+    context = await rag_service.aretrieve_context(None, "ns", "agent", "how long do refunds take", top_k=3)
+
+    assert context == "Refunds take 5 days.", f"Expected the sharp top hit alone; got {context!r}"
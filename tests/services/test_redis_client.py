@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 from services import redis_client
 
 
@@ -24,3 +26,81 @@ def test_redis_get_json_returns_none_without_client(monkeypatch):
         "Expected redis_get_json to return None when redis is not configured; "
         f"got {value!r}"
     )
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.gets = 0
+        self.published = []
+
+    def get(self, key):
+        self.gets += 1
+        return self.values.get(key)
+
+    def setex(self, key, _ttl, value):
+        self.values[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setenv("CACHE_REDIS_PREFIX", "helpdeskai")
+    monkeypatch.setattr(redis_client, "get_redis", lambda: client)
+    monkeypatch.setattr(redis_client, "_local_cache", redis_client.LocalCache(2, 60))
+    monkeypatch.setattr(redis_client, "_ensure_invalidation_listener", lambda: None)
+    return client
+
+
+def test_local_family_reads_are_served_from_process(fake_redis):
+    key = redis_client.cache_key("widget", "config", "dep-1")
+    fake_redis.values[key] = '{"theme": "dark"}'
+
+    first = redis_client.redis_get_json(key)
+    first["theme"] = "mutated"
+    second = redis_client.redis_get_json(key)
+
+    assert second == {"theme": "dark"}, f"Expected each read to get its own copy; got {second!r}"
+    assert fake_redis.gets == 1, f"Expected one Redis round trip; got {fake_redis.gets}"
+    stats = redis_client.local_cache_stats()["widget:config"]
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1), f"Unexpected stats {stats!r}"
+
+
+def test_other_families_always_go_to_redis(fake_redis):
+    key = redis_client.cache_key("rag", "context", "ns", "q")
+    fake_redis.values[key] = '"ctx"'
+
+    redis_client.redis_get_json(key)
+    redis_client.redis_get_json(key)
+
+    assert fake_redis.gets == 2, f"Expected uncached families to bypass the local tier; got {fake_redis.gets} reads"
+
+
+def test_redis_delete_drops_local_copy_and_broadcasts(fake_redis):
+    key = redis_client.cache_key("chat", "runtime", 7, "agent-1")
+    redis_client.redis_set_json(key, {"id": "agent-1"}, 60)
+
+    redis_client.redis_delete(key)
+
+    assert redis_client.redis_get_json(key) is None, "Expected the local copy to be dropped with the Redis key"
+    assert fake_redis.published and key.encode() in fake_redis.published[0][1], (
+        f"Expected the deleted key to be published to other replicas; got {fake_redis.published!r}"
+    )
+
+
+def test_local_cache_counts_evictions_per_family():
+    cache = redis_client.LocalCache(max_entries=1, ttl_seconds=60)
+
+    cache.set("a", "widget:config", "1")
+    cache.set("b", "chat:runtime", "22")
+
+    stats = cache.stats()
+    assert stats["widget:config"]["evictions"] == 1, f"Expected the oldest entry to be evicted; got {stats!r}"
+    assert stats["chat:runtime"]["bytes"] == 2, f"Expected byte accounting for the live entry; got {stats!r}"
@@ -0,0 +1,42 @@
+import pytest
+
+from services import rag_service, reranker
+
+
+def test_mmr_rerank_prefers_new_information_over_near_copies():
+    results = [
+        ("reset your password from the login page", 0.90),
+        ("reset your password from the login page today", 0.89),
+        ("contact support by email for billing questions", 0.80),
+        ("unrelated trivia", 0.10),
+    ]
+
+    ranked = reranker.mmr_rerank(results, top_k=2, diversity_lambda=0.5)
+
+    assert [text for text, _ in ranked] == [results[0][0], results[2][0]], f"Expected the near-copy to be skipped; got {ranked!r}"
+
+
+def test_adaptive_cutoff_keeps_fewer_chunks_after_a_sharp_top_hit():
+    sharp = [("a", 0.95), ("b", 0.40), ("c", 0.38), ("d", 0.35)]
+    flat = [("a", 0.80), ("b", 0.78), ("c", 0.77), ("d", 0.30)]
+
+    assert [text for text, _ in reranker.adaptive_cutoff(sharp, max_k=3)] == ["a"]
+    assert [text for text, _ in reranker.adaptive_cutoff(flat, max_k=3)] == ["a", "b", "c"]
+
+
+def test_pack_by_density_swaps_a_long_weak_chunk_for_short_relevant_ones():
+    results = [("top " * 10, 0.9), ("long " * 60, 0.6), ("short one", 0.58), ("short two", 0.57)]
+
+    context = reranker.pack_by_density(results, max_chars=100)
+
+    assert context.split("\n\n") == ["top " * 10, "short one", "short two"], f"Expected density packing; got {context!r}"
+
+
+@pytest.mark.anyio
+async def test_mmr_mode_keeps_full_depth_for_near_flat_scores(monkeypatch):
+    monkeypatch.setattr(rag_service, "RAG_RERANK_MODE", "mmr")
+    results = [("refunds take five days", 0.80), ("shipping is free over $50", 0.79), ("returns need a receipt", 0.78)]
+
+    ranked = await rag_service._arerank("policy", results, top_k=3)
+
+    assert len(ranked) == 3, f"Expected near-tied candidates to all be kept; got {ranked!r}"
@@ -0,0 +1,70 @@
+import pytest
+
+from services import semantic_cache
+
+
+@pytest.fixture(autouse=True)
+def _fresh_caches(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "_caches", semantic_cache.OrderedDict())
+    monkeypatch.setattr(semantic_cache, "_versions", {})
+    monkeypatch.setattr(semantic_cache, "RAG_SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(semantic_cache, "RAG_SEMANTIC_CACHE_THRESHOLD", 0.95)
+
+
+def test_semantic_lookup_returns_context_for_similar_queries_only():
+    semantic_cache.semantic_store("ns", 1, 4, [1.0, 0.0, 0.0], "refund policy")
+
+    similar = semantic_cache.semantic_lookup("ns", 1, 4, [0.98, 0.1, 0.0])
+    different = semantic_cache.semantic_lookup("ns", 1, 4, [0.2, 1.0, 0.0])
+    other_top_k = semantic_cache.semantic_lookup("ns", 1, 8, [1.0, 0.0, 0.0])
+
+    assert similar == "refund policy", f"Expected a hit for a near-identical query; got {similar!r}"
+    assert different is None, f"Expected a miss for a dissimilar query; got {different!r}"
+    assert other_top_k is None, f"Expected top_k to be part of the match; got {other_top_k!r}"
+
+
+def test_semantic_cache_drops_entries_from_older_namespace_versions():
+    semantic_cache.semantic_store("ns", 1, 4, [1.0, 0.0], "old context")
+
+    assert semantic_cache.semantic_lookup("ns", 2, 4, [1.0, 0.0]) is None
+
+    # A slow request that read the old version must not evict newer entries.
+    semantic_cache.semantic_store("ns", 2, 4, [0.0, 1.0], "new context")
+    semantic_cache.semantic_store("ns", 1, 4, [1.0, 0.0], "stale context")
+    hit = semantic_cache.semantic_lookup("ns", 2, 4, [0.0, 1.0])
+    assert hit == "new context", f"Expected the newer version to be kept; got {hit!r}"
+
+
+def test_semantic_cache_expires_and_evicts_least_recently_used(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(semantic_cache.time, "monotonic", lambda: clock[0])
+    cache = semantic_cache.SemanticQueryCache(dim=2, version=0, max_entries=2)
+
+    cache.store(semantic_cache._normalize([1.0, 0.0]), 4, "a", ttl_seconds=60)
+    cache.store(semantic_cache._normalize([0.0, 1.0]), 4, "b", ttl_seconds=60)
+    clock[0] += 1
+    assert cache.lookup(semantic_cache._normalize([1.0, 0.0]), 4, 0.95) == "a"
+    cache.store(semantic_cache._normalize([-1.0, 0.0]), 4, "c", ttl_seconds=60)
+
+    evicted = cache.lookup(semantic_cache._normalize([0.0, 1.0]), 4, 0.95)
+    assert evicted is None, f"Expected the least recently used entry to be evicted; got {evicted!r}"
+    clock[0] += 120
+    expired = cache.lookup(semantic_cache._normalize([1.0, 0.0]), 4, 0.95)
+    assert expired is None, f"Expected entries to expire after the TTL; got {expired!r}"
+
+
+@pytest.mark.anyio
+async def test_abump_namespace_version_invalidates_cached_contexts_without_redis(monkeypatch):
+    async def no_redis(_key):
+        return None
+
+    monkeypatch.setattr(semantic_cache, "aredis_get_json", no_redis)
+    monkeypatch.setattr(semantic_cache, "aredis_incr", no_redis)
+    version = await semantic_cache.aget_namespace_version("ns")
+    semantic_cache.semantic_store("ns", version, 4, [1.0, 0.0], "context")
+
+    bumped = await semantic_cache.abump_namespace_version("ns")
+
+    assert bumped == version + 1, f"Expected the local version to advance; got {bumped!r}"
+    assert await semantic_cache.aget_namespace_version("ns") == bumped
+    assert semantic_cache.semantic_lookup("ns", bumped, 4, [1.0, 0.0]) is None
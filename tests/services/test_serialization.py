@@ -0,0 +1,45 @@
+import json
+import uuid
+
+from services import serialization, sse
+
+
+def test_small_values_are_stored_as_plain_json():
+    value = {"theme": "dark", 1: [1, 2]}
+
+    encoded = serialization.encode_cache_value(value)
+
+    assert json.loads(encoded) == {"theme": "dark", "1": [1, 2]}, (
+        f"Expected small values to stay readable JSON with string keys; got {encoded!r}"
+    )
+
+
+def test_large_values_are_compressed_and_round_trip(monkeypatch):
+    monkeypatch.setattr(serialization, "CACHE_COMPRESS_MIN_BYTES", 64)
+    context = "Refunds are processed within five business days. " * 100
+
+    encoded = serialization.encode_cache_value(context)
+    decoded = serialization.decode_cache_value(encoded)
+
+    assert encoded.startswith("z:"), f"Expected a compressed entry; got {encoded[:20]!r}"
+    assert len(encoded) < len(context) // 4, f"Expected compression to pay off; got {len(encoded)} chars"
+    assert decoded == context, "Expected the compressed entry to decode to the original value"
+
+
+def test_unknown_types_fall_back_to_str():
+    value = {"id": uuid.UUID(int=1), "amount": object.__new__(type("Money", (), {"__str__": lambda self: "9.99"}))}
+
+    decoded = serialization.decode_cache_value(serialization.encode_cache_value(value))
+
+    assert decoded == {"id": str(uuid.UUID(int=1)), "amount": "9.99"}, f"Unexpected decoded value {decoded!r}"
+
+
+def test_sse_frames_match_the_event_stream_format():
+    token = sse.sse_token('He said "hi"\n')
+    meta = sse.sse_event("meta", {"session_id": "abc"})
+
+    assert token.startswith(b"event: token\ndata: ") and token.endswith(b"\n\n"), f"Unexpected frame {token!r}"
+    assert json.loads(token.split(b"data: ", 1)[1]) == {"content": 'He said "hi"\n'}, (
+        f"Expected token content to be JSON-escaped inside the frame; got {token!r}"
+    )
+    assert meta == b'event: meta\ndata: {"session_id":"abc"}\n\n', f"Unexpected frame {meta!r}"
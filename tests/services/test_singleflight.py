@@ -0,0 +1,155 @@
+import threading
+import time
+
+import anyio
+import pytest
+
+from services import singleflight
+
+
+@pytest.mark.anyio
+async def test_concurrent_callers_share_one_computation():
+    flight = singleflight.SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await anyio.sleep(0.01)
+        return "value"
+
+    results = []
+
+    async def caller():
+        results.append(await flight.do("key", compute))
+
+    async with anyio.create_task_group() as group:
+        for _ in range(5):
+            group.start_soon(caller)
+
+    assert len(calls) == 1, f"Expected one computation for concurrent callers; got {len(calls)}"
+    assert results == ["value"] * 5, f"Expected every caller to get the shared result; got {results!r}"
+
+
+@pytest.mark.anyio
+async def test_losing_the_redis_lock_waits_for_the_winner(monkeypatch):
+    flight = singleflight.SingleFlight()
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_POLL_MS", 1)
+
+    async def lock_taken(_key, _token, _ttl):
+        return False
+
+    checks = []
+
+    async def recheck():
+        checks.append(1)
+        return "from-other-replica" if len(checks) >= 2 else None
+
+    async def compute():
+        raise AssertionError("Expected the result of the replica holding the lock to be used")
+
+    monkeypatch.setattr(singleflight, "aredis_acquire_lock", lock_taken)
+
+    value = await flight.do("key", compute, recheck=recheck, distributed=True)
+
+    assert value == "from-other-replica", f"Unexpected value {value!r}"
+
+
+@pytest.mark.anyio
+async def test_lock_loser_computes_itself_after_lock_wait(monkeypatch):
+    flight = singleflight.SingleFlight()
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_POLL_MS", 1)
+
+    async def lock_taken(_key, _token, _ttl):
+        return False
+
+    async def recheck():
+        return None
+
+    async def compute():
+        return "computed"
+
+    monkeypatch.setattr(singleflight, "aredis_acquire_lock", lock_taken)
+
+    with anyio.fail_after(0.5):
+        value = await flight.do("key", compute, recheck=recheck, distributed=True, lock_wait=0.05)
+
+    assert value == "computed", f"Expected the loser to compute within its budget; got {value!r}"
+
+
+@pytest.mark.anyio
+async def test_acached_serves_stale_value_while_refreshing(monkeypatch):
+    store = {"key": {"value": "old", "fresh_until": time.time() - 1}}
+    refreshed = anyio.Event()
+
+    async def fake_get_json(key):
+        return store.get(key)
+
+    async def fake_set_json(key, value, _ttl):
+        store[key] = value
+        refreshed.set()
+
+    async def compute():
+        return "new"
+
+    monkeypatch.setattr(singleflight, "aredis_get_json", fake_get_json)
+    monkeypatch.setattr(singleflight, "aredis_set_json", fake_set_json)
+
+    value = await singleflight.acached("key", 60, 60, compute)
+    with anyio.fail_after(1):
+        await refreshed.wait()
+
+    assert value == "old", f"Expected the stale value to be served immediately; got {value!r}"
+    assert store["key"]["value"] == "new", f"Expected the background refresh to store the new value; got {store!r}"
+
+
+@pytest.mark.anyio
+async def test_acached_drops_stale_value_when_refresh_finds_nothing(monkeypatch):
+    store = {"key": {"value": "old", "fresh_until": time.time() - 1}}
+    deleted = anyio.Event()
+
+    async def fake_get_json(key):
+        return store.get(key)
+
+    async def fake_delete(*keys):
+        for key in keys:
+            store.pop(key, None)
+        deleted.set()
+
+    async def compute():
+        return None
+
+    monkeypatch.setattr(singleflight, "aredis_get_json", fake_get_json)
+    monkeypatch.setattr(singleflight, "aredis_delete", fake_delete)
+
+    await singleflight.acached("key", 60, 60, compute)
+    with anyio.fail_after(1):
+        await deleted.wait()
+
+    assert "key" not in store, f"Expected the stale entry of a removed source to be deleted; got {store!r}"
+
+
+def test_sync_single_flight_runs_once_across_threads():
+    flight = singleflight.SyncSingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(1)
+        return 42
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", compute)))
+    leader.start()
+    started.wait(1)
+    follower = threading.Thread(target=lambda: results.append(flight.do("key", compute)))
+    follower.start()
+    time.sleep(0.02)
+    release.set()
+    leader.join(1)
+    follower.join(1)
+
+    assert calls == [1], f"Expected one computation across threads; got {len(calls)}"
+    assert results == [42, 42], f"Expected both threads to get the result; got {results!r}"
@@ -0,0 +1,76 @@
+import anyio
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from services import sse
+
+
+async def _deltas(values, gap=0.0, error=None):
+    for value in values:
+        if gap:
+            await anyio.sleep(gap)
+        yield value
+    if error is not None:
+        raise error
+
+
+async def _collect(iterator):
+    return [chunk async for chunk in iterator]
+
+
+@pytest.mark.anyio
+async def test_coalesce_flushes_first_token_then_merges_by_size():
+    chunks = await _collect(sse.coalesce_tokens(_deltas(["Hi", "a", "b", "c", "d", "e"]), max_bytes=3, max_wait_ms=1000))
+
+    assert chunks[0] == "Hi", f"Expected the first delta on its own; got {chunks!r}"
+    assert chunks[1:] == ["abc", "de"], f"Expected deltas merged up to the byte limit; got {chunks!r}"
+
+
+@pytest.mark.anyio
+async def test_coalesce_flushes_buffer_when_the_provider_stalls():
+    async def stalled():
+        yield "first"
+        yield "a"
+        yield "b"
+        await anyio.sleep(0.2)
+        yield "c"
+
+    chunks = []
+    async for chunk in sse.coalesce_tokens(stalled(), max_bytes=1000, max_wait_ms=20):
+        chunks.append((chunk, anyio.current_time()))
+
+    assert [chunk for chunk, _ in chunks] == ["first", "ab", "c"], f"Unexpected chunks {chunks!r}"
+    assert chunks[2][1] - chunks[1][1] > 0.1, "Expected 'ab' to be flushed on the wait limit, not with 'c'"
+
+
+@pytest.mark.anyio
+async def test_coalesce_delivers_buffered_text_before_raising():
+    chunks = []
+    with pytest.raises(RuntimeError):
+        async for chunk in sse.coalesce_tokens(_deltas(["a", "b", "c"], error=RuntimeError("boom")), max_bytes=100):
+            chunks.append(chunk)
+
+    assert chunks == ["a", "bc"], f"Expected buffered deltas before the error; got {chunks!r}"
+
+
+def test_gzip_middleware_passes_event_stream_frames_through():
+    async def stream(_request):
+        async def frames():
+            yield sse.sse_event("meta", {"x": 1})
+            yield sse.sse_token("hello " * 400)
+
+        return StreamingResponse(frames(), media_type="text/event-stream", headers=sse.SSE_HEADERS)
+
+    app = Starlette(routes=[Route("/stream", stream)])
+    app.add_middleware(GZipMiddleware, minimum_size=10)
+
+    response = TestClient(app).get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers, (
+        f"Expected the event stream not to be gzipped; got {response.headers!r}"
+    )
+    assert response.text.startswith("event: meta\n"), f"Unexpected body {response.text[:40]!r}"
@@ -0,0 +1,26 @@
+import numpy as np
+
+from services import vector_quantization
+
+
+def test_int8_quantization_round_trips_within_one_step_per_vector():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(20, 32)).astype(np.float32)
+
+    stored, scales = vector_quantization.quantize(vectors, "int8")
+    restored = vector_quantization.dequantize(stored, scales)
+
+    assert stored.dtype == np.int8, f"Expected int8 storage; got {stored.dtype}"
+    assert np.all(np.abs(restored - vectors) <= scales[:, None] / 2 + 1e-6), "Expected rounding error under half a step"
+
+
+def test_quantized_recall_stays_close_to_float32():
+    rng = np.random.default_rng(1)
+    base = rng.normal(size=(2000, 128)).astype(np.float32)
+    queries = rng.normal(size=(50, 128)).astype(np.float32)
+
+    recall16 = vector_quantization.recall_at_k(base, queries, "float16", k=10)
+    recall8 = vector_quantization.recall_at_k(base, queries, "int8", k=10)
+
+    assert recall16 >= 0.99, f"Expected float16 to match float32 rankings; got {recall16}"
+    assert recall8 >= 0.9, f"Expected int8 recall@10 of at least 0.9; got {recall8}"
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from services import milvus_migrate, vector_store
+
+
+class FakeIterator:
+    def __init__(self, pages):
+        self.pages = list(pages)
+
+    def next(self):
+        return self.pages.pop(0) if self.pages else []
+
+    def close(self):
+        pass
+
+
+class FakeMilvusClient:
+    def __init__(self):
+        self.partitions: set[tuple[str, str]] = set()
+        self.rows: dict[str, list[dict]] = {}
+        self.calls: list[tuple[str, dict]] = []
+
+    def has_collection(self, name, timeout=None):
+        return True
+
+    def get_collection_stats(self, name, timeout=None):
+        return {"row_count": len(self.rows.get(name, []))}
+
+    def has_partition(self, collection, partition, timeout=None):
+        return (collection, partition) in self.partitions
+
+    def create_partition(self, collection, partition, timeout=None):
+        self.partitions.add((collection, partition))
+
+    def release_partitions(self, collection, partitions, timeout=None):
+        self.calls.append(("release", {"partitions": partitions}))
+
+    def drop_partition(self, collection, partition, timeout=None):
+        self.partitions.discard((collection, partition))
+        self.calls.append(("drop_partition", {"partition": partition}))
+
+    def upsert(self, collection_name, data, timeout=None, partition_name=""):
+        self.rows.setdefault(collection_name, []).extend(data)
+        self.calls.append(("upsert", {"collection": collection_name, "partition_name": partition_name}))
+
+    def search(self, **kwargs):
+        self.calls.append(("search", kwargs))
+        return [[{"entity": {"text": "hit"}, "distance": 0.5}]]
+
+    def delete(self, **kwargs):
+        self.calls.append(("delete", kwargs))
+
+    def query_iterator(self, collection_name, **kwargs):
+        self.calls.append(("query_iterator", kwargs))
+        return FakeIterator([self.rows.get(collection_name, [])])
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeMilvusClient()
+    monkeypatch.setattr(vector_store, "get_milvus_client", lambda: fake)
+    monkeypatch.setattr(milvus_migrate, "get_milvus_client", lambda: fake)
+    return fake
+
+
+def test_partition_layout_scopes_search_to_namespace_partition(client):
+    backend = vector_store.MilvusVectorBackend("partition")
+    partition = vector_store.partition_name_for("tenant/1")
+
+    assert backend.search("tenant/1", [0.1], limit=2) == [], "Expected no search before the partition exists"
+
+    backend.upsert_texts("tenant/1", "kb-1", "agent", ["text"], [[0.1]], ids=["a"])
+    hits = backend.search("tenant/1", [0.1], limit=2)
+
+    search_kwargs = [kwargs for name, kwargs in client.calls if name == "search"][-1]
+    assert hits == [("hit", 0.5)], f"Expected search hits; got {hits!r}"
+    assert search_kwargs["partition_names"] == [partition], f"Expected a partition-scoped search; got {search_kwargs!r}"
+    assert search_kwargs["filter"] == "", f"Expected no namespace filter inside the partition; got {search_kwargs!r}"
+
+
+def test_partition_layout_drops_partition_on_namespace_delete(client):
+    backend = vector_store.MilvusVectorBackend("partition")
+    backend.upsert_texts("tenant", "kb-1", "agent", ["text"], [[0.1]], ids=["a"])
+
+    backend.delete_namespace("tenant")
+
+    assert ("drop_partition", {"partition": vector_store.partition_name_for("tenant")}) in client.calls, (
+        f"Expected the namespace partition to be dropped; got {client.calls!r}"
+    )
+    assert not any(name == "delete" for name, _ in client.calls), "Expected no filtered delete"
+
+
+def test_filter_layout_keeps_namespace_filter(client):
+    backend = vector_store.MilvusVectorBackend("filter")
+
+    backend.search("tenant", [0.1], limit=2)
+
+    search_kwargs = [kwargs for name, kwargs in client.calls if name == "search"][-1]
+    assert search_kwargs["filter"] == 'namespace == "tenant"', f"Expected namespace filter; got {search_kwargs!r}"
+    assert "partition_names" not in search_kwargs
+
+
+def test_migrate_layout_copies_rows_into_namespace_partitions(client):
+    client.rows[vector_store.milvus_collection_name("filter")] = [
+        {"id": "a", "namespace": "one", "kb_id": "kb", "embedding": [0.1], "text": "x"},
+        {"id": "b", "namespace": "two", "kb_id": "kb", "embedding": [0.2], "text": "y"},
+    ]
+
+    copied = milvus_migrate.migrate_layout("filter", "partition")
+
+    target = vector_store.milvus_collection_name("partition")
+    partitions = sorted(kwargs["partition_name"] for name, kwargs in client.calls if name == "upsert")
+    assert copied == 2, f"Expected both rows to be copied; got {copied}"
+    assert [row["id"] for row in client.rows[target]] == ["a", "b"], "Expected ids to be preserved"
+    assert partitions == sorted(vector_store.partition_name_for(ns) for ns in ("one", "two")), (
+        f"Expected one partition per namespace; got {partitions!r}"
+    )
+
+
+def test_migrate_layout_requantizes_between_dtypes(client):
+    client.rows[vector_store.milvus_collection_name("filter", "float32")] = [
+        {"id": "a", "namespace": "one", "kb_id": "kb", "embedding": [0.5, -1.0], "text": "x"},
+    ]
+
+    copied = milvus_migrate.migrate_layout("filter", "filter", source_dtype="float32", target_dtype="int8")
+
+    row = client.rows[vector_store.milvus_collection_name("filter", "int8")][0]
+    assert copied == 1, f"Expected the row to be copied; got {copied}"
+    assert row["embedding"].dtype == np.int8, f"Expected int8 storage; got {row['embedding'].dtype}"
+    assert row["embedding"].tolist() == [64, -127], f"Expected the direction to be kept; got {row['embedding']!r}"
+
+
+def test_check_storage_dtype_refuses_empty_collection_when_float32_has_rows(client):
+    client.rows[vector_store.milvus_collection_name("filter", "float32")] = [{"id": "a"}]
+
+    with pytest.raises(RuntimeError, match="milvus_migrate"):
+        vector_store.check_storage_dtype("filter", "int8")
+
+    client.rows[vector_store.milvus_collection_name("filter", "int8")] = [{"id": "a"}]
+    vector_store.check_storage_dtype("filter", "int8")
+
+
+def test_check_storage_dtype_does_not_fail_when_milvus_is_unreachable(monkeypatch):
+    def unreachable():
+        raise ConnectionError("milvus down")
+
+    monkeypatch.setattr(vector_store, "get_milvus_client", unreachable)
+
+    assert vector_store.check_storage_dtype("filter", "int8") is False, "Expected the check to be retried later"